@@ -6,6 +6,31 @@ from ..tickets.database import TicketDatabase
 from ..tickets.views import PersistentTicketView
 import json
 import asyncio
+from async_timeout import timeout
+
+def require_ticket_admin():
+    """Check dekorátor: administrátor serveru nebo role z admin_role_ids.
+
+    Výsledek i načtená settings se memoizují na ctx, takže tělo příkazu
+    (a případné vnořené checky) už databázi znovu nevolá."""
+    async def predicate(ctx):
+        cached = getattr(ctx, '_ticket_admin', None)
+        if cached is not None:
+            return cached
+
+        allowed = False
+        if ctx.author.guild_permissions.administrator:
+            allowed = True
+        elif ctx.cog is not None and ctx.cog.ticket_db:
+            settings = await ctx.cog.ticket_db.get_settings(ctx.guild.id)
+            ctx._ticket_settings = settings
+            admin_role_ids = settings.get("_admin_role_ids_set") \
+                or frozenset(settings.get("admin_role_ids", []))
+            allowed = any(role.id in admin_role_ids for role in ctx.author.roles)
+
+        ctx._ticket_admin = allowed
+        return allowed
+    return commands.check(predicate)
 
 class TicketCommands(commands.Cog):
     def __init__(self, bot):
@@ -19,26 +44,19 @@ class TicketCommands(commands.Cog):
             self.ticket_manager = self.bot.ticket_manager
             self.ticket_db = self.ticket_manager.ticket_db
     
-    def has_ticket_admin_role(self, ctx):
-        """Vylepšená permission check"""
-        if ctx.author.guild_permissions.administrator:
-            return True
-        
-        # Async check se musí dělat v command
-        return False
-    
-    async def async_has_admin_role(self, ctx) -> bool:
-        """Async permission check"""
-        if ctx.author.guild_permissions.administrator:
-            return True
-        
-        if not self.ticket_db:
-            return False
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
-        admin_role_ids = settings.get("admin_role_ids", [])
-        
-        return any(role.id in admin_role_ids for role in ctx.author.roles)
+    async def cog_command_error(self, ctx, error):
+        if isinstance(error, commands.CheckFailure):
+            await ctx.send("❌ Nemáš oprávnění.")
+        else:
+            raise error
+
+    async def _settings(self, ctx):
+        """Settings pro guildu - využije to, co už načetl permission check"""
+        settings = getattr(ctx, '_ticket_settings', None)
+        if settings is None:
+            settings = await self.ticket_db.get_settings(ctx.guild.id)
+            ctx._ticket_settings = settings
+        return settings
     
     @commands.group(invoke_without_command=True)
     async def ticket(self, ctx):
@@ -46,10 +64,10 @@ class TicketCommands(commands.Cog):
         await ctx.send_help(ctx.command)
     
     @ticket.command(name="setup")
+    @require_ticket_admin()
     async def ticket_setup(self, ctx):
         """Interaktivní setup ticket systému"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
+        settings = await self._settings(ctx)
         
         embed = discord.Embed(
             title="🎫 Ticket systém - Setup",
@@ -65,12 +83,14 @@ class TicketCommands(commands.Cog):
             return m.author == ctx.author and m.channel == ctx.channel
         
         try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60.0)
-            
+            # async_timeout neobaluje future do další Task jako asyncio.wait_for
+            async with timeout(60):
+                msg = await self.bot.wait_for('message', check=check)
+
+
             # Parse role mention
             if msg.role_mentions:
                 mod_role = msg.role_mentions[0]
-                settings = await self.ticket_db.get_settings(ctx.guild.id)
                 settings["mod_role_id"] = mod_role.id
                 await self.ticket_db.save_settings(ctx.guild.id, settings)
                 await ctx.send(f"✅ Moderátorská role nastavena: {mod_role.mention}")
@@ -81,12 +101,10 @@ class TicketCommands(commands.Cog):
             await ctx.send("⏰ Setup zrušen (timeout).")
     
     @ticket.command(name="admin_role")
+    @commands.has_permissions(administrator=True)
     async def admin_role(self, ctx, role: discord.Role):
         """Přidá admin roli pro ticket management"""
-        if not ctx.author.guild_permissions.administrator:
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
+        settings = await self._settings(ctx)
         admin_roles = settings.get("admin_role_ids", [])
         
         if role.id not in admin_roles:
@@ -98,12 +116,10 @@ class TicketCommands(commands.Cog):
             await ctx.send(f"⚠️ Role `{role.name}` už má admin oprávnění.")
     
     @ticket.command(name="remove_admin_role")
+    @commands.has_permissions(administrator=True)
     async def remove_admin_role(self, ctx, role: discord.Role):
         """Odstraní admin roli"""
-        if not ctx.author.guild_permissions.administrator:
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
+        settings = await self._settings(ctx)
         admin_roles = settings.get("admin_role_ids", [])
         
         if role.id in admin_roles:
@@ -115,88 +131,61 @@ class TicketCommands(commands.Cog):
             await ctx.send(f"⚠️ Role `{role.name}` nemá admin oprávnění.")
 
     @ticket.command(name="mod_role")
+    @require_ticket_admin()
     async def mod_role(self, ctx, role: discord.Role):
         """Nastaví moderátorskou roli"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
+        settings = await self._settings(ctx)
         settings["mod_role_id"] = role.id
         await self.ticket_db.save_settings(ctx.guild.id, settings)
         await ctx.send(f"✅ Mod role nastavena na: {role.name}")
     
     @ticket.command(name="transcript")
+    @require_ticket_admin()
     async def transcript_channel(self, ctx, channel: discord.TextChannel):
         """Nastaví kanál pro transcripty"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
+        settings = await self._settings(ctx)
         settings["transcript_channel_id"] = channel.id
         await self.ticket_db.save_settings(ctx.guild.id, settings)
         await ctx.send(f"✅ Transcript kanál nastaven na: {channel.mention}")
     
     @ticket.command(name="add_button")
+    @require_ticket_admin()
     async def add_button(self, ctx, label: str, *, welcome_message: str):
         """Přidá custom tlačítko"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
-        buttons = settings.get("custom_buttons", [])
-        
-        if len(buttons) >= 25:
+        settings = await self._settings(ctx)
+        if len(settings.get("custom_buttons", [])) >= 25:
             return await ctx.send("❌ Maximum 25 tlačítek.")
-        
-        # Zkontroluj duplicitní názvy
-        for existing_label, _ in buttons:
-            if existing_label.lower() == label.lower():
-                return await ctx.send(f"❌ Tlačítko s názvem **{label}** už existuje!")
-        
-        buttons.append([label[:80], welcome_message])
-        settings["custom_buttons"] = buttons
-        await self.ticket_db.save_settings(ctx.guild.id, settings)
-        
+
+        # Jeden INSERT do ticket_buttons - duplicitu ohlídá ON CONFLICT
+        added = await self.ticket_db.add_button(ctx.guild.id, label[:80], welcome_message)
+        if not added:
+            return await ctx.send(f"❌ Tlačítko s názvem **{label}** už existuje!")
+
         await ctx.send(f"✅ Přidán custom button: **{label}** s uvítací zprávou.")
     
     @ticket.command(name="remove_button")
+    @require_ticket_admin()
     async def remove_button(self, ctx, *, label: str):
         """Odstraní tlačítko podle názvu"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
-        buttons = settings.get("custom_buttons", [])
-        
-        original_count = len(buttons)
-        buttons = [btn for btn in buttons if btn[0] != label]
-        
-        if len(buttons) < original_count:
-            settings["custom_buttons"] = buttons
-            await self.ticket_db.save_settings(ctx.guild.id, settings)
+        # Jeden DELETE - RETURNING rovnou říká, jestli tlačítko existovalo
+        removed = await self.ticket_db.remove_button(ctx.guild.id, label)
+        if removed:
             await ctx.send(f"✅ Tlačítko **{label}** odstraněno.")
         else:
             await ctx.send(f"❌ Tlačítko **{label}** nenalezeno.")
     
     @ticket.command(name="clear_buttons")
+    @require_ticket_admin()
     async def clear_buttons(self, ctx):
         """Smaže všechna tlačítka"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
-        settings["custom_buttons"] = []
-        await self.ticket_db.save_settings(ctx.guild.id, settings)
+        await self.ticket_db.clear_buttons(ctx.guild.id)
         await ctx.send("✅ Všechna tlačítka byla odstraněna.")
     
     @ticket.command(name="panel")
+    @require_ticket_admin()
     async def create_panel(self, ctx, *, message: Optional[str] = None):
         """Vytvoří ticket panel"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
-        
+        settings = await self._settings(ctx)
         if not settings.get("mod_role_id"):
             return await ctx.send("❌ Nastav nejprve mod roli (`!ticket mod_role`).")
         
@@ -213,75 +202,70 @@ class TicketCommands(commands.Cog):
             color=discord.Color(settings.get("embed_color", 5793266))
         )
         
-        view = PersistentTicketView(ctx.guild.id, settings)
+        # build_panel_view rovnou označí view jako registrované, aby ho
+        # global handler neobsluhoval podruhé
+        view = self.ticket_manager.build_panel_view(ctx.guild.id, settings)
         await ctx.send(embed=embed, view=view)
     
     @ticket.command(name="settings")
+    @require_ticket_admin()
     async def show_settings(self, ctx):
         """Zobrazí aktuální nastavení"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
-        
+        settings = await self._settings(ctx)
+        # Jeden průchod settings - lokální proměnné místo opakovaných .get()
+        guild = ctx.guild
+        mod_role = guild.get_role(settings.get("mod_role_id"))
+        admin_role_ids = settings.get("admin_role_ids", [])
+        transcript_channel = guild.get_channel(settings.get("transcript_channel_id"))
+        buttons_count = len(settings.get("custom_buttons", []))
+        use_menu = settings.get("use_menu")
+
+        admin_mentions = ", ".join(
+            r.mention for r in (guild.get_role(rid) for rid in admin_role_ids) if r
+        )
+
         embed = discord.Embed(
             title="⚙️ Ticket nastavení",
             color=discord.Color.blue()
         )
-        
-        mod_role = ctx.guild.get_role(settings.get("mod_role_id"))
         embed.add_field(
             name="Moderátorská role",
             value=mod_role.mention if mod_role else "❌ Nenastaveno",
             inline=True
         )
-        
-        admin_roles = []
-        for role_id in settings.get("admin_role_ids", []):
-            role = ctx.guild.get_role(role_id)
-            if role:
-                admin_roles.append(role.mention)
-        
         embed.add_field(
             name="Admin role",
-            value=", ".join(admin_roles) if admin_roles else "❌ Žádné",
+            value=admin_mentions or "❌ Žádné",
             inline=True
         )
-        
-        transcript_channel = ctx.guild.get_channel(settings.get("transcript_channel_id"))
         embed.add_field(
             name="Transcript kanál",
             value=transcript_channel.mention if transcript_channel else "❌ Nenastaveno",
             inline=True
         )
-        
-        buttons_count = len(settings.get("custom_buttons", []))
         embed.add_field(
             name="Počet tlačítek",
             value=str(buttons_count),
             inline=True
         )
-        
-        ui_type = "Dropdown menu" if settings.get("use_menu") else "Tlačítka"
         embed.add_field(
             name="Typ UI",
-            value=ui_type,
+            value="Dropdown menu" if use_menu else "Tlačítka",
             inline=True
         )
-        
+
         await ctx.send(embed=embed)
     
     @ticket.command(name="ui")
+    @require_ticket_admin()
     async def panel_ui(self, ctx, mode: str):
         """Přepne mezi tlačítky a dropdown menu"""
-        if not await self.async_has_admin_role(ctx):
-            return await ctx.send("❌ Nemáš oprávnění.")
-        
+        # Levná validace argumentu dřív, než se sahá do databáze
         mode = mode.lower()
         if mode not in ["menu", "button", "dropdown"]:
             return await ctx.send("❌ Použij: `menu`, `dropdown` nebo `button`")
-        
-        settings = await self.ticket_db.get_settings(ctx.guild.id)
+
+        settings = await self._settings(ctx)
         settings["use_menu"] = mode in ["menu", "dropdown"]
         await self.ticket_db.save_settings(ctx.guild.id, settings)
         
@@ -294,12 +278,10 @@ class TicketCommands(commands.Cog):
         if not ctx.channel.name.startswith("ticket-"):
             return await ctx.send("❌ Tento příkaz funguje pouze v ticket kanálech.")
         
-        # Najdi typ ticketu z názvu kanálu
-        ticket_type = "general"
-        if "-" in ctx.channel.name:
-            parts = ctx.channel.name.split("-")
-            if len(parts) >= 3:
-                ticket_type = parts[-1]
+        # Najdi typ ticketu z názvu kanálu (ticket-<user>-<typ>) - rpartition
+        # vezme jen suffix bez alokace celého splitnutého listu
+        head, _, tail = ctx.channel.name.rpartition("-")
+        ticket_type = tail if "-" in head else "general"
         
         try:
             await self.ticket_manager.close_ticket(
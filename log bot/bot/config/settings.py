@@ -6,6 +6,18 @@ load_dotenv()
 DATABASE_URL = os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL')
 TOKEN = os.environ['TOKEN']
 
+# Database pool nastavení - přepsatelné přes env pro různé deploye
+DB_POOL_CONFIG = {
+    'min_size': int(os.environ.get('DB_POOL_MIN', 5)),
+    'max_size': int(os.environ.get('DB_POOL_MAX', 25)),
+    'command_timeout': 10,
+    'max_queries': 50000,
+    'max_inactive_connection_lifetime': 300,
+    # Větší LRU prepared statementů per spojení - hot dotazy (voting,
+    # settings) se neparsují znovu po vytlačení z default 100
+    'statement_cache_size': 1024
+}
+
 # Cache nastavení
 CACHE_CONFIG = {
     'audit_cache_size': 1000,
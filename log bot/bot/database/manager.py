@@ -1,28 +1,303 @@
 import asyncpg
+import json
+import os
 from typing import Optional, Dict, Any
 import asyncio
-from ..config.settings import DATABASE_URL
+from ..config.settings import DATABASE_URL, DB_POOL_CONFIG
 import logging
 
 logger = logging.getLogger(__name__)
 
+_SCHEMA_VERSION = 5
+
+# Hot SQL připravované na každém novém spojení poolu. App kód registruje
+# dotazy při importu (name -> SQL); init callback je pak naparsuje, takže
+# první příkaz na čerstvém spojení neplatí parse/plan round-trip a handle
+# uložený na spojení drží server-side plán naživu
+HOT_STATEMENTS: Dict[str, str] = {}
+
+# Tabulky bez vzájemných závislostí - mohou se vytvářet paralelně
+_DDL_TABLES = [
+    '''
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            log_channel BIGINT,
+            welcome_channel BIGINT,
+            goodbye_channel BIGINT,
+            welcome_msg TEXT,
+            goodbye_msg TEXT,
+            invite_tracking BOOLEAN DEFAULT TRUE,
+            log_reactions BOOLEAN DEFAULT FALSE,
+            log_voice BOOLEAN DEFAULT TRUE,
+            log_voice_join BOOLEAN DEFAULT TRUE,
+            log_voice_move BOOLEAN DEFAULT TRUE,
+            log_voice_mute BOOLEAN DEFAULT FALSE,
+            log_threads BOOLEAN DEFAULT TRUE,
+            log_roles BOOLEAN DEFAULT TRUE,
+            log_channels BOOLEAN DEFAULT TRUE,
+            log_emojis BOOLEAN DEFAULT TRUE,
+            log_user_updates BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS invites (
+            guild_id BIGINT,
+            invite_code TEXT,
+            inviter_id BIGINT,
+            uses INTEGER DEFAULT 0,
+            max_uses INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, invite_code)
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS invite_uses (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT,
+            invite_code TEXT,
+            user_id BIGINT,
+            inviter_id BIGINT,
+            used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS rp_candidates (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            election_type TEXT DEFAULT 'presidential',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by BIGINT NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS rp_election_settings (
+            guild_id BIGINT PRIMARY KEY,
+            current_type TEXT DEFAULT 'presidential',
+            voting_ui TEXT DEFAULT 'buttons',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS ticket_settings (
+            guild_id BIGINT PRIMARY KEY,
+            mod_role_id BIGINT,
+            admin_role_ids JSONB DEFAULT '[]',
+            transcript_channel_id BIGINT,
+            custom_buttons JSONB DEFAULT '[]',
+            panel_message TEXT DEFAULT 'Kliknutím na tlačítko níže vytvoříš ticket:',
+            embed_color INTEGER DEFAULT 5793266,
+            use_menu BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS ticket_logs (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            ticket_type TEXT NOT NULL,
+            action TEXT NOT NULL,
+            channel_id BIGINT,
+            moderator_id BIGINT,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS active_tickets (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            ticket_type TEXT NOT NULL,
+            status TEXT DEFAULT 'open',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP,
+            UNIQUE(guild_id, user_id, ticket_type)
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS ticket_buttons (
+            guild_id BIGINT NOT NULL,
+            position SMALLINT NOT NULL DEFAULT 0,
+            label TEXT NOT NULL,
+            welcome_message TEXT,
+            PRIMARY KEY (guild_id, label)
+        )
+    ''',
+]
+
+# DDL závislé na tabulkách z první fáze (FK, indexy)
+_DDL_DEPENDENT = [
+    '''
+        CREATE TABLE IF NOT EXISTS rp_votes (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            candidate_id INTEGER NOT NULL REFERENCES rp_candidates(id),
+            voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(guild_id, user_id)
+        )
+    ''',
+    # Cílené indexy na nejčastější dotazy - partial index drží
+    # write-amplifikaci nízko, protože pokrývá jen otevřené tickety
+    '''
+        CREATE INDEX IF NOT EXISTS idx_active_tickets_guild_user_status
+        ON active_tickets(guild_id, user_id) WHERE status = 'open'
+    ''',
+    '''
+        CREATE INDEX IF NOT EXISTS idx_ticket_logs_guild_created
+        ON ticket_logs(guild_id, created_at DESC)
+    ''',
+]
+
+
+# Jednorázové migrace dat - běží sekvenčně po vytvoření tabulek,
+# idempotentní díky ON CONFLICT
+_DDL_MIGRATIONS = [
+    # custom_buttons z JSONB do normalizované tabulky ticket_buttons
+    '''
+        INSERT INTO ticket_buttons (guild_id, position, label, welcome_message)
+        SELECT ts.guild_id, b.ord - 1, b.elem->>0, b.elem->>1
+        FROM ticket_settings ts
+        CROSS JOIN LATERAL jsonb_array_elements(ts.custom_buttons)
+            WITH ORDINALITY AS b(elem, ord)
+        ON CONFLICT (guild_id, label) DO NOTHING
+    ''',
+    # Denormalizace jména kandidáta a typu voleb do rp_votes - výpisy
+    # hlasů pak nepotřebují JOIN na rp_candidates (zápis je udržuje:
+    # vote CTE při INSERTu, upravit_kandidata při přejmenování)
+    '''
+        ALTER TABLE rp_votes ADD COLUMN IF NOT EXISTS candidate_name TEXT
+    ''',
+    '''
+        ALTER TABLE rp_votes ADD COLUMN IF NOT EXISTS election_type TEXT
+    ''',
+    '''
+        UPDATE rp_votes v
+        SET candidate_name = c.name, election_type = c.election_type
+        FROM rp_candidates c
+        WHERE v.candidate_id = c.id AND v.candidate_name IS NULL
+    ''',
+    # Covering index pro seznam_hlasu - index-only scan bez JOINu a sortu
+    '''
+        CREATE INDEX IF NOT EXISTS idx_rp_votes_list
+        ON rp_votes (guild_id, election_type, candidate_name, voted_at DESC)
+        INCLUDE (id, user_id)
+    ''',
+    # Granulární voice toggly - join/move/mute se gatují nezávisle
+    '''
+        ALTER TABLE guild_settings ADD COLUMN IF NOT EXISTS log_voice_join BOOLEAN DEFAULT TRUE
+    ''',
+    '''
+        ALTER TABLE guild_settings ADD COLUMN IF NOT EXISTS log_voice_move BOOLEAN DEFAULT TRUE
+    ''',
+    '''
+        ALTER TABLE guild_settings ADD COLUMN IF NOT EXISTS log_voice_mute BOOLEAN DEFAULT FALSE
+    ''',
+    # Case-insensitive unikátnost labelů tlačítek - nejdřív dedup
+    # (fyzicky první řádek vyhrává), pak funkční unikátní index
+    '''
+        DELETE FROM ticket_buttons a
+        USING ticket_buttons b
+        WHERE a.guild_id = b.guild_id
+          AND lower(a.label) = lower(b.label)
+          AND a.ctid > b.ctid
+    ''',
+    '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ticket_buttons_label_lc
+        ON ticket_buttons (guild_id, lower(label))
+    ''',
+]
+
+
 class DatabaseManager:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
-    
+
+    @staticmethod
+    async def _init_connection(conn):
+        """Registruje JSONB codec, aby asyncpg vracel rovnou Python objekty
+        (bez ručního json.loads/json.dumps na každé čtení/zápis)"""
+        await conn.set_type_codec(
+            'jsonb',
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema='pg_catalog',
+            format='text'
+        )
+
+        # Session warm-up: application_name kvůli pg_stat_activity, jit=off
+        # protože krátké OLTP dotazy bota by JIT kompilace jen zdržovala
+        await conn.execute("SET application_name = 'limovec'; SET jit = off")
+
+        # Warm-up registrovaných hot dotazů (viz HOT_STATEMENTS). Pool se
+        # staví před _ensure_schema, takže na čerstvé databázi (nebo před
+        # doběhnutím migrací) objekty z dotazů ještě nemusí existovat -
+        # prepare by shodilo celé create_pool. Selhání se jen zaloguje;
+        # _prepared() pak vrací None a volající padají na asyncpg
+        # statement cache, která dotaz připraví při prvním použití
+        if HOT_STATEMENTS:
+            try:
+                conn._limovec_prepared = {
+                    name: await conn.prepare(sql)
+                    for name, sql in HOT_STATEMENTS.items()
+                }
+            except Exception as e:
+                logger.warning(f"Warm-up hot dotazů přeskočen: {e}")
+
+    @staticmethod
+    async def _resolve_pool_config() -> Dict[str, Any]:
+        """Odvodí velikost poolu z max_connections serveru.
+
+        Pevné 5/25 je moc na malé Postgres instance a málo pod burstem;
+        bez explicitních DB_POOL_MIN/DB_POOL_MAX env hodnot se vezme
+        ~40 % serverového limitu."""
+        config = dict(DB_POOL_CONFIG)
+        if 'DB_POOL_MIN' in os.environ and 'DB_POOL_MAX' in os.environ:
+            return config
+
+        try:
+            conn = await asyncpg.connect(DATABASE_URL)
+            try:
+                mx = int(await conn.fetchval('SHOW max_connections'))
+            finally:
+                await conn.close()
+            if 'DB_POOL_MAX' not in os.environ:
+                config['max_size'] = max(4, int(mx * 0.4))
+            if 'DB_POOL_MIN' not in os.environ:
+                # min == max: celý pool se otevře při startu a acquire pod
+                # burstem nikdy neplatí connect+TLS+auth latenci
+                config['min_size'] = config['max_size']
+            logger.info(f"Pool podle max_connections={mx}: "
+                        f"{config['min_size']}-{config['max_size']} spojení")
+        except Exception as e:
+            logger.warning(f"Detekce max_connections selhala ({e}), "
+                           f"používám výchozí pool konfiguraci")
+        return config
+
     async def initialize(self):
         """Inicializace s retry logikou z main.py"""
         max_retries = 5
         base_delay = 1
-        
+
         for attempt in range(max_retries):
             try:
                 logger.info(f"Pokus o připojení k databázi ({attempt + 1}/{max_retries})")
-                self.pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=10)
+                # Pool otevře min_size spojení hned, takže první burst příkazů
+                # neplatí connect+TLS latenci
+                self.pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    init=self._init_connection,
+                    **(await self._resolve_pool_config())
+                )
                 
-                async with self.pool.acquire() as conn:
-                    await self._create_base_tables(conn)
-                    await self._create_ticket_tables(conn)
+                await self._ensure_schema()
                 
                 logger.info("Database úspěšně inicializována!")
                 return
@@ -38,130 +313,33 @@ class DatabaseManager:
                     logger.error("Všechny pokusy o připojení k databázi selhaly")
                     self.pool = None
     
-    async def _create_base_tables(self, conn):
-        """Vytvoří základní tabulky z main.py"""
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS guild_settings (
-                guild_id BIGINT PRIMARY KEY,
-                log_channel BIGINT,
-                welcome_channel BIGINT,
-                goodbye_channel BIGINT,
-                welcome_msg TEXT,
-                goodbye_msg TEXT,
-                invite_tracking BOOLEAN DEFAULT TRUE,
-                log_reactions BOOLEAN DEFAULT FALSE,
-                log_voice BOOLEAN DEFAULT TRUE,
-                log_threads BOOLEAN DEFAULT TRUE,
-                log_roles BOOLEAN DEFAULT TRUE,
-                log_channels BOOLEAN DEFAULT TRUE,
-                log_emojis BOOLEAN DEFAULT TRUE,
-                log_user_updates BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS invites (
-                guild_id BIGINT,
-                invite_code TEXT,
-                inviter_id BIGINT,
-                uses INTEGER DEFAULT 0,
-                max_uses INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (guild_id, invite_code)
-            )
-        ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS invite_uses (
-                id SERIAL PRIMARY KEY,
-                guild_id BIGINT,
-                invite_code TEXT,
-                user_id BIGINT,
-                inviter_id BIGINT,
-                used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # RP volby tabulky...
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS rp_candidates (
-                id SERIAL PRIMARY KEY,
-                guild_id BIGINT NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                election_type TEXT DEFAULT 'presidential',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_by BIGINT NOT NULL
-            )
-        ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS rp_votes (
-                id SERIAL PRIMARY KEY,
-                guild_id BIGINT NOT NULL,
-                user_id BIGINT NOT NULL,
-                candidate_id INTEGER NOT NULL REFERENCES rp_candidates(id),
-                voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(guild_id, user_id)
-            )
-        ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS rp_election_settings (
-                guild_id BIGINT PRIMARY KEY,
-                current_type TEXT DEFAULT 'presidential',
-                voting_ui TEXT DEFAULT 'buttons',
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-    
-    async def _create_ticket_tables(self, conn):
-        """Vytvoří tabulky pro ticket systém"""
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_settings (
-                guild_id BIGINT PRIMARY KEY,
-                mod_role_id BIGINT,
-                admin_role_ids JSONB DEFAULT '[]',
-                transcript_channel_id BIGINT,
-                custom_buttons JSONB DEFAULT '[]',
-                panel_message TEXT DEFAULT 'Kliknutím na tlačítko níže vytvoříš ticket:',
-                embed_color INTEGER DEFAULT 5793266,
-                use_menu BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_logs (
-                id SERIAL PRIMARY KEY,
-                guild_id BIGINT NOT NULL,
-                user_id BIGINT NOT NULL,
-                ticket_type TEXT NOT NULL,
-                action TEXT NOT NULL,
-                channel_id BIGINT,
-                moderator_id BIGINT,
-                reason TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS active_tickets (
-                id SERIAL PRIMARY KEY,
-                guild_id BIGINT NOT NULL,
-                user_id BIGINT NOT NULL,
-                channel_id BIGINT NOT NULL,
-                ticket_type TEXT NOT NULL,
-                status TEXT DEFAULT 'open',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                closed_at TIMESTAMP,
-                UNIQUE(guild_id, user_id, ticket_type)
+    async def _ensure_schema(self):
+        """Vytvoří schéma, pokud ještě neexistuje v aktuální verzi.
+
+        DDL běží jen při prvním deployi dané verze (guard přes _schema_meta);
+        nezávislé příkazy se pouští paralelně, každý na vlastním spojení z poolu.
+        """
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                'CREATE TABLE IF NOT EXISTS _schema_meta (version INT PRIMARY KEY)'
             )
-        ''')
-    
+            if await conn.fetchval(
+                'SELECT 1 FROM _schema_meta WHERE version = $1', _SCHEMA_VERSION
+            ):
+                return
+
+        # Fáze 1: tabulky bez závislostí; fáze 2: FK/indexy na ně navázané
+        await asyncio.gather(*(self.pool.execute(sql) for sql in _DDL_TABLES))
+        await asyncio.gather(*(self.pool.execute(sql) for sql in _DDL_DEPENDENT))
+
+        for sql in _DDL_MIGRATIONS:
+            await self.pool.execute(sql)
+
+        await self.pool.execute(
+            'INSERT INTO _schema_meta (version) VALUES ($1) ON CONFLICT DO NOTHING',
+            _SCHEMA_VERSION
+        )
+
     async def safe_operation(self, operation_name: str, operation_func, default_return=None):
         """Safely execute database operation with error handling"""
         if not self.pool:
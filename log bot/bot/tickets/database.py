@@ -1,16 +1,151 @@
+import asyncio
 import asyncpg
-import json
+import hashlib
 from typing import Dict, Any, List, Tuple, Optional
+from cachetools import TTLCache
 from ..database.manager import DatabaseManager
-from ..utils.cache import LRUCache
+from ..utils.shared_cache import SharedCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Nejčastější SQL jako konstanty - asyncpg cachuje prepared statements
+# per-connection podle textu dotazu, takže stejný text = žádný re-parse/plan
+_SELECT_SETTINGS_SQL = 'SELECT * FROM ticket_settings WHERE guild_id = $1'
+
+_UPSERT_SETTINGS_SQL = '''
+    INSERT INTO ticket_settings
+    (guild_id, mod_role_id, admin_role_ids, transcript_channel_id,
+     panel_message, embed_color, use_menu, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, CURRENT_TIMESTAMP)
+    ON CONFLICT (guild_id)
+    DO UPDATE SET
+        mod_role_id = EXCLUDED.mod_role_id,
+        admin_role_ids = EXCLUDED.admin_role_ids,
+        transcript_channel_id = EXCLUDED.transcript_channel_id,
+        panel_message = EXCLUDED.panel_message,
+        embed_color = EXCLUDED.embed_color,
+        use_menu = EXCLUDED.use_menu,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+# Tlačítka jsou normalizovaná v ticket_buttons - mutace je jeden
+# INSERT/DELETE místo přepisu celého JSONB blobu
+_SELECT_BUTTONS_SQL = '''
+    SELECT label, welcome_message FROM ticket_buttons
+    WHERE guild_id = $1 ORDER BY position, label
+'''
+
+_INSERT_BUTTON_SQL = '''
+    INSERT INTO ticket_buttons (guild_id, position, label, welcome_message)
+    SELECT $1, COALESCE(MAX(position) + 1, 0), $2, $3
+    FROM ticket_buttons WHERE guild_id = $1
+    ON CONFLICT DO NOTHING
+    RETURNING label
+'''
+
+_DELETE_BUTTON_SQL = '''
+    DELETE FROM ticket_buttons WHERE guild_id = $1 AND label = $2
+    RETURNING label
+'''
+
+_CLEAR_BUTTONS_SQL = 'DELETE FROM ticket_buttons WHERE guild_id = $1'
+
+_PRELOAD_SETTINGS_SQL = '''
+    SELECT * FROM ticket_settings WHERE guild_id = ANY($1::bigint[])
+'''
+
+_PRELOAD_BUTTONS_SQL = '''
+    SELECT guild_id, label, welcome_message FROM ticket_buttons
+    WHERE guild_id = ANY($1::bigint[]) ORDER BY guild_id, position, label
+'''
+
+_LOG_COLUMNS = ['guild_id', 'user_id', 'ticket_type', 'action',
+                'channel_id', 'moderator_id', 'reason']
+
+_INSERT_LOG_SQL = '''
+    INSERT INTO ticket_logs
+    (guild_id, user_id, ticket_type, action, channel_id, moderator_id, reason)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+'''
+
+_UPSERT_ACTIVE_TICKET_SQL = '''
+    INSERT INTO active_tickets (guild_id, user_id, channel_id, ticket_type)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (guild_id, user_id, ticket_type)
+    DO UPDATE SET
+        channel_id = EXCLUDED.channel_id,
+        created_at = CURRENT_TIMESTAMP,
+        status = 'open'
+'''
+
+def _attach_derived(settings: Dict[str, Any], guild_id: int) -> Dict[str, Any]:
+    """Odvozené _klíče se spočítají jednou při načtení settings,
+    hot paths je pak jen čtou (nikdy se neserializují do JSON)"""
+    # Frozenset pro O(1) kontrolu rolí (list zůstává pro JSON serializaci)
+    settings["_admin_role_ids_set"] = frozenset(settings["admin_role_ids"])
+    # Lowercase názvy tlačítek pro O(1) kontrolu duplicit
+    settings["_button_labels_lc"] = {lbl.lower() for lbl, _ in settings["custom_buttons"]}
+    # Reverzní mapa hash -> (label, message) pro O(1) routing kliknutí
+    # v on_interaction (stejný hash jako custom_id v TicketButton).
+    # Vedle blake2b id se indexuje i legacy MD5 id - panely postnuté před
+    # přechodem na blake2b mají staré custom_ids zapečené ve zprávách
+    # a jinak by přestaly reagovat, dokud admin panel nepřepostne
+    key = str(guild_id).encode()
+    button_map = {}
+    for lbl, msg in settings["custom_buttons"]:
+        entry = (lbl, msg)
+        button_map[hashlib.blake2b(lbl.encode(), digest_size=4, key=key).hexdigest()] = entry
+        button_map[hashlib.md5(f"{guild_id}_{lbl}".encode()).hexdigest()[:8]] = entry
+    settings["_button_map"] = button_map
+    return settings
+
+
 class TicketDatabase:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
-        self.settings_cache = LRUCache(500)  # Cache pro nastavení
+        # TTLCache řeší expiraci sama (C-backed, levnější get než ruční TTL)
+        self.settings_cache = TTLCache(maxsize=500, ttl=300)
+        self._inflight: Dict[str, asyncio.Future] = {}  # Deduplikace souběžných fetchů
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)  # Fronta pro batch logování
+        self._log_flusher: Optional[asyncio.Task] = None
+        self.shared_cache = SharedCache()  # Redis mezi shardy (no-op bez REDIS_URL)
+
+    def start_invalidation_listener(self):
+        """Naslouchá invalidacím z ostatních shardů a čistí lokální cache"""
+        self.shared_cache.start_listener(
+            'ts_inval',
+            lambda guild_id: self.settings_cache.pop(f"ticket_settings_{guild_id}", None)
+        )
+
+    def start_log_flusher(self):
+        """Spustí background task pro batch zápis ticket logů"""
+        if self._log_flusher is None or self._log_flusher.done():
+            self._log_flusher = asyncio.create_task(self._flush_logs())
+
+    async def _flush_logs(self):
+        """Drénuje frontu logů a zapisuje je po dávkách přes binární COPY
+        (jeden round-trip místo N samostatných INSERTů)"""
+        while True:
+            batch = [await self._log_queue.get()]
+            # Krátké okno pro nasbírání dalších záznamů do dávky
+            await asyncio.sleep(0.5)
+            while len(batch) < 100:
+                try:
+                    batch.append(self._log_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            async def _copy():
+                async with self.db.pool.acquire() as conn:
+                    await conn.copy_records_to_table(
+                        'ticket_logs', records=batch, columns=_LOG_COLUMNS
+                    )
+
+            await self.db.safe_operation(
+                f"flush_ticket_logs({len(batch)})",
+                _copy
+            )
     
     async def get_settings(self, guild_id: int) -> Dict[str, Any]:
         """Async verze get_settings s cachingem"""
@@ -20,22 +155,28 @@ class TicketDatabase:
             return cached
         
         async def _get_settings():
-            async with self.db.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    'SELECT * FROM ticket_settings WHERE guild_id = $1', 
-                    guild_id
-                )
-                
+            # Sdílená cache (Redis) - po restartu/na dalším shardu ušetří
+            # DB round-trip, protože hot guildy už tam nejspíš jsou
+            settings = await self.shared_cache.get_json(f"ts:{guild_id}")
+
+            if settings is None:
+                async with self.db.pool.acquire() as conn:
+                    row = await conn.fetchrow(_SELECT_SETTINGS_SQL, guild_id)
+                    buttons = await conn.fetch(_SELECT_BUTTONS_SQL, guild_id)
+
                 if row:
+                    # JSONB sloupce dekóduje codec registrovaný na poolu
                     settings = {
                         "mod_role_id": row['mod_role_id'],
-                        "admin_role_ids": json.loads(row['admin_role_ids'] or '[]'),
+                        "admin_role_ids": row['admin_role_ids'] or [],
                         "transcript_channel_id": row['transcript_channel_id'],
-                        "custom_buttons": json.loads(row['custom_buttons'] or '[]'),
+                        "custom_buttons": [[b['label'], b['welcome_message']]
+                                           for b in buttons],
                         "panel_message": row['panel_message'],
                         "embed_color": row['embed_color'],
                         "use_menu": row['use_menu']
                     }
+                    await self.shared_cache.set_json(f"ts:{guild_id}", settings)
                 else:
                     settings = {
                         "mod_role_id": None,
@@ -47,9 +188,10 @@ class TicketDatabase:
                         "use_menu": False
                     }
                     await self.save_settings(guild_id, settings)
-                
-                self.settings_cache.set(cache_key, settings, 300)  # 5 min cache
-                return settings
+
+            _attach_derived(settings, guild_id)
+            self.settings_cache[cache_key] = settings
+            return settings
         
         default_settings = {
             "mod_role_id": None,
@@ -58,85 +200,206 @@ class TicketDatabase:
             "custom_buttons": [],
             "panel_message": "Kliknutím na tlačítko níže vytvoříš ticket:",
             "embed_color": 5793266,
-            "use_menu": False
+            "use_menu": False,
+            "_admin_role_ids_set": frozenset(),
+            "_button_labels_lc": set(),
+            "_button_map": {}
         }
-        
-        return await self.db.safe_operation(
-            f"get_ticket_settings({guild_id})",
-            _get_settings,
-            default_settings
-        )
+
+        # Single-flight: souběžné cold misses pro stejnou guildu čekají na
+        # jeden probíhající fetch místo N paralelních round-tripů
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            return await inflight
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            result = await self.db.safe_operation(
+                f"get_ticket_settings({guild_id})",
+                _get_settings,
+                default_settings
+            )
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(cache_key, None)
     
+    async def preload_settings(self, guild_ids: List[int]):
+        """Prewarm settings_cache pro všechny guildy dvěma dotazy při startu
+        místo N studených cache missů na první příkaz"""
+        async def _preload():
+            async with self.db.pool.acquire() as conn:
+                rows = await conn.fetch(_PRELOAD_SETTINGS_SQL, guild_ids)
+                button_rows = await conn.fetch(_PRELOAD_BUTTONS_SQL, guild_ids)
+
+            buttons_by_guild: Dict[int, List] = {}
+            for b in button_rows:
+                buttons_by_guild.setdefault(b['guild_id'], []).append(
+                    [b['label'], b['welcome_message']]
+                )
+
+            for row in rows:
+                gid = row['guild_id']
+                settings = {
+                    "mod_role_id": row['mod_role_id'],
+                    "admin_role_ids": row['admin_role_ids'] or [],
+                    "transcript_channel_id": row['transcript_channel_id'],
+                    "custom_buttons": buttons_by_guild.get(gid, []),
+                    "panel_message": row['panel_message'],
+                    "embed_color": row['embed_color'],
+                    "use_menu": row['use_menu']
+                }
+                _attach_derived(settings, gid)
+                self.settings_cache[f"ticket_settings_{gid}"] = settings
+
+            logger.info(f"Prewarm: načteno {len(rows)} ticket settings")
+
+        await self.db.safe_operation(
+            "preload_ticket_settings",
+            _preload
+        )
+
     async def save_settings(self, guild_id: int, settings: Dict[str, Any]):
         """Async verze save_settings"""
         async def _save_settings():
             async with self.db.pool.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO ticket_settings 
-                    (guild_id, mod_role_id, admin_role_ids, transcript_channel_id, 
-                     custom_buttons, panel_message, embed_color, use_menu, updated_at)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, CURRENT_TIMESTAMP)
-                    ON CONFLICT (guild_id) 
-                    DO UPDATE SET 
-                        mod_role_id = EXCLUDED.mod_role_id,
-                        admin_role_ids = EXCLUDED.admin_role_ids,
-                        transcript_channel_id = EXCLUDED.transcript_channel_id,
-                        custom_buttons = EXCLUDED.custom_buttons,
-                        panel_message = EXCLUDED.panel_message,
-                        embed_color = EXCLUDED.embed_color,
-                        use_menu = EXCLUDED.use_menu,
-                        updated_at = CURRENT_TIMESTAMP
-                ''', 
+                await conn.execute(_UPSERT_SETTINGS_SQL,
                     guild_id,
                     settings["mod_role_id"],
-                    json.dumps(settings["admin_role_ids"]),
+                    settings["admin_role_ids"],
                     settings["transcript_channel_id"],
-                    json.dumps(settings["custom_buttons"]),
                     settings["panel_message"],
                     settings["embed_color"],
                     settings["use_menu"]
                 )
-                
-                # Invalidate cache
+
+                # Write-through do sdílené cache (bez odvozených _klíčů,
+                # které nejsou JSON-serializovatelné) + invalidace ostatních shardů
+                public = {k: v for k, v in settings.items() if not k.startswith("_")}
+                await self.shared_cache.set_json(f"ts:{guild_id}", public)
+                await self.shared_cache.publish('ts_inval', str(guild_id))
+
+                # Write-through: nová settings rovnou do cache, další čtení
+                # nemusí zpátky do databáze
+                _attach_derived(settings, guild_id)
                 cache_key = f"ticket_settings_{guild_id}"
-                self.settings_cache.cache.pop(cache_key, None)
+                self.settings_cache[cache_key] = settings
         
         await self.db.safe_operation(
             f"save_ticket_settings({guild_id})",
             _save_settings
         )
+
+    async def _invalidate_settings(self, guild_id: int):
+        """Zahodí lokální i sdílenou cache settings pro guildu"""
+        self.settings_cache.pop(f"ticket_settings_{guild_id}", None)
+        await self.shared_cache.delete(f"ts:{guild_id}")
+        await self.shared_cache.publish('ts_inval', str(guild_id))
+
+    async def add_button(self, guild_id: int, label: str, welcome_message: str) -> bool:
+        """Přidá tlačítko. Vrací False, pokud label už existuje
+        (case-insensitive)."""
+        # Levný pre-check přes odvozený set z cache; autoritativní je
+        # unikátní index na (guild_id, lower(label)), který chytí i závod
+        # dvou souběžných přidání (INSERT pak vrátí NULL přes ON CONFLICT)
+        settings = await self.get_settings(guild_id)
+        if label.lower() in settings.get("_button_labels_lc", ()):
+            return False
+
+        async def _add():
+            async with self.db.pool.acquire() as conn:
+                inserted = await conn.fetchval(_INSERT_BUTTON_SQL,
+                                               guild_id, label, welcome_message)
+            if inserted is not None:
+                await self._invalidate_settings(guild_id)
+            return inserted is not None
+
+        return await self.db.safe_operation(
+            f"add_ticket_button({guild_id})",
+            _add,
+            False
+        )
+
+    async def remove_button(self, guild_id: int, label: str) -> bool:
+        """Odstraní tlačítko podle názvu. Vrací False, pokud neexistuje."""
+        async def _remove():
+            async with self.db.pool.acquire() as conn:
+                deleted = await conn.fetchval(_DELETE_BUTTON_SQL, guild_id, label)
+            if deleted is not None:
+                await self._invalidate_settings(guild_id)
+            return deleted is not None
+
+        return await self.db.safe_operation(
+            f"remove_ticket_button({guild_id})",
+            _remove,
+            False
+        )
+
+    async def clear_buttons(self, guild_id: int):
+        """Smaže všechna tlačítka guildy"""
+        async def _clear():
+            async with self.db.pool.acquire() as conn:
+                await conn.execute(_CLEAR_BUTTONS_SQL, guild_id)
+            await self._invalidate_settings(guild_id)
+
+        await self.db.safe_operation(
+            f"clear_ticket_buttons({guild_id})",
+            _clear
+        )
     
     async def log_ticket_action(self, guild_id: int, user_id: int, ticket_type: str, 
                                action: str, channel_id: int = None, moderator_id: int = None, 
                                reason: str = None):
-        """Logování ticket akcí"""
+        """Logování ticket akcí - zápis jde přes frontu do batch flusheru"""
+        record = (guild_id, user_id, ticket_type, action,
+                  channel_id, moderator_id, reason)
+
+        if self._log_flusher is not None and not self._log_flusher.done():
+            try:
+                self._log_queue.put_nowait(record)
+                return
+            except asyncio.QueueFull:
+                logger.warning("Fronta ticket logů je plná, zapisuji přímo")
+
+        # Fallback: flusher neběží (nebo je fronta plná) - přímý insert
         async def _log_action():
             async with self.db.pool.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO ticket_logs 
-                    (guild_id, user_id, ticket_type, action, channel_id, moderator_id, reason)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ''', guild_id, user_id, ticket_type, action, channel_id, moderator_id, reason)
-        
+                await conn.execute(_INSERT_LOG_SQL, *record)
+
         await self.db.safe_operation(
             f"log_ticket_action({action})",
             _log_action
         )
     
-    async def create_active_ticket(self, guild_id: int, user_id: int, 
+    async def create_and_log(self, guild_id: int, user_id: int,
+                             channel_id: int, ticket_type: str):
+        """Založí aktivní ticket a zaloguje otevření v jedné transakci
+        na jednom spojení - polovina pool churn oproti dvěma acquire"""
+        async def _create_and_log():
+            async with self.db.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(_UPSERT_ACTIVE_TICKET_SQL,
+                                       guild_id, user_id, channel_id, ticket_type)
+                    await conn.execute(_INSERT_LOG_SQL, guild_id, user_id,
+                                       ticket_type, "created", channel_id,
+                                       None, None)
+
+        await self.db.safe_operation(
+            "create_and_log_ticket",
+            _create_and_log
+        )
+
+    async def create_active_ticket(self, guild_id: int, user_id: int,
                                   channel_id: int, ticket_type: str):
         """Vytvoří záznam o aktivním ticketu"""
         async def _create_ticket():
             async with self.db.pool.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO active_tickets (guild_id, user_id, channel_id, ticket_type)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT (guild_id, user_id, ticket_type) 
-                    DO UPDATE SET 
-                        channel_id = EXCLUDED.channel_id,
-                        created_at = CURRENT_TIMESTAMP,
-                        status = 'open'
-                ''', guild_id, user_id, channel_id, ticket_type)
+                await conn.execute(_UPSERT_ACTIVE_TICKET_SQL,
+                                   guild_id, user_id, channel_id, ticket_type)
         
         await self.db.safe_operation(
             "create_active_ticket",
@@ -2,7 +2,6 @@ import discord
 from discord.ext import commands
 import asyncio
 import hashlib
-import time
 from typing import Dict, List, Optional, Tuple
 import logging
 from datetime import datetime, timezone
@@ -10,9 +9,25 @@ from .database import TicketDatabase
 from .views import PersistentTicketView, TicketControlView
 from .transcript import TranscriptGenerator
 from ..utils.rate_limiter import RateLimiter
+from ..utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Šablony oprávnění pro ticket kanály - PermissionOverwrite se nemusí
+# skládat znovu při každém vytvoření ticketu (discord.py je jen čte)
+_OW_HIDDEN = discord.PermissionOverwrite(view_channel=False)
+_OW_CREATOR = discord.PermissionOverwrite(
+    view_channel=True,
+    send_messages=True,
+    read_message_history=True
+)
+_OW_STAFF = discord.PermissionOverwrite(
+    view_channel=True,
+    send_messages=True,
+    read_message_history=True,
+    manage_messages=True
+)
+
 class TicketManager:
     def __init__(self, bot: commands.Bot, db_manager):
         self.bot = bot
@@ -23,11 +38,96 @@ class TicketManager:
         
         # Cache aktivních ticketů
         self.active_tickets = {}  # guild_id -> {user_id: [ticket_info]}
+
+        # Index otevřených ticketů pro O(1) kontrolu místo skenu kanálů
+        self._open_tickets: Dict[Tuple[int, int], int] = {}  # (guild_id, user_id) -> channel_id
+
+        # Krátká TTL vrstva nad ticket_db - jedno vytvoření/zavření ticketu
+        # sahá na settings 2-3×, ať to není 2-3 samostatné fetche
+        self._settings_cache = LRUCache(1024)
+
+        # Rozlišené role pro overwrites - stejná konfigurace guildy se
+        # nemusí překládat na Role objekty při každém ticketu
+        self._role_cache = LRUCache(256)
+
+        # Guildy s už nafouknutým panel view - views se staví líně
+        # při první interakci, ne pro všechny guildy při startu
+        self._view_built: set = set()
+
+        # Otisk tlačítek, ze kterých bylo view postavené - při resume nebo
+        # opakovaném !create_panel se stejnou konfigurací se view nestaví znovu
+        self._settings_fingerprint: Dict[int, str] = {}
+        self._panel_views: Dict[int, PersistentTicketView] = {}
+
+    @staticmethod
+    def _fingerprint(settings: Dict) -> str:
+        # Otisk musí krýt všechno, z čeho setup_components renderuje:
+        # kromě tlačítek i use_menu, jinak by přepnutí buttons <-> menu
+        # beze změny tlačítek vracelo cached view ve starém režimu
+        return hashlib.blake2b(
+            repr((settings.get("use_menu", False),
+                  sorted(map(tuple, settings.get("custom_buttons", []))))).encode(),
+            digest_size=8
+        ).hexdigest()
+
+    def build_panel_view(self, guild_id: int, settings: Dict) -> PersistentTicketView:
+        """Postaví panel view a zaregistruje ho pro routing interakcí.
+
+        Při nezměněné konfiguraci tlačítek vrátí už zaregistrované view -
+        žádné nové TicketButton alokace ani duplicitní add_view."""
+        fp = self._fingerprint(settings)
+        if guild_id in self._view_built and self._settings_fingerprint.get(guild_id) == fp:
+            cached = self._panel_views.get(guild_id)
+            if cached is not None:
+                return cached
+
+        view = PersistentTicketView(guild_id, settings)
+        self.bot.add_view(view)
+        self._view_built.add(guild_id)
+        self._settings_fingerprint[guild_id] = fp
+        self._panel_views[guild_id] = view
+        return view
+
+    async def ensure_guild_view(self, guild_id: int,
+                                custom_id: Optional[str] = None) -> Optional[Dict]:
+        """Líná inflace panel view při první interakci guildy.
+
+        Vrátí settings, pokud interakci musí obsloužit volající (view ještě
+        nebylo zaregistrované, nebo custom_id nepatří jeho komponentám -
+        typicky legacy MD5 id z panelu postnutého před změnou hashování);
+        None, když už ji obslouží view samo."""
+        if guild_id in self._view_built:
+            view = self._panel_views.get(guild_id)
+            if view is not None and (custom_id is None or custom_id in view.custom_ids):
+                return None
+            return await self._settings(guild_id)
+
+        settings = await self._settings(guild_id)
+        if settings.get("custom_buttons"):
+            self.build_panel_view(guild_id, settings)
+        return settings
+
+    async def _settings(self, guild_id: int) -> Dict:
+        settings = self._settings_cache.get(guild_id)
+        if settings is None:
+            settings = await self.ticket_db.get_settings(guild_id)
+            self._settings_cache.set(guild_id, settings, 30)
+        return settings
     
     async def setup_persistent_views(self):
         """Obnoví všechny persistent views po restartu"""
         try:
             logger.info("Obnovuji persistent views...")
+
+            # Spusť batch flusher ticket logů (potřebuje běžící event loop)
+            self.ticket_db.start_log_flusher()
+            # Naslouchej invalidacím settings z ostatních shardů (no-op bez Redis)
+            self.ticket_db.start_invalidation_listener()
+
+            # Prewarm settings cache jedním dotazem místo N studených missů
+            # (gate proti vytlačení cache na opravdu velkých botech)
+            if len(self.bot.guilds) < 500:
+                await self.ticket_db.preload_settings([g.id for g in self.bot.guilds])
             
             # Import zde aby se předešlo circular imports
             from .views import (
@@ -38,20 +138,11 @@ class TicketManager:
                 CloseTicketButton
             )
             
-            # Registruj globální persistent views pro všechny možné interakce
-            for guild in self.bot.guilds:
-                try:
-                    settings = await self.ticket_db.get_settings(guild.id)
-                    
-                    # Registruj ticket panel view pro tento guild
-                    if settings.get("custom_buttons"):
-                        panel_view = PersistentTicketView(guild.id, settings)
-                        self.bot.add_view(panel_view)
-                        logger.info(f"Registrován ticket panel pro {guild.name}")
-                    
-                except Exception as e:
-                    logger.warning(f"Chyba při registraci ticket views pro {guild.name}: {e}")
-            
+            # Panel views se NEregistrují eagerly pro každou guildu -
+            # nafouknou se líně při první ticket_ interakci (global handler
+            # v main.py), takže startup neplatí CPU za guildy × tlačítka
+            logger.info("Panel views se budou registrovat líně při první interakci")
+
             # Musím registrovat pattern-based persistent views
             # Discord.py automaticky routuje interakce podle custom_id
             
@@ -72,27 +163,47 @@ class TicketManager:
             
             # Interaction handling je nyní v main.py global handleru
             logger.info("Ticket interaction handling delegováno na global handler")
+
+            self._rebuild_open_ticket_index()
             
             logger.info("Persistent views obnoveny")
         except Exception as e:
             logger.error(f"Chyba při obnovování persistent views: {e}")
     
+    def _rebuild_open_ticket_index(self):
+        """Jednorázový sken kanálů po restartu - pak už je kontrola
+        otevřeného ticketu jen dict lookup"""
+        count = 0
+        for guild in self.bot.guilds:
+            for channel in guild.text_channels:
+                if not channel.name.startswith("ticket-"):
+                    continue
+                topic = channel.topic
+                if topic and "creator:" in topic:
+                    try:
+                        creator_id = int(topic.rpartition("creator:")[2])
+                    except ValueError:
+                        continue
+                    self._open_tickets[(guild.id, creator_id)] = channel.id
+                    count += 1
+        logger.info(f"Index otevřených ticketů obnoven ({count} kanálů)")
+
     async def has_mod_permissions(self, user: discord.Member, guild: discord.Guild) -> bool:
         """Zkontroluje zda má uživatel mod oprávnění"""
         if user.guild_permissions.administrator:
             return True
         
-        settings = await self.ticket_db.get_settings(guild.id)
+        settings = await self._settings(guild.id)
         mod_role_id = settings.get("mod_role_id")
-        admin_role_ids = settings.get("admin_role_ids", [])
-        
-        if mod_role_id and any(role.id == mod_role_id for role in user.roles):
-            return True
-        
-        if any(role.id in admin_role_ids for role in user.roles):
+        admin_role_ids = settings.get("_admin_role_ids_set") \
+            or frozenset(settings.get("admin_role_ids", []))
+
+        # Jeden průchod rolemi - set membership místo dvou any() smyček
+        role_ids = {role.id for role in user.roles}
+        if mod_role_id and mod_role_id in role_ids:
             return True
-        
-        return False
+
+        return not role_ids.isdisjoint(admin_role_ids)
     
     async def can_create_ticket(self, user: discord.Member, guild: discord.Guild, 
                                ticket_type: str) -> Tuple[bool, str]:
@@ -100,28 +211,19 @@ class TicketManager:
         
         # Rate limiting check (per-guild per-user) - pouze zkontroluj, nezapisuj
         rate_limit_key = f"{guild.id}_{user.id}"
-        current_time = time.time()
-
-        if rate_limit_key in self.rate_limiter.calls:
-            # Vyčisti staré záznamy
-            self.rate_limiter.calls[rate_limit_key] = [
-                call_time for call_time in self.rate_limiter.calls[rate_limit_key]
-                if current_time - call_time < self.rate_limiter.window
-            ]
-
-            if len(self.rate_limiter.calls[rate_limit_key]) >= self.rate_limiter.max_calls:
-                cooldown = self.rate_limiter.get_cooldown(rate_limit_key)
-                return False, f"Musíš počkat {cooldown} sekund před vytvořením dalšího ticketu."
+        if not self.rate_limiter.would_allow(rate_limit_key):
+            cooldown = self.rate_limiter.get_cooldown(rate_limit_key)
+            return False, f"Musíš počkat {cooldown} sekund před vytvořením dalšího ticketu."
         
-        # Zjednodušená kontrola - jen zkontroluj zda už nemá otevřený kanál s podobným názvem
-        user_name_lower = user.name.lower().replace(" ", "-")  # Discord channel names
-        expected_prefix = f"ticket-{user_name_lower}"
-
-        for channel in guild.text_channels:
-            if channel.name.startswith(expected_prefix):
-                # Má už otevřený ticket
+        # O(1) lookup v indexu otevřených ticketů místo průchodu všech kanálů
+        channel_id = self._open_tickets.get((guild.id, user.id))
+        if channel_id is not None:
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
                 return False, f"Už máš otevřený ticket: {channel.mention}"
-        
+            # Kanál mezitím zmizel (ruční smazání) - ukliď index
+            self._open_tickets.pop((guild.id, user.id), None)
+
         return True, ""
     
     async def create_ticket(self, guild: discord.Guild, user: discord.Member, 
@@ -136,7 +238,7 @@ class TicketManager:
                 await interaction.response.send_message(reason, ephemeral=True)
             return None, reason  # Return reason for persistent view handling
         
-        settings = await self.ticket_db.get_settings(guild.id)
+        settings = await self._settings(guild.id)
         mod_role_id = settings.get("mod_role_id")
         
         if not mod_role_id:
@@ -146,40 +248,40 @@ class TicketManager:
             return None, error_msg
         
         try:
-            # Vytvoření kanálu s oprávněními
-            overwrites = {
-                guild.default_role: discord.PermissionOverwrite(view_channel=False),
-                user: discord.PermissionOverwrite(
-                    view_channel=True, 
-                    send_messages=True, 
-                    read_message_history=True
-                ),
-                guild.get_role(mod_role_id): discord.PermissionOverwrite(
-                    view_channel=True, 
-                    send_messages=True, 
-                    read_message_history=True,
-                    manage_messages=True
+            # Vyřeš všechny role jedním průchodem a postav overwrites
+            # ze sdílených šablon; krátká TTL pokryje smazané/změněné role
+            role_key = (guild.id, mod_role_id,
+                        tuple(sorted(settings.get("admin_role_ids", ()))))
+            resolved = self._role_cache.get(role_key)
+            if resolved is None:
+                mod_role = guild.get_role(mod_role_id)
+                admin_roles = tuple(
+                    r for r in (guild.get_role(rid)
+                                for rid in settings.get("admin_role_ids", ()))
+                    if r
                 )
+                resolved = (mod_role, admin_roles)
+                self._role_cache.set(role_key, resolved, 60)
+            mod_role, admin_roles = resolved
+
+            overwrites = {
+                guild.default_role: _OW_HIDDEN,
+                user: _OW_CREATOR,
+                **{role: _OW_STAFF for role in admin_roles}
             }
-            
-            # Přidej admin role oprávnění
-            for admin_role_id in settings.get("admin_role_ids", []):
-                admin_role = guild.get_role(admin_role_id)
-                if admin_role:
-                    overwrites[admin_role] = discord.PermissionOverwrite(
-                        view_channel=True,
-                        send_messages=True,
-                        read_message_history=True,
-                        manage_messages=True
-                    )
-            
+            if mod_role:
+                overwrites[mod_role] = _OW_STAFF
+
+
             # Vytvoř kanál
             channel_name = f"ticket-{user.name}-{ticket_type.lower()}"[:100]
             ticket_channel = await guild.create_text_channel(
-                channel_name, 
+                channel_name,
                 overwrites=overwrites,
-                topic=f"Ticket od {user} | Typ: {ticket_type}"
+                topic=f"Ticket od {user} | Typ: {ticket_type} | creator:{user.id}"
             )
+
+            self._open_tickets[(guild.id, user.id)] = ticket_channel.id
             
             # Pošli response
             if interaction:
@@ -205,19 +307,16 @@ class TicketManager:
                 view=control_view
             )
             
-            # Jednoduché logování (volitelné)
+            # Záznam aktivního ticketu + log otevření v jedné transakci
             try:
-                await self.ticket_db.log_ticket_action(
-                    guild.id, user.id, ticket_type, "created", ticket_channel.id
+                await self.ticket_db.create_and_log(
+                    guild.id, user.id, ticket_channel.id, ticket_type
                 )
             except Exception as log_e:
-                print(f"⚠️ Nepodařilo se zalogovat vytvoření ticketu: {log_e}")
+                logger.warning("Nepodařilo se zalogovat vytvoření ticketu: %s", log_e)
             
             # Zaznamenej úspěšné vytvoření pro rate limiting
-            rate_limit_key = f"{guild.id}_{user.id}"
-            if rate_limit_key not in self.rate_limiter.calls:
-                self.rate_limiter.calls[rate_limit_key] = []
-            self.rate_limiter.calls[rate_limit_key].append(time.time())
+            self.rate_limiter.record(f"{guild.id}_{user.id}")
 
             logger.info(f"Ticket vytvořen: {ticket_channel.name} pro {user}")
             return ticket_channel, None  # Success
@@ -241,7 +340,7 @@ class TicketManager:
                           reason: str = None):
         """Async zavření ticketu s transcriptem"""
         try:
-            settings = await self.ticket_db.get_settings(channel.guild.id)
+            settings = await self._settings(channel.guild.id)
             
             # Generuj transcript
             transcript_file = None
@@ -250,11 +349,16 @@ class TicketManager:
                 if transcript_channel:
                     transcript_file = await self.transcript_gen.generate_transcript(channel)
             
-            # Najdi ticket creator z názvu kanálu nebo databáze
+            # Najdi ticket creator z topicu (creator:{id} se zapisuje při vytvoření)
             ticket_creator_id = None
-            if channel.topic:
-                # Parse z topic
-                pass
+            if channel.topic and "creator:" in channel.topic:
+                try:
+                    ticket_creator_id = int(channel.topic.rpartition("creator:")[2])
+                except ValueError:
+                    pass
+
+            if ticket_creator_id:
+                self._open_tickets.pop((channel.guild.id, ticket_creator_id), None)
             
             # Jednoduché logování zavření (volitelné)
             try:
@@ -268,7 +372,7 @@ class TicketManager:
                     reason
                 )
             except Exception as log_e:
-                print(f"⚠️ Nepodařilo se zalogovat zavření ticketu: {log_e}")
+                logger.warning("Nepodařilo se zalogovat zavření ticketu: %s", log_e)
             
             # Pošli transcript
             if transcript_file and transcript_channel:
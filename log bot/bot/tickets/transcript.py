@@ -6,6 +6,85 @@ from datetime import datetime
 import html
 import asyncio
 
+# Statická HTML kostra a šablona zprávy jednou na module-level -
+# f-string s celým CSS se neskládá znovu pro každý transcript/zprávu
+_HTML_HEADER_TMPL = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Transcript - {name}</title>
+    <style>
+        body {{
+            background-color: #36393f;
+            color: #dcddde;
+            font-family: Whitney, "Helvetica Neue", Helvetica, Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+        }}
+        .header {{
+            background-color: #2f3136;
+            padding: 20px;
+            border-radius: 8px;
+            margin-bottom: 20px;
+        }}
+        .message {{
+            margin-bottom: 16px;
+            padding: 8px;
+            border-radius: 4px;
+        }}
+        .message:hover {{
+            background-color: #32353b;
+        }}
+        .author {{
+            font-weight: 600;
+            color: #ffffff;
+        }}
+        .timestamp {{
+            color: #72767d;
+            font-size: 12px;
+            margin-left: 8px;
+        }}
+        .content {{
+            margin-top: 4px;
+            word-wrap: break-word;
+        }}
+        .attachment {{
+            color: #00b0f4;
+            margin-top: 4px;
+        }}
+        .embed {{
+            border-left: 4px solid #7289da;
+            background-color: #2f3136;
+            padding: 8px 12px;
+            margin-top: 4px;
+            border-radius: 0 4px 4px 0;
+        }}
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>Transcript: #{name}</h1>
+        <p>Server: {guild}</p>
+        <p>Vygenerováno: {ts}</p>
+    </div>
+"""
+
+_HTML_FOOTER = """
+</body>
+</html>
+"""
+
+_MSG_TMPL = (
+    '<div class="message">'
+    '<span class="author">{author}</span>'
+    '<span class="timestamp">{ts}</span>'
+    '<div class="content">{content}</div>'
+)
+
+_ATTACHMENT_TMPL = '<div class="attachment">📎 Příloha: {name}</div>'
+_EMBED_TMPL = '<div class="embed">📋 {title}</div>'
+
 class TranscriptGenerator:
     def __init__(self):
         self.format_options = ['txt', 'html']
@@ -19,155 +98,99 @@ class TranscriptGenerator:
         else:
             return await self.generate_txt_transcript(channel)
     
-    async def generate_txt_transcript(self, channel: discord.TextChannel) -> discord.File:
-        """Generuje textový transcript"""
-        transcript_lines = []
-        transcript_lines.append(f"=== TRANSCRIPT TICKETU: {channel.name} ===\n")
-        transcript_lines.append(f"Kanál: #{channel.name}")
-        transcript_lines.append(f"Server: {channel.guild.name}")
-        transcript_lines.append(f"Vygenerováno: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}")
-        transcript_lines.append("=" * 50 + "\n")
-        
+    async def _fetch_messages(self, channel: discord.TextChannel):
+        """Stáhne celou historii kanálu; vrátí (messages, chyba)"""
         try:
-            messages = []
-            async for message in channel.history(limit=None):
-                messages.append(message)
-            
-            messages.reverse()  # Chronologické pořadí
-            
-            for message in messages:
-                timestamp = message.created_at.strftime('%d.%m.%Y %H:%M:%S')
-                author = f"{message.author.display_name} ({message.author})"
-                content = message.content or "[Žádný textový obsah]"
-                
-                transcript_lines.append(f"[{timestamp}] {author}: {content}")
-                
-                # Přidej info o přílohách
-                if message.attachments:
-                    for attachment in message.attachments:
-                        transcript_lines.append(f"    📎 Příloha: {attachment.filename}")
-                
-                # Přidej info o embedech
-                if message.embeds:
-                    for embed in message.embeds:
-                        if embed.title:
-                            transcript_lines.append(f"    📋 Embed: {embed.title}")
-        
+            messages = [m async for m in channel.history(limit=None, oldest_first=True)]
+            return messages, None
         except Exception as e:
-            transcript_lines.append(f"\n❌ Chyba při čtení zpráv: {e}")
-        
-        content = "\n".join(transcript_lines)
-        buffer = io.StringIO(content)
-        
+            return [], e
+
+    async def generate_txt_transcript(self, channel: discord.TextChannel) -> discord.File:
+        """Generuje textový transcript"""
+        messages, fetch_error = await self._fetch_messages(channel)
+
+        # Formátování (čisté CPU) běží mimo event loop, aby dlouhý ticket
+        # neblokoval heartbeaty
+        data = await asyncio.to_thread(self._format_txt, channel, messages, fetch_error)
+
         filename = f"transcript-{channel.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
-        return discord.File(buffer, filename=filename)
-    
+        return discord.File(io.BytesIO(data), filename=filename)
+
+    def _format_txt(self, channel: discord.TextChannel, messages, fetch_error) -> bytes:
+        # Zápis rovnou do bufferu - žádný mezilehlý list + join
+        buf = io.StringIO()
+        buf.write(f"=== TRANSCRIPT TICKETU: {channel.name} ===\n\n")
+        buf.write(f"Kanál: #{channel.name}\n")
+        buf.write(f"Server: {channel.guild.name}\n")
+        buf.write(f"Vygenerováno: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
+        buf.write("=" * 50 + "\n\n")
+
+        for message in messages:
+            timestamp = message.created_at.strftime('%d.%m.%Y %H:%M:%S')
+            author = f"{message.author.display_name} ({message.author})"
+            content = message.content or "[Žádný textový obsah]"
+
+            buf.write(f"[{timestamp}] {author}: {content}\n")
+
+            # Přidej info o přílohách
+            for attachment in message.attachments:
+                buf.write(f"    📎 Příloha: {attachment.filename}\n")
+
+            # Přidej info o embedech
+            for embed in message.embeds:
+                if embed.title:
+                    buf.write(f"    📋 Embed: {embed.title}\n")
+
+        if fetch_error:
+            buf.write(f"\n❌ Chyba při čtení zpráv: {fetch_error}\n")
+
+        # discord.File dostane rovnou utf-8 bajty - upload pak neprovádí
+        # vlastní překódování celého dokumentu
+        return buf.getvalue().encode('utf-8')
+
     async def generate_html_transcript(self, channel: discord.TextChannel) -> discord.File:
         """HTML transcript s Discord-like stylingem"""
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Transcript - {html.escape(channel.name)}</title>
-            <style>
-                body {{
-                    background-color: #36393f;
-                    color: #dcddde;
-                    font-family: Whitney, "Helvetica Neue", Helvetica, Arial, sans-serif;
-                    margin: 0;
-                    padding: 20px;
-                }}
-                .header {{
-                    background-color: #2f3136;
-                    padding: 20px;
-                    border-radius: 8px;
-                    margin-bottom: 20px;
-                }}
-                .message {{
-                    margin-bottom: 16px;
-                    padding: 8px;
-                    border-radius: 4px;
-                }}
-                .message:hover {{
-                    background-color: #32353b;
-                }}
-                .author {{
-                    font-weight: 600;
-                    color: #ffffff;
-                }}
-                .timestamp {{
-                    color: #72767d;
-                    font-size: 12px;
-                    margin-left: 8px;
-                }}
-                .content {{
-                    margin-top: 4px;
-                    word-wrap: break-word;
-                }}
-                .attachment {{
-                    color: #00b0f4;
-                    margin-top: 4px;
-                }}
-                .embed {{
-                    border-left: 4px solid #7289da;
-                    background-color: #2f3136;
-                    padding: 8px 12px;
-                    margin-top: 4px;
-                    border-radius: 0 4px 4px 0;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>Transcript: #{html.escape(channel.name)}</h1>
-                <p>Server: {html.escape(channel.guild.name)}</p>
-                <p>Vygenerováno: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}</p>
-            </div>
-        """
-        
-        try:
-            messages = []
-            async for message in channel.history(limit=None):
-                messages.append(message)
-            
-            messages.reverse()
-            
-            for message in messages:
-                timestamp = message.created_at.strftime('%d.%m.%Y %H:%M:%S')
-                author_name = html.escape(message.author.display_name)
-                content = html.escape(message.content) if message.content else "<em>[Žádný textový obsah]</em>"
-                
-                html_content += f"""
-                <div class="message">
-                    <span class="author">{author_name}</span>
-                    <span class="timestamp">{timestamp}</span>
-                    <div class="content">{content}</div>
-                """
-                
-                # Přidej přílohy
-                for attachment in message.attachments:
-                    attachment_name = html.escape(attachment.filename)
-                    html_content += f'<div class="attachment">📎 Příloha: {attachment_name}</div>'
-                
-                # Přidej embedy
-                for embed in message.embeds:
-                    if embed.title:
-                        embed_title = html.escape(embed.title)
-                        html_content += f'<div class="embed">📋 {embed_title}</div>'
-                
-                html_content += "</div>"
-        
-        except Exception as e:
-            html_content += f'<div class="message"><span class="author">Systém</span><div class="content">❌ Chyba při čtení zpráv: {html.escape(str(e))}</div></div>'
-        
-        html_content += """
-        </body>
-        </html>
-        """
-        
-        buffer = io.StringIO(html_content)
+        messages, fetch_error = await self._fetch_messages(channel)
+
+        data = await asyncio.to_thread(self._format_html, channel, messages, fetch_error)
+
         filename = f"transcript-{channel.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.html"
-        
-        return discord.File(buffer, filename=filename)
\ No newline at end of file
+        return discord.File(io.BytesIO(data), filename=filename)
+
+    def _format_html(self, channel: discord.TextChannel, messages, fetch_error) -> bytes:
+        # StringIO buffer místo += na str - ta konkatenace byla O(N²)
+        buf = io.StringIO()
+        buf.write(_HTML_HEADER_TMPL.format(
+            name=html.escape(channel.name),
+            guild=html.escape(channel.guild.name),
+            ts=datetime.now().strftime('%d.%m.%Y %H:%M:%S')
+        ))
+
+        for message in messages:
+            timestamp = message.created_at.strftime('%d.%m.%Y %H:%M:%S')
+            author_name = html.escape(message.author.display_name)
+            content = html.escape(message.content) if message.content else "<em>[Žádný textový obsah]</em>"
+
+            buf.write(_MSG_TMPL.format(
+                author=author_name, ts=timestamp, content=content
+            ))
+
+            # Přidej přílohy
+            for attachment in message.attachments:
+                attachment_name = html.escape(attachment.filename)
+                buf.write(_ATTACHMENT_TMPL.format(name=attachment_name))
+
+            # Přidej embedy
+            for embed in message.embeds:
+                if embed.title:
+                    embed_title = html.escape(embed.title)
+                    buf.write(_EMBED_TMPL.format(title=embed_title))
+
+            buf.write("</div>")
+
+        if fetch_error:
+            buf.write(f'<div class="message"><span class="author">Systém</span><div class="content">❌ Chyba při čtení zpráv: {html.escape(str(fetch_error))}</div></div>')
+
+        buf.write(_HTML_FOOTER)
+        return buf.getvalue().encode('utf-8')
@@ -25,8 +25,13 @@ class PersistentTicketView(discord.ui.View):
                 if i >= 25:  # Discord limit
                     break
                     
-                # Vytvoř konzistentní custom_id
-                button_hash = hashlib.md5(f"{self.guild_id}_{label}".encode()).hexdigest()[:8]
+                # Vytvoř konzistentní custom_id - blake2b s digest_size=4 dá
+                # rovnou 8 hex znaků a na malých vstupech je rychlejší než MD5
+                button_hash = hashlib.blake2b(
+                    label.encode(),
+                    digest_size=4,
+                    key=str(self.guild_id).encode()
+                ).hexdigest()
                 custom_id = f"ticket_{button_hash}"
                 
                 button = TicketButton(
@@ -37,6 +42,11 @@ class PersistentTicketView(discord.ui.View):
                 )
                 self.add_item(button)
 
+        # Set vlastních custom_ids pro O(1) test, zda interakci obslouží
+        # tohle view (viz TicketManager.ensure_guild_view) - legacy ids
+        # ze starších panelů v něm nejsou a routují se přes _button_map
+        self.custom_ids = {c.custom_id for c in self.children}
+
 class TicketSelectMenu(discord.ui.Select):
     def __init__(self, guild_id: int, settings: Dict):
         self.guild_id = guild_id
@@ -1,46 +1,62 @@
 from collections import OrderedDict
+import heapq
 import time
 
+# Monotónní hodiny pro expirace - bez syscallu CLOCK_REALTIME a NTP skoků
+_now = time.monotonic
+
 
 class LRUCache:
+    """LRU cache s TTL.
+
+    Hodnota a expirace se drží jako jedna (value, expire_at) dvojice
+    v jediném OrderedDict - hit pak stojí jeden hash lookup místo dvou
+    a obě struktury se nemohou rozjet. Expirace navíc leží v min-heapu,
+    takže úklid stojí O(expirovaných × log n) místo průchodu celé cache.
+    """
+
     def __init__(self, max_size=1000):
         self.max_size = max_size
-        self.cache = OrderedDict()
-        self.expiry = {}
-    
+        self.cache = OrderedDict()  # key -> (value, expire_at)
+        self._exp_heap = []  # (expire_at, key); zastaralé záznamy se přeskočí
+
     def get(self, key, default=None):
-        if key in self.cache:
-            # Zkontroluj expiraci
-            if key in self.expiry and time.time() > self.expiry[key]:
-                del self.cache[key]
-                del self.expiry[key]
-                return default
-            
-            # Move to end (most recently used)
-            self.cache.move_to_end(key)
-            return self.cache[key]
-        return default
-    
+        entry = self.cache.get(key)
+        if entry is None:
+            return default
+
+        value, expire_at = entry
+        # Zkontroluj expiraci
+        if _now() > expire_at:
+            del self.cache[key]
+            return default
+
+        # Move to end (most recently used)
+        self.cache.move_to_end(key)
+        return value
+
     def set(self, key, value, expire_in=3600):  # 1 hodina default
         if key in self.cache:
             self.cache.move_to_end(key)
-        else:
-            if len(self.cache) >= self.max_size:
-                # Remove oldest
-                oldest = next(iter(self.cache))
-                del self.cache[oldest]
-                if oldest in self.expiry:
-                    del self.expiry[oldest]
-        
-        self.cache[key] = value
-        self.expiry[key] = time.time() + expire_in
-    
+        elif len(self.cache) >= self.max_size:
+            # Remove oldest
+            self.cache.popitem(last=False)
+
+        expire_at = _now() + expire_in
+        self.cache[key] = (value, expire_at)
+        heapq.heappush(self._exp_heap, (expire_at, key))
+
     def cleanup_expired(self):
         """Odstraň expirované záznamy"""
-        current_time = time.time()
-        expired_keys = [k for k, exp_time in self.expiry.items() if current_time > exp_time]
-        for key in expired_keys:
-            if key in self.cache:
+        current_time = _now()
+        removed = 0
+        heap = self._exp_heap
+        while heap and heap[0][0] < current_time:
+            expire_at, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            # Po re-set() klíče zůstává v heapu starý záznam - poznáme ho
+            # podle nesouhlasící expirace a jen přeskočíme
+            if entry is not None and entry[1] == expire_at:
                 del self.cache[key]
-            del self.expiry[key]
-        return len(expired_keys)
\ No newline at end of file
+                removed += 1
+        return removed
@@ -1,36 +1,82 @@
 import time
-from typing import Dict, List, Union, Hashable
+from collections import OrderedDict
+from math import ceil
+from typing import Tuple, Union, Hashable
+
+# Monotónní hodiny - levnější než CLOCK_REALTIME a imunní vůči NTP skokům;
+# hoisted referenci nestojí attribute lookup na každé volání
+_now = time.monotonic
 
 
 class RateLimiter:
-    def __init__(self, max_calls: int = 5, window: int = 60):
+    """Token bucket rate limiter.
+
+    Na klíč drží jen dvojici (tokens, last_refill) - kontrola je O(1)
+    bez alokace listu timestampů jako u sliding window. Paměť je
+    ohraničená: LRU strop + amortizovaný úklid plných (idle) bucketů,
+    jinak by každý klíč co kdy limiter viděl zůstal rezidentní navždy.
+    """
+
+    SWEEP_INTERVAL = 4096  # jednou za N volání projdi a zahoď plné buckety
+
+    def __init__(self, max_calls: int = 5, window: int = 60, max_keys: int = 50000):
         self.max_calls = max_calls
         self.window = window
-        self.calls: Dict[Hashable, List[float]] = {}
-    
+        self.max_keys = max_keys
+        self.refill_rate = max_calls / window  # tokenů za sekundu
+        self.buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._calls_since_sweep = 0
+
+    def _maintain(self, key: Hashable):
+        """LRU pořadí, strop na počet klíčů a občasný úklid idle bucketů"""
+        self.buckets.move_to_end(key)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+
+        self._calls_since_sweep += 1
+        if self._calls_since_sweep >= self.SWEEP_INTERVAL:
+            self._calls_since_sweep = 0
+            now = _now()
+            # Plně dolitý bucket je nerozeznatelný od neexistujícího
+            idle = [
+                k for k, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * self.refill_rate >= self.max_calls
+            ]
+            for k in idle:
+                del self.buckets[k]
+
+    def _refill(self, key: Hashable) -> Tuple[float, float]:
+        """Vrátí (aktuální tokeny po dolití, now)"""
+        now = _now()
+        tokens, last = self.buckets.get(key, (float(self.max_calls), now))
+        tokens = min(self.max_calls, tokens + (now - last) * self.refill_rate)
+        return tokens, now
+
     def can_call(self, key: Union[int, str]) -> bool:
-        """Zkontroluje zda může uživatel/klíč provést akci"""
-        current_time = time.time()
-        
-        if key not in self.calls:
-            self.calls[key] = []
-        
-        # Odstraň staré volání
-        self.calls[key] = [
-            call_time for call_time in self.calls[key] 
-            if current_time - call_time < self.window
-        ]
-        
-        if len(self.calls[key]) < self.max_calls:
-            self.calls[key].append(current_time)
-            return True
-        
-        return False
-    
+        """Zkontroluje zda může uživatel/klíč provést akci (a spotřebuje token)"""
+        tokens, now = self._refill(key)
+        allowed = tokens >= 1
+        self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+        self._maintain(key)
+        return allowed
+
+    def would_allow(self, key: Union[int, str]) -> bool:
+        """Jen zkontroluje limit, nic nespotřebuje"""
+        tokens, _ = self._refill(key)
+        return tokens >= 1
+
+    def record(self, key: Union[int, str]):
+        """Spotřebuje token po úspěšně provedené akci"""
+        tokens, now = self._refill(key)
+        self.buckets[key] = (max(0.0, tokens - 1), now)
+        self._maintain(key)
+
     def get_cooldown(self, key: Union[int, str]) -> int:
         """Vrátí kolik sekund musí uživatel čekat"""
-        if key not in self.calls or not self.calls[key]:
+        if key not in self.buckets:
+            return 0
+
+        tokens, _ = self._refill(key)
+        if tokens >= 1:
             return 0
-        
-        oldest_call = min(self.calls[key])
-        return max(0, int(self.window - (time.time() - oldest_call)))
\ No newline at end of file
+        return ceil((1 - tokens) / self.refill_rate)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import logging
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Redis je volitelná závislost - bez ní (nebo bez REDIS_URL) je cache no-op
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+
+class SharedCache:
+    """Sdílená cache přes Redis pro více shardů/procesů.
+
+    Proces-lokální cache se po restartu/na každém shardu plní z Postgresu
+    znovu - Redis s krátkým TTL tu duplikaci odstíní. Když Redis není
+    dostupný, všechny metody tiše vrací None a čtení spadne na databázi.
+    """
+
+    def __init__(self, prefix: str = 'limovec'):
+        self.prefix = prefix
+        self.redis = None
+        self._listener_task: Optional[asyncio.Task] = None
+
+        if aioredis is not None and REDIS_URL:
+            try:
+                self.redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+                logger.info("SharedCache: Redis připojen")
+            except Exception as e:
+                logger.warning(f"SharedCache: Redis nedostupný, běžím bez něj: {e}")
+
+    @property
+    def available(self) -> bool:
+        return self.redis is not None
+
+    async def get_json(self, key: str) -> Optional[Any]:
+        if not self.redis:
+            return None
+        try:
+            raw = await self.redis.get(f"{self.prefix}:{key}")
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"SharedCache get({key}): {e}")
+            return None
+
+    async def set_json(self, key: str, value: Any, ttl: int = 3600):
+        if not self.redis:
+            return
+        try:
+            await self.redis.set(f"{self.prefix}:{key}", json.dumps(value), ex=ttl)
+        except Exception as e:
+            logger.warning(f"SharedCache set({key}): {e}")
+
+    async def delete(self, key: str):
+        if not self.redis:
+            return
+        try:
+            await self.redis.delete(f"{self.prefix}:{key}")
+        except Exception as e:
+            logger.warning(f"SharedCache delete({key}): {e}")
+
+    async def publish(self, channel: str, payload: str):
+        """Pošle invalidační zprávu ostatním shardům"""
+        if not self.redis:
+            return
+        try:
+            await self.redis.publish(f"{self.prefix}:{channel}", payload)
+        except Exception as e:
+            logger.warning(f"SharedCache publish({channel}): {e}")
+
+    def start_listener(self, channel: str, callback: Callable[[str], None]):
+        """Spustí background task naslouchající invalidačním zprávám"""
+        if not self.redis or self._listener_task is not None:
+            return
+        self._listener_task = asyncio.create_task(self._listen(channel, callback))
+
+    async def _listen(self, channel: str, callback: Callable[[str], None]):
+        try:
+            pubsub = self.redis.pubsub()
+            await pubsub.subscribe(f"{self.prefix}:{channel}")
+            async for message in pubsub.listen():
+                if message.get('type') == 'message':
+                    try:
+                        callback(message['data'])
+                    except Exception as e:
+                        logger.warning(f"SharedCache listener callback: {e}")
+        except Exception as e:
+            logger.warning(f"SharedCache listener({channel}) skončil: {e}")
@@ -1,35 +1,46 @@
-from flask import Flask
-from threading import Thread
+from aiohttp import web
 import os
 
-app = Flask('')
+# Healthcheck server běží na stejném asyncio loopu jako bot - žádný
+# Flask dev server ve vedlejším threadu, takže pingy hostingu nesoupeří
+# s event handlery o GIL a neplatí se context switch na request
 
-@app.route('/')
-def home():
-    return "Discord Bot Je Up"
 
-@app.route('/health')
-def health():
-    return {"status": "healthy", "service": "discord-bot"}
+async def home(request):
+    return web.Response(text="Discord Bot Je Up")
 
-@app.route('/status')
-def status():
-    return {
+
+async def health(request):
+    return web.json_response({"status": "healthy", "service": "discord-bot"})
+
+
+async def status(request):
+    return web.json_response({
         "status": "online",
         "service": "integrated-discord-bot",
         "features": [
             "audit-logging",
-            "ticket-system", 
+            "ticket-system",
             "invite-tracking",
             "rp-elections"
         ]
-    }
+    })
+
 
-def run():
-    port = int(os.environ.get('PORT', 8080))  
-    app.run(host='0.0.0.0', port=port)
+async def keep_alive():
+    """Spustí healthcheck web server na běžícím event loopu.
 
-def keep_alive():
-    t = Thread(target=run)
-    t.daemon = True  # Daemon thread for proper shutdown
-    t.start()
\ No newline at end of file
+    Volá se z on_ready; vrací AppRunner, aby šel server případně
+    čistě zavřít (runner.cleanup())."""
+    app = web.Application()
+    app.add_routes([
+        web.get('/', home),
+        web.get('/health', health),
+        web.get('/status', status),
+    ])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = int(os.environ.get('PORT', 8080))
+    site = web.TCPSite(runner, '0.0.0.0', port)
+    await site.start()
+    return runner
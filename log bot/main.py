@@ -8,15 +8,28 @@ from datetime import datetime, timezone, timedelta
 from keep_alive import keep_alive
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import numpy as np
 from io import BytesIO
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from types import MappingProxyType
+import hashlib
 import time
 import logging
+import logging.handlers
+import queue
 import weakref
 
+# Logování přes frontu - handlery jen vloží záznam do queue.Queue,
+# synchronní zápis na stdout dělá background QueueListener vlákno,
+# takže event loop neblokují I/O bursty (preload, chybové cesty)
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.StreamHandler(sys.stdout)
+)
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
+_log_listener.start()
+log = logging.getLogger("limovec")
+
 # Přidání current directory do Python path pro importy (Render compatibility)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -26,7 +39,7 @@ manager_exists = os.path.exists(os.path.join(os.path.dirname(__file__), 'bot', '
 
 if bot_folder_exists and manager_exists:
     # Kompletní importy z bot folderu pro Render
-    from bot.database.manager import DatabaseManager
+    from bot.database.manager import DatabaseManager, HOT_STATEMENTS
     from bot.tickets.manager import TicketManager
     from bot.tickets.database import TicketDatabase
     from bot.tickets.views import (
@@ -41,51 +54,61 @@ if bot_folder_exists and manager_exists:
     from bot.utils.cache import LRUCache
     from bot.utils.rate_limiter import RateLimiter as BotRateLimiter
     from bot.config.settings import *
-    print("✅ All modular components loaded for production")
+    log.info("✅ All modular components loaded for production")
 else:
-    print("⚠️ Bot modules not found, using emergency fallback classes")
+    log.warning("⚠️ Bot modules not found, using emergency fallback classes")
     # Emergency inline classes
     from collections import OrderedDict
+    import heapq
     import time
-    
+
     class LRUCache:
+        # Stejná fúze jako v bot/utils/cache.py - hodnota i expirace
+        # v jednom OrderedDict jako (value, expire_at) dvojice
         def __init__(self, max_size=1000):
             self.max_size = max_size
-            self.cache = OrderedDict()
-            self.expiry = {}
-        
+            self.cache = OrderedDict()  # key -> (value, expire_at)
+            self._heap = []  # (expire_at, key) min-heap pro levný úklid
+
         def get(self, key, default=None):
-            if key in self.cache:
-                if key in self.expiry and time.time() > self.expiry[key]:
-                    del self.cache[key]
-                    del self.expiry[key]
-                    return default
-                self.cache.move_to_end(key)
-                return self.cache[key]
-            return default
-        
+            entry = self.cache.get(key)
+            if entry is None:
+                return default
+            value, expire_at = entry
+            if time.time() > expire_at:
+                del self.cache[key]
+                return default
+            self.cache.move_to_end(key)
+            return value
+
         def set(self, key, value, expire_in=3600):
             if key in self.cache:
                 self.cache.move_to_end(key)
-            else:
-                if len(self.cache) >= self.max_size:
-                    oldest = next(iter(self.cache))
-                    del self.cache[oldest]
-                    if oldest in self.expiry:
-                        del self.expiry[oldest]
-            self.cache[key] = value
-            self.expiry[key] = time.time() + expire_in
-        
+            elif len(self.cache) >= self.max_size:
+                self.cache.popitem(last=False)
+            expire_at = time.time() + expire_in
+            self.cache[key] = (value, expire_at)
+            heapq.heappush(self._heap, (expire_at, key))
+
         def cleanup_expired(self):
+            # Pop jen skutečně expirovaných hlav heapu; záznamy po re-set()
+            # klíče mají jinou expiraci a jen se přeskočí
             current_time = time.time()
-            expired_keys = [k for k, exp_time in self.expiry.items() if current_time > exp_time]
-            for key in expired_keys:
-                if key in self.cache:
+            removed = 0
+            while self._heap and self._heap[0][0] < current_time:
+                expire_at, key = heapq.heappop(self._heap)
+                entry = self.cache.get(key)
+                if entry is not None and entry[1] == expire_at:
                     del self.cache[key]
-                del self.expiry[key]
-            return len(expired_keys)
+                    removed += 1
+            return removed
     
     # Placeholder pro DatabaseManager
+    HOT_STATEMENTS = {}
+
+    # Minimální náhrada configu z bot.config.settings
+    RATE_LIMITS = {'voice_debounce': 5}
+
     class DatabaseManager:
         def __init__(self):
             self.pool = None
@@ -93,9 +116,9 @@ else:
         async def initialize(self):
             try:
                 self.pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=10)
-                print("✅ Basic database connection established")
+                log.info("✅ Basic database connection established")
             except Exception as e:
-                print(f"❌ Database connection failed: {e}")
+                log.error(f"❌ Database connection failed: {e}")
                 self.pool = None
         
         async def safe_operation(self, operation_name: str, operation_func, default_return=None):
@@ -104,7 +127,7 @@ else:
             try:
                 return await operation_func()
             except Exception as e:
-                print(f"❌ {operation_name}: {e}")
+                log.error(f"❌ {operation_name}: {e}")
                 return default_return
     
     # Placeholder pro TicketManager
@@ -114,7 +137,7 @@ else:
             self.db_manager = db_manager
 
         async def setup_persistent_views(self):
-            print("⚠️ Ticket system not fully available - using placeholder")
+            log.warning("⚠️ Ticket system not fully available - using placeholder")
             pass
 
         async def create_ticket(self, guild, user, ticket_type, welcome_message, interaction=None):
@@ -126,7 +149,7 @@ else:
 
         async def close_ticket(self, channel, user, reason):
             """Placeholder close_ticket function"""
-            print("⚠️ Close ticket není dostupný - chybí bot moduly")
+            log.warning("⚠️ Close ticket není dostupný - chybí bot moduly")
             return False
 
     # Placeholder pro handle_ticket_creation
@@ -134,7 +157,7 @@ else:
         """Placeholder handle_ticket_creation function"""
         await interaction.response.send_message("❌ Ticket systém není dostupný - chybí bot moduly", ephemeral=True)
 
-    print("⚠️ Using emergency fallback classes - some functionality may be limited")
+    log.warning("⚠️ Using emergency fallback classes - some functionality may be limited")
 
 # Načtení .env souboru
 load_dotenv()
@@ -142,7 +165,7 @@ load_dotenv()
 # Konfiguraci databáze
 DATABASE_URL = os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL')
 if not DATABASE_URL:
-    print("❌ KRITICKÁ CHYBA: DATABASE_URL není nastavena! Bot bude pokračovat bez databáze.")
+    log.error("❌ KRITICKÁ CHYBA: DATABASE_URL není nastavena! Bot bude pokračovat bez databáze.")
     DATABASE_URL = None
 
 # Optimalizované intents - pouze co potřebujeme
@@ -153,10 +176,11 @@ intents.invites = True
 intents.guilds = True
 
 bot = commands.Bot(
-    command_prefix="!", 
+    command_prefix="!",
     intents=intents,
-    max_messages=1000,  # Omez cache zpráv
-    case_insensitive=True
+    max_messages=1000  # Omez cache zpráv
+    # case_insensitive vynechané - _CaseInsensitiveDict volá .lower()
+    # na každé vyhledání příkazu a žádné dva příkazy se liší jen velikostí
 )
 
 # Globální databázové připojení - nyní použijeme DatabaseManager
@@ -164,33 +188,78 @@ db_manager = DatabaseManager()
 
 # Cache pro invite tracking
 invite_cache = {}
+# Reverzní index user -> guildy, kde je členem; on_user_update díky němu
+# nemusí skenovat všechny guildy přes get_member (O(guildy uživatele)
+# místo O(všech guild)). Plní se při startu a udržují ho join/remove eventy
+_user_guilds = defaultdict(set)
+
+def _index_guild_members(guild):
+    for member in guild.members:
+        _user_guilds[member.id].add(guild.id)
 
 # Globální cache objekty s LRUCache
 audit_cache = LRUCache(1000)
 guild_settings_cache = LRUCache(500)
 voice_event_cache = LRUCache(200)  # Cache pro voice events
 election_cache = LRUCache(500)  # Cache pro election settings
-voice_debounce_tasks = {}  # Pro debouncing voice events
+voice_debounce_tasks = {}  # Pro debouncing voice events (self-cleaning přes done-callback)
+_guild_voice_tasks = {}  # guild_id -> set(tasků) pro bulk-cancel při odchodu z guildy
+
+# Debounce okno voice logů (s) - rychlé přeskakování kanálů / reconnect
+# smyčka jednoho člena se slije do logu posledního stavu
+_VOICE_DEBOUNCE_WINDOW = RATE_LIMITS['voice_debounce']
+
+def schedule_voice_debounce(guild_id, key, coro):
+    """Naplánuje debounce task; po doběhnutí se sám vyhodí ze slovníku,
+    takže žádný periodický sken hotových tasků není potřeba"""
+    existing = voice_debounce_tasks.get(key)
+    if existing is not None and not existing.done():
+        existing.cancel()
+    task = asyncio.create_task(coro)
+    voice_debounce_tasks[key] = task
+    guild_set = _guild_voice_tasks.setdefault(guild_id, set())
+    guild_set.add(task)
+
+    def _done(t, k=key, gid=guild_id):
+        # Identity check: callback zrušeného tasku nesmí vyhodit záznam
+        # živé náhrady, která mezitím běží pod stejným klíčem
+        if voice_debounce_tasks.get(k) is t:
+            del voice_debounce_tasks[k]
+        tasks = _guild_voice_tasks.get(gid)
+        if tasks is not None:
+            tasks.discard(t)
+            if not tasks:
+                _guild_voice_tasks.pop(gid, None)
+
+    task.add_done_callback(_done)
+    return task
+
+def cancel_guild_voice_tasks(guild_id):
+    """Zruší všechny čekající debounce tasky guildy jedním průchodem"""
+    for task in list(_guild_voice_tasks.get(guild_id, ())):
+        task.cancel()
+
+# Rate limitery - token bucket: na guildu jen (tokens, last_refill),
+# žádný list timestampů ani jeho přestavba při každém eventu.
+# Monotónní hodiny - levnější než CLOCK_REALTIME a imunní vůči NTP
+# skokům; hoisted reference šetří attribute lookup na hot path
+_monotonic = time.monotonic
 
-# Rate limitery
 class RateLimiter:
     def __init__(self, max_calls=5, window=60):  # 5 volání za minutu
         self.max_calls = max_calls
         self.window = window
-        self.calls = {}
-    
+        self.refill_rate = max_calls / window  # tokenů za sekundu
+        self.calls = {}  # guild_id -> (tokens, last_refill)
+
     def can_call(self, guild_id):
-        current_time = time.time()
-        if guild_id not in self.calls:
-            self.calls[guild_id] = []
-        
-        # Odstraň staré volání
-        self.calls[guild_id] = [call_time for call_time in self.calls[guild_id] 
-                               if current_time - call_time < self.window]
-        
-        if len(self.calls[guild_id]) < self.max_calls:
-            self.calls[guild_id].append(current_time)
+        now = _monotonic()
+        tokens, last = self.calls.get(guild_id, (float(self.max_calls), now))
+        tokens = min(self.max_calls, tokens + (now - last) * self.refill_rate)
+        if tokens >= 1:
+            self.calls[guild_id] = (tokens - 1, now)
             return True
+        self.calls[guild_id] = (tokens, now)
         return False
 
 audit_rate_limiter = RateLimiter(5, 60)
@@ -200,99 +269,208 @@ thread_rate_limiter = RateLimiter(10, 60)    # Max 10 thread eventů za minutu p
 channel_rate_limiter = RateLimiter(10, 60)   # Max 10 channel eventů za minutu per guild
 role_rate_limiter = RateLimiter(10, 60)      # Max 10 role eventů za minutu per guild
 
+# Hot-path konstanty - barvy jsou immutable a classmethody discord.Color
+# by je jinak alokovaly znovu při každém embedu
+_RED = discord.Color.red()
+_GREEN = discord.Color.green()
+_BLUE = discord.Color.blue()
+_ORANGE = discord.Color.orange()
+_GOLD = discord.Color.gold()
+_DARK_RED = discord.Color.dark_red()
+
+# Alias na discord.utils.utcnow - jediná centrální cesta k aware UTC
+# timestampu pro všechny handlery, bez attribute lookupů na call site
+now_utc = discord.utils.utcnow
+
+def _build_embed(title, color, fields):
+    """Přímá konstrukce embedu přes Embed.from_dict pro hot handlery.
+
+    add_field alokuje a validuje dict per field; from_dict vezme hotový
+    payload jedním průchodem. Fields je list dictů
+    {"name", "value", "inline"}; timestamp doplní drain task fronty."""
+    return discord.Embed.from_dict({
+        "title": title,
+        "color": color.value,
+        "fields": fields,
+    })
+
+def _fit(s, n=1024):
+    """Zkrátí text na Discord limit fieldu; krátký text (běžný případ)
+    projde bez slice+konkatenace"""
+    return s if len(s) <= n else s[:n - 3] + "..."
+
 # Databázové funkce s novým DatabaseManager
 async def safe_db_operation(operation_name: str, operation_func, default_return=None):
     """Safely execute database operation with error handling"""
     return await db_manager.safe_operation(operation_name, operation_func, default_return)
 
+# Defaultní guild settings jednou na module-level - miss ani fallback
+# nealokuje dva 14-klíčové literály a seznamy se nemohou rozjet
+_DEFAULT_SETTINGS = MappingProxyType({
+    "log_channel": None,
+    "welcome_channel": None,
+    "goodbye_channel": None,
+    "welcome_msg": None,
+    "goodbye_msg": None,
+    "invite_tracking": True,
+    "log_reactions": False,        # Defaultně vypnuté kvůli spamu
+    "log_voice": True,             # Voice události
+    "log_voice_join": True,        # Připojení/odpojení z voice
+    "log_voice_move": True,        # Přepnutí voice kanálu
+    "log_voice_mute": False,       # Mute/deaf toggly (defaultně vypnuté kvůli spamu)
+    "log_threads": True,           # Thread události
+    "log_roles": True,             # Role události
+    "log_channels": True,          # Channel události
+    "log_emojis": True,            # Emoji události
+    "log_user_updates": False      # User profile změny (může být spam)
+})
+
 async def get_guild_settings(guild_id: int) -> Dict[str, Any]:
     # Zkus cache první
     cache_key = f"guild_settings_{guild_id}"
     cached = guild_settings_cache.get(cache_key)
     if cached:
         return cached
-    
+
     async def _get_settings():
         async with db_manager.pool.acquire() as conn:
             row = await conn.fetchrow('SELECT * FROM guild_settings WHERE guild_id = $1', guild_id)
             if row:
                 settings = dict(row)
             else:
-                settings = {
-                    "guild_id": guild_id,
-                    "log_channel": None,
-                    "welcome_channel": None,
-                    "goodbye_channel": None,
-                    "welcome_msg": None,
-                    "goodbye_msg": None,
-                    "invite_tracking": True,
-                    "log_reactions": False,        # Defaultně vypnuté kvůli spamu
-                    "log_voice": True,             # Voice události
-                    "log_threads": True,           # Thread události
-                    "log_roles": True,             # Role události  
-                    "log_channels": True,          # Channel události
-                    "log_emojis": True,            # Emoji události
-                    "log_user_updates": False      # User profile změny (může být spam)
-                }
+                settings = {**_DEFAULT_SETTINGS, "guild_id": guild_id}
                 # Vytvoř defaultní nastavení v databázi
                 await conn.execute('''
-                    INSERT INTO guild_settings (guild_id, invite_tracking, log_reactions, log_voice, 
-                                               log_threads, log_roles, log_channels, log_emojis, log_user_updates) 
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) 
+                    INSERT INTO guild_settings (guild_id, invite_tracking, log_reactions, log_voice,
+                                               log_threads, log_roles, log_channels, log_emojis, log_user_updates)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
                     ON CONFLICT (guild_id) DO NOTHING
                 ''', guild_id, True, False, True, True, True, True, True, False)
-            
+
             guild_settings_cache.set(cache_key, settings, 1800)  # 30 min cache
             return settings
-    
-    default_settings = {
-        "guild_id": guild_id,
-        "log_channel": None,
-        "welcome_channel": None,
-        "goodbye_channel": None,
-        "welcome_msg": None,
-        "goodbye_msg": None,
-        "invite_tracking": True,
-        "log_reactions": False,
-        "log_voice": True,
-        "log_threads": True,
-        "log_roles": True,
-        "log_channels": True,
-        "log_emojis": True,
-        "log_user_updates": False
-    }
-    
+
     return await safe_db_operation(
         f"get_guild_settings({guild_id})",
         _get_settings,
-        default_settings
+        {**_DEFAULT_SETTINGS, "guild_id": guild_id}
     )
 
+def get_guild_settings_cached(guild_id: int) -> Optional[Dict[str, Any]]:
+    """Synchronní fast-path pro event handlery: nastavení rovnou z cache
+    bez await (None při miss). Díky preload_all_settings je to prakticky
+    vždy hit, takže hot handlery neplatí coroutine round-trip; na miss
+    se padá zpět na get_guild_settings."""
+    return guild_settings_cache.get(f"guild_settings_{guild_id}")
+
+async def should_log(guild_id: int, kind: str, limiter, default: bool = True) -> bool:
+    """Kombinovaný guard hot handlerů: log_<kind> flag + token bucket.
+    Na cache hit (díky preload prakticky vždy) nic neawaituje; na miss
+    se nastavení dotáhne awaitem - get_guild_settings zapisuje výsledek
+    zpátky do cache, takže se rozhoduje podle skutečné hodnoty flagu
+    a ne podle defaultu sloupce (guilda s vypnutým logováním by jinak
+    po každé expiraci cache zase chvíli logovala). Token z limiteru
+    se spaluje jen při zapnutém logování."""
+    settings = get_guild_settings_cached(guild_id) or await get_guild_settings(guild_id)
+    if not settings.get(f"log_{kind}", default):
+        return False
+    return limiter.can_call(guild_id)
+
+# Whitelist sloupců pro update_guild_settings - klíč jde do SQL textu,
+# takže cokoli mimo seznam je chyba (a potenciální SQL injection)
+_ALLOWED_SETTINGS_KEYS = frozenset({
+    "log_channel", "welcome_channel", "goodbye_channel",
+    "welcome_msg", "goodbye_msg", "invite_tracking",
+    "log_reactions", "log_voice", "log_voice_join", "log_voice_move",
+    "log_voice_mute", "log_threads", "log_roles",
+    "log_channels", "log_emojis", "log_user_updates"
+})
+
+# SQL text per sloupec se skládá jen jednou - asyncpg pak na spojení
+# cachuje prepared statement podle textu, žádný re-parse/plan
+_update_settings_sql = {}
+
 async def update_guild_settings(guild_id: int, key: str, value):
+    if key not in _ALLOWED_SETTINGS_KEYS:
+        raise ValueError(f"Neplatný klíč nastavení: {key}")
+
+    sql = _update_settings_sql.get(key)
+    if sql is None:
+        sql = _update_settings_sql[key] = f'''
+            INSERT INTO guild_settings (guild_id, {key}, updated_at)
+            VALUES ($1, $2, CURRENT_TIMESTAMP)
+            ON CONFLICT (guild_id)
+            DO UPDATE SET {key} = EXCLUDED.{key}, updated_at = CURRENT_TIMESTAMP
+        '''
+
     async def _update_settings():
         async with db_manager.pool.acquire() as conn:
-            # Dynamicky vytvoř UPDATE na základě klíče
-            await conn.execute(f'''
-                INSERT INTO guild_settings (guild_id, {key}, updated_at) 
-                VALUES ($1, $2, CURRENT_TIMESTAMP)
-                ON CONFLICT (guild_id) 
-                DO UPDATE SET {key} = EXCLUDED.{key}, updated_at = CURRENT_TIMESTAMP
-            ''', guild_id, value)
-            
-            # Invalidate cache
+            await conn.execute(sql, guild_id, value)
+
+            # Místo invalidace aktualizuj cachované settings in-place -
+            # další čtení nemusí zpátky do databáze
             cache_key = f"guild_settings_{guild_id}"
-            guild_settings_cache.cache.pop(cache_key, None)
+            cached = guild_settings_cache.get(cache_key)
+            if cached is not None:
+                cached[key] = value
+                guild_settings_cache.set(cache_key, cached, 1800)
     
     await safe_db_operation(
         f"update_guild_settings({key})",
         _update_settings
     )
 
-# Utility funkce pro formátování časů
+# Koláčový graf přes Pillow místo matplotlibu - pieslice pro ≤8 výsečí
+# dá stejný vizuál za <10 ms a ~1 MB, žádný 800ms import ani 15MB figura
+def _render_pie(names, votes, colors, title):
+    from PIL import Image, ImageDraw, ImageFont
+
+    size = 800
+    legend_h = 40 + 28 * len(names)
+    img = Image.new('RGB', (size, size + legend_h), 'white')
+    draw = ImageDraw.Draw(img)
+
+    try:
+        font = ImageFont.truetype('DejaVuSans-Bold.ttf', 28)
+        small = ImageFont.truetype('DejaVuSans.ttf', 20)
+    except OSError:
+        font = ImageFont.load_default()
+        small = font
+
+    draw.text((size // 2, 20), title, fill='black', font=font, anchor='mm')
+
+    total = sum(votes) or 1
+    box = (100, 60, size - 100, size - 140)
+    start = -90.0  # Začátek nahoře jako u matplotlib startangle=90
+    for i, count in enumerate(votes):
+        end = start + 360.0 * count / total
+        draw.pieslice(box, start, end, fill=colors[i % len(colors)], outline='white')
+        start = end
+
+    # Legenda s procenty pod grafem
+    y = size - 110
+    for i, (name, count) in enumerate(zip(names, votes)):
+        pct = count / total * 100
+        draw.rectangle((60, y, 84, y + 20), fill=colors[i % len(colors)])
+        draw.text((94, y + 10), f"{name}: {count} ({pct:.1f}%)",
+                  fill='black', font=small, anchor='lm')
+        y += 28
+
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+# Utility funkce pro formátování časů - stejné datetime (created_at,
+# joined_at...) se v embedech opakují, memoizace ušetří timestamp()
+# konverzi i f-string skládání
+@lru_cache(maxsize=4096)
+def _fmt_timestamp(ts: int) -> str:
+    return f"<t:{ts}:F>"
+
 def format_timestamp(dt):
     if dt is None:
         return "Neznámo"
-    return f"<t:{int(dt.timestamp())}:F>"
+    return _fmt_timestamp(int(dt.timestamp()))
 
 # Cache pro invite tracking
 async def cache_guild_invites(guild):
@@ -300,125 +478,322 @@ async def cache_guild_invites(guild):
         invites = await guild.invites()
         invite_cache[guild.id] = {invite.code: invite.uses for invite in invites}
     except discord.Forbidden:
-        print(f"⚠️ Nemám oprávnění načíst pozvánky pro {guild.name}")
+        log.warning(f"⚠️ Nemám oprávnění načíst pozvánky pro {guild.name}")
+    except Exception as e:
+        log.warning(f"⚠️ Chyba při načítání pozvánek pro {guild.name}: {e}")
+
+# Audit log helper s rate limitingem - batch prefetch: jeden HTTP fetch
+# posledních 50 záznamů per guild se na 10 s sdílí mezi všechny lookupy,
+# filtrování akce i hledání cíle pak běží nad lokálním listem
+_audit_batch_cache = LRUCache(200)
+# Single-flight na rozběhnuté fetche - bulk delete vyvolá N eventů
+# najednou a všechny by minuly cache dřív, než ji první stihne naplnit
+_audit_inflight = {}
+
+async def _fetch_audit_batch(guild):
+    try:
+        return [e async for e in guild.audit_logs(limit=50)]
+    except discord.Forbidden:
+        return []
     except Exception as e:
-        print(f"⚠️ Chyba při načítání pozvánek pro {guild.name}: {e}")
+        log.warning(f"⚠️ Chyba při načítání audit logu: {e}")
+        return []
 
-# Audit log helper s rate limitingem
 async def get_audit_executor(guild, action, target_id, target_type='user'):
     cache_key = f"{guild.id}_{action}_{target_id}_{target_type}"
     cached = audit_cache.get(cache_key)
     if cached:
         return cached
-    
-    if not audit_rate_limiter.can_call(guild.id):
-        return None, None
-    
-    try:
-        async for entry in guild.audit_logs(action=action, limit=10):
-            if target_type == 'user' and hasattr(entry, 'user') and entry.user and entry.user.id == target_id:
+
+    # Guild-level batch: jeden REST fetch posledních 50 záznamů obslouží
+    # ~10 s všechny typy akcí - bulk operace (sync rolí, mazání kanálů)
+    # generují mix akcí a per-akce fetch by serializoval N REST volání
+    entries = _audit_batch_cache.get(guild.id)
+    if entries is None:
+        task = _audit_inflight.get(guild.id)
+        if task is None:
+            if not audit_rate_limiter.can_call(guild.id):
+                return None, None
+            task = asyncio.create_task(_fetch_audit_batch(guild))
+            _audit_inflight[guild.id] = task
+            task.add_done_callback(
+                lambda t, gid=guild.id: _audit_inflight.pop(gid, None)
+            )
+        entries = await task
+        _audit_batch_cache.set(guild.id, entries, 10)
+
+    for entry in entries:
+        if entry.action != action:
+            continue
+        # getattr s defaultem místo hasattr řetězů - jeden C call na atribut;
+        # obecná target větev pokrývá i 'user'/'channel' specializace
+        if target_type == 'user':
+            u = getattr(entry, 'user', None)
+            if u is not None and u.id == target_id:
                 result = (entry.user, entry.reason)
                 audit_cache.set(cache_key, result, 60)  # 1 min cache
                 return result
-            elif target_type == 'channel' and hasattr(entry, 'target') and entry.target and entry.target.id == target_id:
-                result = (entry.user, entry.reason)
-                audit_cache.set(cache_key, result, 60)
-                return result
-            elif hasattr(entry, 'target') and hasattr(entry.target, 'id') and entry.target.id == target_id:
-                result = (entry.user, entry.reason)
-                audit_cache.set(cache_key, result, 60)
-                return result
-    except discord.Forbidden:
-        pass
-    except Exception as e:
-        print(f"⚠️ Chyba při načítání audit logu: {e}")
-    
+        if getattr(getattr(entry, 'target', None), 'id', None) == target_id:
+            result = (entry.user, entry.reason)
+            audit_cache.set(cache_key, result, 60)
+            return result
+
     result = (None, None)
     audit_cache.set(cache_key, result, 30)  # Cache i negativní výsledky
     return result
 
-# Funkce pro posílání logů
+# Posílání logů jde přes dávkovou frontu: handler jen enqueuene a jediný
+# background task slije, co se mezitím nahromadilo, až po 10 embedech do
+# jednoho channel.send - pod burstem (mass role edit, voice churn) klesá
+# počet HTTP requestů až 10x. Osamocený embed se posílá hned, žádné
+# umělé zdržení se nepřidává.
+_LOG_QUEUE_MAX = 1000
+_log_send_queue = asyncio.Queue(_LOG_QUEUE_MAX)
+
 async def send_log(guild, embed):
     try:
-        settings = await get_guild_settings(guild.id)
-        log_channel_id = settings.get("log_channel")
-        if log_channel_id:
-            log_channel = guild.get_channel(log_channel_id)
-            if log_channel:
-                await log_channel.send(embed=embed)
-    except discord.Forbidden:
-        print(f"Nemám oprávnění posílat do log kanálu v {guild.name}")
-    except Exception as e:
-        print(f"Chyba při posílání logu: {e}")
+        _log_send_queue.put_nowait((guild, embed))
+    except asyncio.QueueFull:
+        # Drop-oldest backpressure - ztráta nejstaršího logu je menší zlo
+        # než blokování event handlerů na plné frontě
+        try:
+            _log_send_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        _log_send_queue.put_nowait((guild, embed))
+
+async def _drain_log_queue():
+    while True:
+        guild, embed = await _log_send_queue.get()
+        batches = {guild.id: (guild, [embed])}
+
+        # Přibal jen to, co už ve frontě čeká (max ~5 plných zpráv)
+        for _ in range(49):
+            try:
+                g, e = _log_send_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            batches.setdefault(g.id, (g, []))[1].append(e)
+
+        # Jeden timestamp na celý drain cyklus - pod burstem se
+        # datetime.now() nevolá pro každý embed zvlášť
+        now = now_utc()
+        for g, embeds in batches.values():
+            for e in embeds:
+                if e.timestamp is None:
+                    e.timestamp = now
+            try:
+                settings = get_guild_settings_cached(g.id) or await get_guild_settings(g.id)
+                log_channel_id = settings.get("log_channel")
+                if not log_channel_id:
+                    continue
+                log_channel = g.get_channel(log_channel_id)
+                if not log_channel:
+                    continue
+                for i in range(0, len(embeds), 10):  # Discord limit per zprávu
+                    await log_channel.send(embeds=embeds[i:i + 10])
+            except discord.Forbidden:
+                log.info(f"Nemám oprávnění posílat do log kanálu v {g.name}")
+            except Exception as e:
+                log.error(f"Chyba při posílání logu: {e}")
 
 # Cache cleanup task
 async def preload_all_settings():
-    """Preload všech nastavení pro všechny guilds při startu"""
+    """Preload všech nastavení pro všechny guilds při startu.
+
+    Místo N dotazů (jeden na guildu) jde všechno jedním SELECT s
+    guild_id = ANY($1) - startup platí 1 RTT místo N×RTT."""
     if not db_manager.pool:
-        print("⚠️ Databáze není připojena, přeskakuji preload nastavení")
+        log.warning("⚠️ Databáze není připojena, přeskakuji preload nastavení")
         return
-        
+
     try:
-        loaded_count = 0
-        for guild in bot.guilds:
-            # Načti základní nastavení
-            await get_guild_settings(guild.id)
-            
-            # Načti ticket nastavení (pokud existuje ticket_manager)
-            if hasattr(bot, 'ticket_manager') and bot.ticket_manager:
-                try:
-                    await bot.ticket_manager.ticket_db.get_settings(guild.id)
-                except Exception as e:
-                    print(f"⚠️ Chyba při načítání ticket nastavení pro {guild.name}: {e}")
-            
-            # Načti election nastavení
-            try:
-                await get_current_election_type(guild.id)
-                await get_voting_ui_type(guild.id)
-            except Exception as e:
-                print(f"⚠️ Chyba při načítání election nastavení pro {guild.name}: {e}")
-            
-            loaded_count += 1
-        
-        print(f"📋 Preload dokončen: {loaded_count} serverů načteno do cache")
-        
+        ids = [g.id for g in bot.guilds]
+        if not ids:
+            return
+
+        async with db_manager.pool.acquire() as conn:
+            # Guild settings jedním dotazem
+            rows = await conn.fetch(
+                'SELECT * FROM guild_settings WHERE guild_id = ANY($1::bigint[])', ids
+            )
+            seen = set()
+            for row in rows:
+                guild_settings_cache.set(f"guild_settings_{row['guild_id']}", dict(row), 1800)
+                seen.add(row['guild_id'])
+
+            # Chybějícím guildám založ defaulty jedním executemany
+            missing = [gid for gid in ids if gid not in seen]
+            if missing:
+                await conn.executemany('''
+                    INSERT INTO guild_settings (guild_id, invite_tracking, log_reactions, log_voice,
+                                               log_threads, log_roles, log_channels, log_emojis, log_user_updates)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                    ON CONFLICT (guild_id) DO NOTHING
+                ''', [(gid, True, False, True, True, True, True, True, False) for gid in missing])
+
+            # Election nastavení stejným vzorem (jeden SELECT, defaulty pro zbytek)
+            election_rows = await conn.fetch(
+                'SELECT guild_id, current_type, voting_ui FROM rp_election_settings WHERE guild_id = ANY($1::bigint[])',
+                ids
+            )
+            election_seen = set()
+            for row in election_rows:
+                election_cache.set(f"election_type_{row['guild_id']}", row['current_type'] or 'presidential', 1800)
+                election_cache.set(f"voting_ui_{row['guild_id']}", row['voting_ui'] or 'buttons', 1800)
+                election_seen.add(row['guild_id'])
+            for gid in ids:
+                if gid not in election_seen:
+                    election_cache.set(f"election_type_{gid}", 'presidential', 1800)
+                    election_cache.set(f"voting_ui_{gid}", 'buttons', 1800)
+
+        # Ticket nastavení už batchuje TicketDatabase.preload_settings
+        # v setup_persistent_views - tady se neduplikuje
+
+        log.info(f"📋 Preload dokončen: {len(ids)} serverů načteno do cache ({len(missing)} nově založeno)")
+
     except Exception as e:
-        print(f"❌ Chyba při preload nastavení: {e}")
+        log.error(f"❌ Chyba při preload nastavení: {e}")
 
 
 @tasks.loop(hours=1)
 async def cleanup_caches():
-    """Čistí expirované záznamy z cache"""
+    """Ohraničuje paměť cache a loguje statistiky.
+
+    Expirace je jinak líná - get() evikuje prošlé záznamy inline a
+    cleanup_expired() jde přes expirační heap, takže stojí O(prošlých),
+    ne O(všech). Hodinový běh jen uvolní paměť po klíčích, na které se
+    už nikdo neptá."""
     try:
         expired_audit = audit_cache.cleanup_expired()
         expired_guild = guild_settings_cache.cleanup_expired()
         expired_voice = voice_event_cache.cleanup_expired()
         expired_election = election_cache.cleanup_expired()
-        
-        print(f"🧹 Cache cleanup: {expired_audit} audit, {expired_guild} guild, {expired_voice} voice, {expired_election} election")
-        
-        # Cleanup starých voice debounce tasků
-        current_time = time.time()
-        old_tasks = []
-        for key, task in voice_debounce_tasks.items():
-            if task.done() or task.cancelled():
-                old_tasks.append(key)
-        
-        for key in old_tasks:
-            voice_debounce_tasks.pop(key, None)
-        
-        if old_tasks:
-            print(f"🧹 Vyčištěno {len(old_tasks)} starých voice tasků")
-            
+
+        log.info(f"🧹 Cache cleanup: {expired_audit} audit, {expired_guild} guild, {expired_voice} voice, {expired_election} election")
+        log.info(f"🧹 Cache velikosti: {len(audit_cache.cache)} audit, {len(guild_settings_cache.cache)} guild, "
+                 f"{len(voice_event_cache.cache)} voice, {len(election_cache.cache)} election")
+
+        # Voice debounce tasky se uklízí samy přes done-callback,
+        # žádný sken tady není potřeba
+
+    except Exception as e:
+        log.error(f"❌ Chyba při cache cleanup: {e}")
+
+# Handlery component interakcí - dispatch přes tuple prefixů místo
+# if/elif řetězu; vote_select_ musí být před vote_, jinak by select
+# spadl do button větve (int('select') -> ValueError)
+async def _handle_close_ticket(interaction, custom_id):
+    try:
+        if hasattr(bot, 'ticket_manager'):
+            await bot.ticket_manager.close_ticket(
+                interaction.channel,
+                interaction.user,
+                "Zavřeno přes tlačítko"
+            )
+            await interaction.response.send_message("🔒 Ticket je zavírán...", ephemeral=True)
+        else:
+            await interaction.response.send_message("❌ Ticket systém není dostupný.", ephemeral=True)
     except Exception as e:
-        print(f"❌ Chyba při cache cleanup: {e}")
+        log.error(f"Chyba při zavírání ticketu: {e}")
+        try:
+            await interaction.response.send_message("❌ Chyba při zavírání ticketu.", ephemeral=True)
+        except:
+            pass
+
+async def _handle_vote_select(interaction, custom_id):
+    send = interaction.response.send_message
+    try:
+        parts = custom_id.split('_', 3)
+        if len(parts) >= 3:
+            guild_id = int(parts[2])
+
+            if interaction.guild.id == guild_id:
+                candidate_id = int(interaction.data['values'][0])
+                await handle_vote(interaction, candidate_id)
+            else:
+                await send("❌ Toto hlasování není pro tento server.", ephemeral=True)
+    except (ValueError, IndexError, KeyError) as e:
+        log.error(f"Chyba při zpracování voting select: {e}")
+        try:
+            await send("❌ Chyba při zpracování hlasu.", ephemeral=True)
+        except:
+            pass
+
+async def _handle_vote_button(interaction, custom_id):
+    send = interaction.response.send_message
+    try:
+        parts = custom_id.split('_', 3)
+        if len(parts) >= 3:
+            guild_id = int(parts[1])
+            candidate_id = int(parts[2])
+
+            if interaction.guild.id == guild_id:
+                await handle_vote(interaction, candidate_id)
+            else:
+                await send("❌ Toto hlasování není pro tento server.", ephemeral=True)
+    except (ValueError, IndexError) as e:
+        log.error(f"Chyba při zpracování voting button: {e}")
+        try:
+            await send("❌ Chyba při zpracování hlasu.", ephemeral=True)
+        except:
+            pass
+
+async def _handle_ticket_component(interaction, custom_id):
+    # Ticket panel komponenty - views se nafukují líně při první interakci
+    try:
+        tm = getattr(bot, 'ticket_manager', None)
+        if not tm:
+            return
+
+        settings = await tm.ensure_guild_view(interaction.guild.id, custom_id)
+        if settings is None:
+            # View už je zaregistrované a custom_id mu patří - interakci
+            # obslouží samo; legacy ids propadnou níž do _button_map
+            return
+
+        if custom_id.startswith('ticket_select_'):
+            label = interaction.data['values'][0]
+            entry = next(
+                ((lbl, msg) for lbl, msg in settings.get("custom_buttons", [])
+                 if lbl == label),
+                None
+            )
+        else:
+            # O(1) lookup v předpočítané mapě hash -> (label, msg)
+            entry = settings.get("_button_map", {}).get(custom_id[7:])
+
+        if entry:
+            button_info = {'name': entry[0], 'message': entry[1]}
+            await handle_ticket_creation(interaction, button_info, tm)
+        else:
+            # Tlačítko z panelu, který už neodpovídá aktuální konfiguraci
+            # (smazané tlačítko apod.) - neodpovědět by znamenalo tiché
+            # "interaction failed" bez jediné stopy v logu
+            log.warning(f"Neznámé ticket custom_id {custom_id} v guildě {interaction.guild.id}")
+            await interaction.response.send_message(
+                "❌ Tento panel je zastaralý, požádej admina o nový.", ephemeral=True
+            )
+    except Exception as e:
+        log.error(f"Chyba při zpracování ticket komponenty: {e}")
+        try:
+            await interaction.response.send_message("❌ Chyba při vytváření ticketu.", ephemeral=True)
+        except:
+            pass
+
+_INTERACTION_HANDLERS = (
+    ('close_ticket_', _handle_close_ticket),
+    ('vote_select_', _handle_vote_select),
+    ('vote_', _handle_vote_button),
+    ('ticket_', _handle_ticket_component),
+)
 
 @bot.event
 async def on_ready():
-    print(f"✅ Přihlášen jako {bot.user}")
+    log.info(f"✅ Přihlášen jako {bot.user}")
     
     # Zaznamenej start time pro uptime tracking
-    bot.start_time = datetime.now(timezone.utc)
+    bot.start_time = now_utc()
     
     # Inicializace databáze s novým DatabaseManager
     await db_manager.initialize()
@@ -428,116 +803,81 @@ async def on_ready():
         ticket_manager = TicketManager(bot, db_manager)
         await ticket_manager.setup_persistent_views()
         bot.ticket_manager = ticket_manager
-        print("✅ Ticket systém inicializován")
+        log.info("✅ Ticket systém inicializován")
         
         # Načtení ticket commands
         try:
             from bot.commands.tickets import TicketCommands
             await bot.add_cog(TicketCommands(bot))
-            print("✅ Ticket příkazy načteny")
+            log.info("✅ Ticket příkazy načteny")
         except Exception as e:
-            print(f"❌ Chyba při načítání ticket příkazů: {e}")
-            print("⚠️ Ticket systém nebude plně funkční")
+            log.error(f"❌ Chyba při načítání ticket příkazů: {e}")
+            log.warning("⚠️ Ticket systém nebude plně funkční")
         
         # Setup globálního interaction handleru pro všechny persistent views
         @bot.event
         async def on_interaction(interaction):
             if interaction.type == discord.InteractionType.component:
-                custom_id = interaction.data.get('custom_id', '')
-                
-                # Handle ticket close button patterny
-                if custom_id.startswith('close_ticket_'):
-                    try:
-                        if hasattr(bot, 'ticket_manager'):
-                            await bot.ticket_manager.close_ticket(
-                                interaction.channel,
-                                interaction.user, 
-                                "Zavřeno přes tlačítko"
-                            )
-                            await interaction.response.send_message("🔒 Ticket je zavírán...", ephemeral=True)
-                        else:
-                            await interaction.response.send_message("❌ Ticket systém není dostupný.", ephemeral=True)
+                # Hot path (50+ interakcí/s na aktivních serverech) -
+                # lokály místo opakovaných attribute-chain lookupů
+                data = interaction.data
+                custom_id = data.get('custom_id', '') if data else ''
+                for prefix, handler in _INTERACTION_HANDLERS:
+                    if custom_id.startswith(prefix):
+                        await handler(interaction, custom_id)
                         return
-                    except Exception as e:
-                        print(f"Chyba při zavírání ticketu: {e}")
-                        try:
-                            await interaction.response.send_message("❌ Chyba při zavírání ticketu.", ephemeral=True)
-                        except:
-                            pass
-                        return
-                
-                
-                # Handle voting button patterny
-                elif custom_id.startswith('vote_') and len(custom_id.split('_')) >= 3:
-                    try:
-                        parts = custom_id.split('_')
-                        if parts[0] == 'vote':
-                            guild_id = int(parts[1]) 
-                            candidate_id = int(parts[2])
-                            
-                            if interaction.guild.id == guild_id:
-                                await handle_vote(interaction, candidate_id)
-                                return
-                            else:
-                                await interaction.response.send_message("❌ Toto hlasování není pro tento server.", ephemeral=True)
-                                return
-                    except (ValueError, IndexError) as e:
-                        print(f"Chyba při zpracování voting button: {e}")
-                        try:
-                            await interaction.response.send_message("❌ Chyba při zpracování hlasu.", ephemeral=True)
-                        except:
-                            pass
-                        return
-                
-                # Handle voting select patterny  
-                elif custom_id.startswith('vote_select_'):
-                    try:
-                        parts = custom_id.split('_')
-                        if len(parts) >= 4:
-                            guild_id = int(parts[2])
-                            
-                            if interaction.guild.id == guild_id:
-                                candidate_id = int(interaction.data['values'][0])
-                                await handle_vote(interaction, candidate_id)
-                                return
-                            else:
-                                await interaction.response.send_message("❌ Toto hlasování není pro tento server.", ephemeral=True)
-                                return
-                    except (ValueError, IndexError, KeyError) as e:
-                        print(f"Chyba při zpracování voting select: {e}")
-                        try:
-                            await interaction.response.send_message("❌ Chyba při zpracování hlasu.", ephemeral=True)
-                        except:
-                            pass
-                        return
-        
-        print("✅ Globální interaction handler inicializován (voting + tickets)")
+
+        log.info("✅ Globální interaction handler inicializován (voting + tickets)")
     
     # Spuštění cache cleanup tasku
     if not cleanup_caches.is_running():
         cleanup_caches.start()
-        print("🧹 Cache cleanup task spuštěn")
+        log.info("🧹 Cache cleanup task spuštěn")
+
+    # Drain task pro dávkové posílání logů (on_ready se opakuje po
+    # reconnectu, task se startuje jen jednou)
+    if not hasattr(bot, "_log_sender_task") or bot._log_sender_task.done():
+        bot._log_sender_task = asyncio.create_task(_drain_log_queue())
+        log.info("📨 Log batching task spuštěn")
+
+    # Healthcheck server na stejném loopu (viz keep_alive.py) - startuje
+    # se jen jednou, on_ready se po reconnectu opakuje
+    if getattr(bot, "_keepalive_runner", None) is None:
+        try:
+            bot._keepalive_runner = await keep_alive()
+            log.info("🌐 Healthcheck server spuštěn")
+        except OSError as e:
+            log.error(f"Healthcheck server se nepodařilo spustit: {e}")
     
     # Test databázového připojení pouze pokud máme databázi
     if db_manager.pool:
         try:
             test_guild_id = 123456789  # Test ID
             test_settings = await get_guild_settings(test_guild_id)
-            print(f"🔍 Test databáze - načtena nastavení: {test_settings}")
+            log.info(f"🔍 Test databáze - načtena nastavení: {test_settings}")
         except Exception as e:
-            print(f"❌ Test databáze selhal: {e}")
+            log.error(f"❌ Test databáze selhal: {e}")
     
     # Preload nastavení pro všechny guilds
     await preload_all_settings()
     
-    # Load existing invites do cache
-    for guild in bot.guilds:
-        await cache_guild_invites(guild)
-    
-    print(f"🔄 Připraven sledovat {len(bot.guilds)} serverů")
+    # Naplň reverzní index členství pro on_user_update
+    for g in bot.guilds:
+        _index_guild_members(g)
+
+    # Load existing invites do cache - souběžně přes gather, jedna pomalá
+    # guilda nedrží ostatní (startup ~RTT místo N×RTT)
+    if bot.guilds:
+        await asyncio.gather(
+            *(cache_guild_invites(g) for g in bot.guilds),
+            return_exceptions=True
+        )
+
+    log.info(f"🔄 Připraven sledovat {len(bot.guilds)} serverů")
 
 @bot.event
 async def on_guild_join(guild):
+    _index_guild_members(guild)
     await cache_guild_invites(guild)
     
     # Preload nastavení pro nový server
@@ -545,9 +885,18 @@ async def on_guild_join(guild):
         await get_guild_settings(guild.id)
         await get_current_election_type(guild.id)  
         await get_voting_ui_type(guild.id)
-        print(f"📋 Načtena nastavení pro nový server: {guild.name}")
+        log.info(f"📋 Načtena nastavení pro nový server: {guild.name}")
     except Exception as e:
-        print(f"⚠️ Chyba při načítání nastavení pro {guild.name}: {e}")
+        log.warning(f"⚠️ Chyba při načítání nastavení pro {guild.name}: {e}")
+
+@bot.event
+async def on_guild_remove(guild):
+    # Bulk-cancel čekajících voice debounce tasků a úklid invite cache
+    cancel_guild_voice_tasks(guild.id)
+    invite_cache.pop(guild.id, None)
+    # Odstraň guildu z reverzního indexu členství
+    for guild_ids in _user_guilds.values():
+        guild_ids.discard(guild.id)
 
 # Příkazy
 @bot.command()
@@ -575,7 +924,7 @@ async def set_goodbye(ctx, channel: discord.TextChannel, *, message: str):
 async def bot_health(ctx):
     """Zobrazí health status bota"""
     try:
-        embed = discord.Embed(title="🏥 Bot Health Status", color=discord.Color.blue())
+        embed = discord.Embed(title="🏥 Bot Health Status", color=_BLUE)
         
         # Database status
         db_status = "🟢 Online" if db_manager.pool else "🔴 Offline"
@@ -583,7 +932,7 @@ async def bot_health(ctx):
         
         # Uptime
         if hasattr(bot, 'start_time'):
-            uptime = datetime.now(timezone.utc) - bot.start_time
+            uptime = now_utc() - bot.start_time
             hours, remainder = divmod(int(uptime.total_seconds()), 3600)
             minutes, seconds = divmod(remainder, 60)
             uptime_str = f"{hours}h {minutes}m {seconds}s"
@@ -602,7 +951,7 @@ async def bot_health(ctx):
         else:
             embed.add_field(name="🎫 Ticket systém", value="🔴 Neaktivní", inline=True)
         
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await ctx.send(embed=embed)
         
     except Exception as e:
@@ -624,9 +973,11 @@ async def toggle_invites(ctx):
 @commands.has_permissions(administrator=True) 
 async def toggle_log(ctx, log_type: str):
     """Zapne/vypne určitý typ logování
-    Dostupné typy: reactions, voice, threads, roles, channels, emojis, user_updates"""
-    
-    valid_types = ["reactions", "voice", "threads", "roles", "channels", "emojis", "user_updates"]
+    Dostupné typy: reactions, voice, voice_join, voice_move, voice_mute,
+    threads, roles, channels, emojis, user_updates"""
+
+    valid_types = ["reactions", "voice", "voice_join", "voice_move", "voice_mute",
+                   "threads", "roles", "channels", "emojis", "user_updates"]
     
     if log_type.lower() not in valid_types:
         await ctx.send(f"❌ Neplatný typ! Dostupné: {', '.join(valid_types)}")
@@ -647,11 +998,14 @@ async def log_status(ctx):
     """Zobrazí stav všech logging nastavení"""
     settings = await get_guild_settings(ctx.guild.id)
     
-    embed = discord.Embed(title="📊 Stav logování", color=discord.Color.blue())
+    embed = discord.Embed(title="📊 Stav logování", color=_BLUE)
     
     log_settings = [
         ("Reactions", settings.get("log_reactions", False)),
-        ("Voice", settings.get("log_voice", True)), 
+        ("Voice", settings.get("log_voice", True)),
+        ("Voice Join/Leave", settings.get("log_voice_join", True)),
+        ("Voice Move", settings.get("log_voice_move", True)),
+        ("Voice Mute/Deaf", settings.get("log_voice_mute", False)),
         ("Threads", settings.get("log_threads", True)),
         ("Roles", settings.get("log_roles", True)),
         ("Channels", settings.get("log_channels", True)),
@@ -678,7 +1032,8 @@ async def log_status(ctx):
 @commands.has_permissions(administrator=True)
 async def log_enable_all(ctx):
     """Zapne všechny typy logování"""
-    log_types = ["reactions", "voice", "threads", "roles", "channels", "emojis", "user_updates"]
+    log_types = ["reactions", "voice", "voice_join", "voice_move", "voice_mute",
+                 "threads", "roles", "channels", "emojis", "user_updates"]
     
     for log_type in log_types:
         settings_key = f"log_{log_type}"
@@ -687,7 +1042,7 @@ async def log_enable_all(ctx):
     embed = discord.Embed(
         title="✅ Všechno logování zapnuto", 
         description="Všechny typy logování byly aktivovány.",
-        color=discord.Color.green()
+        color=_GREEN
     )
     embed.add_field(
         name="Aktivované typy", 
@@ -701,7 +1056,8 @@ async def log_enable_all(ctx):
 @commands.has_permissions(administrator=True)
 async def log_disable_all(ctx):
     """Vypne všechny typy logování (kromě základních)"""
-    log_types = ["reactions", "voice", "threads", "roles", "channels", "emojis", "user_updates"]
+    log_types = ["reactions", "voice", "voice_join", "voice_move", "voice_mute",
+                 "threads", "roles", "channels", "emojis", "user_updates"]
     
     for log_type in log_types:
         settings_key = f"log_{log_type}"
@@ -710,7 +1066,7 @@ async def log_disable_all(ctx):
     embed = discord.Embed(
         title="🔴 Rozšířené logování vypnuto", 
         description="Všechny rozšířené typy logování byly deaktivovány.\nZákladní logy (zprávy, bany, členi) zůstávají aktivní.",
-        color=discord.Color.red()
+        color=_RED
     )
     embed.add_field(
         name="Deaktivované typy", 
@@ -727,6 +1083,9 @@ async def log_reset(ctx):
     default_settings = {
         "log_reactions": False,      # Defaultně vypnuté kvůli spamu
         "log_voice": True,           # Voice události
+        "log_voice_join": True,      # Připojení/odpojení z voice
+        "log_voice_move": True,      # Přepnutí voice kanálu
+        "log_voice_mute": False,     # Mute/deaf toggly (spam)
         "log_threads": True,         # Thread události
         "log_roles": True,           # Role události  
         "log_channels": True,        # Channel události
@@ -740,7 +1099,7 @@ async def log_reset(ctx):
     embed = discord.Embed(
         title="🔄 Logování resetováno", 
         description="Nastavení logování bylo obnoveno na výchozí hodnoty.",
-        color=discord.Color.blue()
+        color=_BLUE
     )
     
     enabled = [k.replace("log_", "").capitalize() for k, v in default_settings.items() if v]
@@ -769,6 +1128,28 @@ async def db_test(ctx):
     except Exception as e:
         await ctx.send(f"❌ Databáze ERROR: {e}")
 
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def db_stats(ctx):
+    """Zobrazí statistiky databázového poolu"""
+    try:
+        pool = db_manager.pool
+        if not pool:
+            await ctx.send("❌ Databáze není připojena")
+            return
+
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+
+        embed = discord.Embed(title="📊 Database Pool", color=_BLUE)
+        embed.add_field(name="Otevřená spojení", value=f"{size} (min {pool.get_min_size()}, max {pool.get_max_size()})", inline=True)
+        embed.add_field(name="Volná / vytížená", value=f"{idle} / {size - idle}", inline=True)
+        embed.timestamp = now_utc()
+
+        await ctx.send(embed=embed)
+    except Exception as e:
+        await ctx.send(f"❌ Chyba při čtení pool statistik: {e}")
+
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def cleanup_cache(ctx):
@@ -781,23 +1162,15 @@ async def cleanup_cache(ctx):
         expired_voice = voice_event_cache.cleanup_expired()
         expired_election = election_cache.cleanup_expired()
         
-        embed = discord.Embed(title="🧹 Cache Cleanup", color=discord.Color.green())
+        embed = discord.Embed(title="🧹 Cache Cleanup", color=_GREEN)
         embed.add_field(name="Audit cache", value=f"Vyčištěno {expired_audit} záznamů", inline=True)
         embed.add_field(name="Guild cache", value=f"Vyčištěno {expired_guild} záznamů", inline=True)
         embed.add_field(name="Voice cache", value=f"Vyčištěno {expired_voice} záznamů", inline=True)
         embed.add_field(name="Election cache", value=f"Vyčištěno {expired_election} záznamů", inline=True)
         
-        # Cleanup voice debounce tasks
-        old_tasks = []
-        for key, task in voice_debounce_tasks.items():
-            if task.done() or task.cancelled():
-                old_tasks.append(key)
-        
-        for key in old_tasks:
-            voice_debounce_tasks.pop(key, None)
-        
-        embed.add_field(name="Voice tasks", value=f"Vyčištěno {len(old_tasks)} tasků", inline=True)
-        embed.timestamp = datetime.now(timezone.utc)
+        # Voice debounce tasky se uklízí samy přes done-callback
+        embed.add_field(name="Voice tasks", value=f"Aktivních {len(voice_debounce_tasks)} tasků", inline=True)
+        embed.timestamp = now_utc()
         
         await ctx.send(embed=embed)
         
@@ -833,17 +1206,89 @@ async def upravit_kandidata(ctx, candidate_id: int, *, new_name: str):
                 SET name = $1 
                 WHERE id = $2 AND guild_id = $3
             ''', new_name, candidate_id, ctx.guild.id)
-            
+
+            # Udrž denormalizované jméno v rp_votes (viz idx_rp_votes_list)
+            await conn.execute('''
+                UPDATE rp_votes SET candidate_name = $1 WHERE candidate_id = $2
+            ''', new_name, candidate_id)
+
             return old_name
     
     result = await safe_db_operation("edit_candidate", _edit_candidate)
-    
+
     if result:
+        invalidate_candidates_cache(ctx.guild.id)
         await ctx.send(f"✅ Kandidát změněn z **{result}** na **{new_name}**")
     else:
         await ctx.send("❌ Kandidát s tímto ID nebyl nalezen!")
 
 # RP VOLBY PŘÍKAZY
+# SQL hot dotazů jako konstanty - stejný text znamená hit v asyncpg
+# statement cache (žádný re-parse/plan per volání)
+_SQL_ELECTION_TYPE = 'SELECT current_type FROM rp_election_settings WHERE guild_id = $1'
+_SQL_VOTING_UI = 'SELECT voting_ui FROM rp_election_settings WHERE guild_id = $1'
+# 14-denní eligibility je i v INSERTu ($4 = joined_at) - kontrola a zápis
+# jsou atomické, double-click ani obejití Python větve hlas neprotlačí.
+# Duplicitní hlas řeší UNIQUE(guild_id, user_id) + ON CONFLICT DO NOTHING
+# místo SELECT-pak-INSERT (žádná TOCTOU race pod souběžnými kliky)
+_SQL_VOTE_CTE = '''
+    WITH ins AS (
+        INSERT INTO rp_votes (guild_id, user_id, candidate_id, candidate_name, election_type)
+        SELECT $1, $2, $3, c.name, c.election_type
+        FROM rp_candidates c
+        WHERE c.id = $3
+          AND ($4::timestamptz IS NULL OR $4 <= NOW() - INTERVAL '14 days')
+        ON CONFLICT (guild_id, user_id) DO NOTHING
+        RETURNING candidate_id
+    )
+    SELECT
+        (SELECT name FROM rp_candidates WHERE id = $3) AS name,
+        EXISTS (SELECT 1 FROM ins) AS inserted,
+        ($4::timestamptz IS NULL OR $4 <= NOW() - INTERVAL '14 days') AS eligible
+'''
+
+# Registrace do init callbacku poolu - nové spojení má tyhle dotazy
+# naparsované dřív, než na něj dopadne první příkaz
+HOT_STATEMENTS['election_type'] = _SQL_ELECTION_TYPE
+HOT_STATEMENTS['voting_ui'] = _SQL_VOTING_UI
+HOT_STATEMENTS['vote'] = _SQL_VOTE_CTE
+
+def _prepared(conn, name):
+    """Vrátí prepared handle z warm-upu spojení (None = jede se přes
+    statement cache, např. ve fallback režimu bez bot modulů)"""
+    return getattr(conn, '_limovec_prepared', {}).get(name)
+
+async def set_election_settings_bulk(updates):
+    """Upsertne election settings pro libovolný počet guild v jednom
+    round-tripu - executemany řádky pipeline-uje, takže budoucí batch
+    admin příkazy neplatí N+1 INSERTů.
+
+    updates: seznam (guild_id, current_type, voting_ui); None ponechá
+    stávající hodnotu sloupce."""
+    updates = list(updates)
+
+    async def _set_bulk():
+        async with db_manager.pool.acquire() as conn:
+            await conn.executemany('''
+                INSERT INTO rp_election_settings (guild_id, current_type, voting_ui, updated_at)
+                VALUES ($1, COALESCE($2, 'presidential'), COALESCE($3, 'buttons'), CURRENT_TIMESTAMP)
+                ON CONFLICT (guild_id) DO UPDATE SET
+                current_type = COALESCE($2, rp_election_settings.current_type),
+                voting_ui = COALESCE($3, rp_election_settings.voting_ui),
+                updated_at = CURRENT_TIMESTAMP
+            ''', updates)
+
+        # Zapsané hodnoty rovnou do cache (write-through), nezměněné klíče
+        # se nechávají být
+        for guild_id, current_type, voting_ui in updates:
+            if current_type is not None:
+                election_cache.set(f"election_type_{guild_id}", current_type, 1800)
+            if voting_ui is not None:
+                election_cache.set(f"voting_ui_{guild_id}", voting_ui, 1800)
+        return True
+
+    return await safe_db_operation("set_election_settings_bulk", _set_bulk, False)
+
 async def get_current_election_type(guild_id: int) -> str:
     """Získá typ aktuálních voleb"""
     cache_key = f"election_type_{guild_id}"
@@ -853,7 +1298,9 @@ async def get_current_election_type(guild_id: int) -> str:
     
     async def _get_type():
         async with db_manager.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT current_type FROM rp_election_settings WHERE guild_id = $1', guild_id)
+            stmt = _prepared(conn, 'election_type')
+            row = await (stmt.fetchrow(guild_id) if stmt
+                         else conn.fetchrow(_SQL_ELECTION_TYPE, guild_id))
             result = row['current_type'] if row else 'presidential'
             election_cache.set(cache_key, result, 1800)  # 30 min cache
             return result
@@ -869,13 +1316,44 @@ async def get_voting_ui_type(guild_id: int) -> str:
     
     async def _get_ui():
         async with db_manager.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT voting_ui FROM rp_election_settings WHERE guild_id = $1', guild_id)
+            stmt = _prepared(conn, 'voting_ui')
+            row = await (stmt.fetchrow(guild_id) if stmt
+                         else conn.fetchrow(_SQL_VOTING_UI, guild_id))
             result = row['voting_ui'] if row else 'buttons'
             election_cache.set(cache_key, result, 1800)  # 30 min cache
             return result
     
     return await safe_db_operation("get_voting_ui", _get_ui, 'buttons')
 
+async def get_candidates(guild_id: int, election_type: str):
+    """Kandidáti pro (guild, typ voleb) - mění se vzácně, takže se drží
+    v election_cache a zápisové příkazy cache invalidují"""
+    cache_key = f"candidates_{guild_id}_{election_type}"
+    cached = election_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    async def _get_candidates():
+        async with db_manager.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT id, name FROM rp_candidates
+                WHERE guild_id = $1 AND election_type = $2
+                ORDER BY created_at
+            ''', guild_id, election_type)
+            # Record podporuje ['klíč'] přímo - dict konverze by jen
+            # alokovala kopii per řádek
+            election_cache.set(cache_key, rows, 1800)
+            return rows
+
+    return await safe_db_operation("get_candidates", _get_candidates, [])
+
+def invalidate_candidates_cache(guild_id: int):
+    """Zahodí cachované seznamy kandidátů guildy (oba typy voleb)"""
+    for etype in ('presidential', 'parliamentary'):
+        election_cache.cache.pop(f"candidates_{guild_id}_{etype}", None)
+        for dropdown in (True, False):
+            _voting_views.pop((guild_id, etype, dropdown), None)
+
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def nastavit_volby(ctx, election_type: str):
@@ -884,20 +1362,7 @@ async def nastavit_volby(ctx, election_type: str):
         await ctx.send("❌ Neplatný typ voleb! Použij: `presidential` nebo `parliamentary`")
         return
     
-    async def _set_election():
-        async with db_manager.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO rp_election_settings (guild_id, current_type, updated_at)
-                VALUES ($1, $2, CURRENT_TIMESTAMP)
-                ON CONFLICT (guild_id) DO UPDATE SET
-                current_type = EXCLUDED.current_type, updated_at = CURRENT_TIMESTAMP
-            ''', ctx.guild.id, election_type.lower())
-            
-            # Invalidate cache
-            cache_key = f"election_type_{ctx.guild.id}"
-            election_cache.cache.pop(cache_key, None)
-    
-    await safe_db_operation("set_election_type", _set_election)
+    await set_election_settings_bulk([(ctx.guild.id, election_type.lower(), None)])
     await ctx.send(f"✅ Typ voleb nastaven na: **{election_type.capitalize()}**")
 
 @bot.command()
@@ -920,84 +1385,92 @@ async def pridat_kandidata(ctx, *, name: str):
             ''', ctx.guild.id, name, election_type, ctx.author.id)
     
     await safe_db_operation("add_candidate", _add_candidate)
+    invalidate_candidates_cache(ctx.guild.id)
     await ctx.send(f"✅ {'Kandidát' if election_type == 'presidential' else 'Strana'} **{name}** {'přidán' if election_type == 'presidential' else 'přidána'}!")
 
-@bot.command()  
+# Voting views na module-level - třídy se nekompilují znovu při každém
+# !volit a deterministické custom_id umožňují registraci persistent views
+class VotingSelect(discord.ui.Select):
+    def __init__(self, guild_id, election_type, candidates_list):
+        options = [
+            discord.SelectOption(
+                label=candidate['name'][:100],
+                value=str(candidate['id']),
+                description=f"Hlasovat pro {candidate['name']}"[:100]
+            )
+            for candidate in candidates_list[:25]  # Discord limit
+        ]
+        super().__init__(
+            placeholder=f"Vyber {'kandidáta' if election_type == 'presidential' else 'stranu'}...",
+            options=options,
+            custom_id=f"vote_select_{guild_id}_{election_type}"
+        )
+
+    async def callback(self, interaction: discord.Interaction):
+        candidate_id = int(self.values[0])
+        await handle_vote(interaction, candidate_id)
+
+class VotingView(discord.ui.View):
+    def __init__(self, guild_id, election_type, candidates_list, use_dropdown):
+        super().__init__(timeout=None)  # Persistent view
+        if use_dropdown:
+            self.add_item(VotingSelect(guild_id, election_type, candidates_list))
+        else:
+            for candidate in candidates_list[:20]:  # Discord limit
+                button = discord.ui.Button(
+                    label=candidate['name'][:80],
+                    style=discord.ButtonStyle.primary,
+                    custom_id=f"vote_{guild_id}_{candidate['id']}"
+                )
+                button.callback = self._make_callback(candidate['id'])
+                self.add_item(button)
+
+    @staticmethod
+    def _make_callback(candidate_id):
+        async def callback(interaction: discord.Interaction):
+            await handle_vote(interaction, candidate_id)
+        return callback
+
+# Reuse view instancí - každé !volit dřív vytvářelo nový VotingView a
+# stavělo stejné komponenty znovu; jedna instance per (guild, typ, UI)
+# žije, dokud se nezmění seznam kandidátů
+_voting_views = {}
+
+def get_voting_view(guild_id, election_type, candidates_list, use_dropdown):
+    """Vrátí cachovaný VotingView, nebo postaví nový při změně kandidátů"""
+    key = (guild_id, election_type, use_dropdown)
+    fingerprint = tuple((c['id'], c['name']) for c in candidates_list)
+    cached = _voting_views.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    view = VotingView(guild_id, election_type, candidates_list, use_dropdown)
+    _voting_views[key] = (fingerprint, view)
+    return view
+
+@bot.command()
 async def volit(ctx):
     """Zobrazí interaktivní hlasovací menu"""
     try:
-        current_type = await get_current_election_type(ctx.guild.id)
-        ui_type = await get_voting_ui_type(ctx.guild.id)
-        
-        async def _get_candidates():
-            async with db_manager.pool.acquire() as conn:
-                rows = await conn.fetch('''
-                    SELECT id, name FROM rp_candidates 
-                    WHERE guild_id = $1 AND election_type = $2
-                    ORDER BY created_at
-                ''', ctx.guild.id, current_type)
-                return [dict(row) for row in rows]
-        
-        candidates = await safe_db_operation("get_candidates", _get_candidates, [])
-        
+        # Obě čtou nezávislé klíče - na cache-cold cestě souběžně přes
+        # pool místo dvou sekvenčních round-tripů
+        current_type, ui_type = await asyncio.gather(
+            get_current_election_type(ctx.guild.id),
+            get_voting_ui_type(ctx.guild.id)
+        )
+
+        candidates = await get_candidates(ctx.guild.id, current_type)
+
         if not candidates:
             await ctx.send(f"❌ Nejsou k dispozici žádní {'kandidáti' if current_type == 'presidential' else 'strany'}!")
             return
-        
+
         title = f"🗳️ {'Prezidentské volby' if current_type == 'presidential' else 'Parlamentní volby'}"
-        embed = discord.Embed(title=title, color=discord.Color.blue())
+        embed = discord.Embed(title=title, color=_BLUE)
         embed.set_footer(text="Každý uživatel může hlasovat pouze jednou")
-        
-        if ui_type == 'dropdown':
-            # Dropdown menu pro hlasování
-            class VotingSelect(discord.ui.Select):
-                def __init__(self, candidates_list):
-                    options = []
-                    for candidate in candidates_list[:25]:  # Discord limit
-                        options.append(discord.SelectOption(
-                            label=candidate['name'][:100],
-                            value=str(candidate['id']),
-                            description=f"Hlasovat pro {candidate['name']}"[:100]
-                        ))
-                    
-                    super().__init__(
-                        placeholder=f"Vyber {'kandidáta' if current_type == 'presidential' else 'stranu'}...",
-                        options=options,
-                        custom_id=f"vote_select_{ctx.guild.id}_{current_type}"
-                    )
-                
-                async def callback(self, interaction: discord.Interaction):
-                    candidate_id = int(self.values[0])
-                    await handle_vote(interaction, candidate_id)
-            
-            class VotingView(discord.ui.View):
-                def __init__(self, candidates_list):
-                    super().__init__(timeout=None)  # Persistent view
-                    self.add_item(VotingSelect(candidates_list))
-            
-            await ctx.send(embed=embed, view=VotingView(candidates))
-        
-        else:
-            # Tlačítka pro hlasování
-            class VotingView(discord.ui.View):
-                def __init__(self, candidates_list):
-                    super().__init__(timeout=None)  # Persistent view
-                    for i, candidate in enumerate(candidates_list[:20]):  # Discord limit
-                        button = discord.ui.Button(
-                            label=candidate['name'][:80],
-                            style=discord.ButtonStyle.primary,
-                            custom_id=f"vote_{ctx.guild.id}_{candidate['id']}"
-                        )
-                        button.callback = self.create_callback(candidate['id'])
-                        self.add_item(button)
-                
-                def create_callback(self, candidate_id):
-                    async def callback(interaction: discord.Interaction):
-                        await handle_vote(interaction, candidate_id)
-                    return callback
-            
-            await ctx.send(embed=embed, view=VotingView(candidates))
-            
+
+        view = get_voting_view(ctx.guild.id, current_type, candidates, ui_type == 'dropdown')
+        await ctx.send(embed=embed, view=view)
+
     except Exception as e:
         await ctx.send(f"❌ Chyba při načítání hlasování: {e}")
 
@@ -1007,7 +1480,7 @@ async def handle_vote(interaction: discord.Interaction, candidate_id: int):
         # Zkontroluj 14-denní minimum na serveru
         member = interaction.guild.get_member(interaction.user.id)
         if member and member.joined_at:
-            days_on_server = (datetime.now(timezone.utc) - member.joined_at).days
+            days_on_server = (now_utc() - member.joined_at).days
             if days_on_server < 14:
                 days_remaining = 14 - days_on_server
                 eligible_date = member.joined_at + timedelta(days=14)
@@ -1022,32 +1495,26 @@ async def handle_vote(interaction: discord.Interaction, candidate_id: int):
         
         async def _vote():
             async with db_manager.pool.acquire() as conn:
-                # Zkontroluj zda už hlasoval
-                existing = await conn.fetchrow('''
-                    SELECT id FROM rp_votes 
-                    WHERE guild_id = $1 AND user_id = $2
-                ''', interaction.guild.id, interaction.user.id)
-                
-                if existing:
+                # Kontrola existujícího hlasu + eligibility + INSERT + jméno
+                # kandidáta v jednom CTE - jeden round-trip na hot cestě
+                stmt = _prepared(conn, 'vote')
+                args = (interaction.guild.id, interaction.user.id, candidate_id,
+                        member.joined_at if member else None)
+                row = await (stmt.fetchrow(*args) if stmt
+                             else conn.fetchrow(_SQL_VOTE_CTE, *args))
+
+                if not row['eligible']:
+                    return "not_eligible"
+                if not row['inserted']:
                     return "already_voted"
-                
-                # Přidej hlas
-                await conn.execute('''
-                    INSERT INTO rp_votes (guild_id, user_id, candidate_id)
-                    VALUES ($1, $2, $3)
-                ''', interaction.guild.id, interaction.user.id, candidate_id)
-                
-                # Získej jméno kandidáta
-                candidate = await conn.fetchrow('''
-                    SELECT name FROM rp_candidates WHERE id = $1
-                ''', candidate_id)
-                
-                return candidate['name'] if candidate else "unknown"
-        
+                return row['name'] if row['name'] else "unknown"
+
         result = await safe_db_operation("handle_vote", _vote)
-        
+
         if result == "already_voted":
             await interaction.response.send_message("❌ Už jsi hlasoval!", ephemeral=True)
+        elif result == "not_eligible":
+            await interaction.response.send_message("❌ Musíš být na serveru alespoň 14 dní pro hlasování!", ephemeral=True)
         elif result == "unknown":
             await interaction.response.send_message("❌ Chyba při hlasování!", ephemeral=True)
         else:
@@ -1056,6 +1523,19 @@ async def handle_vote(interaction: discord.Interaction, candidate_id: int):
     except Exception as e:
         await interaction.response.send_message(f"❌ Chyba při hlasování: {e}", ephemeral=True)
 
+# Jedna definice místo tří inline kopií ve větvích vysledky
+class DetailedResultsView(discord.ui.View):
+    def __init__(self, election_type):
+        super().__init__(timeout=300)
+        self.election_type = election_type
+
+    @discord.ui.button(label="📋 Detailní přehled hlasů", style=discord.ButtonStyle.primary)
+    async def show_detailed_votes(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.guild_permissions.administrator:
+            await show_detailed_voting_breakdown(interaction, self.election_type)
+        else:
+            await interaction.response.send_message("❌ Pouze administrátoři mohou zobrazit detailní přehled.", ephemeral=True)
+
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def vysledky(ctx):
@@ -1065,39 +1545,43 @@ async def vysledky(ctx):
         
         async def _get_results():
             async with db_manager.pool.acquire() as conn:
+                # Celkový součet i procenta počítá window funkce v jednom
+                # průchodu agregátem - Python je už jen formátuje
                 rows = await conn.fetch('''
-                    SELECT c.name, COUNT(v.id) as votes
+                    SELECT c.name, COUNT(v.id) as votes,
+                           SUM(COUNT(v.id)) OVER () AS total,
+                           COALESCE(COUNT(v.id) * 100.0
+                                    / NULLIF(SUM(COUNT(v.id)) OVER (), 0), 0) AS pct
                     FROM rp_candidates c
                     LEFT JOIN rp_votes v ON c.id = v.candidate_id
                     WHERE c.guild_id = $1 AND c.election_type = $2
                     GROUP BY c.id, c.name
                     ORDER BY votes DESC, c.name
                 ''', ctx.guild.id, current_type)
-                return [dict(row) for row in rows]
-        
+                return rows
+
         results = await safe_db_operation("get_results", _get_results, [])
-        
+
         if not results:
             await ctx.send("❌ Nejsou k dispozici žádné výsledky!")
             return
-        
+
         title = f"📊 Výsledky {'prezidentských voleb' if current_type == 'presidential' else 'parlamentních voleb'}"
-        embed = discord.Embed(title=title, color=discord.Color.gold())
-        
-        total_votes = sum(result['votes'] for result in results)
+        embed = discord.Embed(title=title, color=_GOLD)
+
+        total_votes = results[0]['total']
         embed.add_field(name="Celkový počet hlasů", value=str(total_votes), inline=False)
-        
+
         for i, result in enumerate(results, 1):
-            percentage = (result['votes'] / total_votes * 100) if total_votes > 0 else 0
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-            
+
             embed.add_field(
                 name=f"{medal} {result['name']}",
-                value=f"**{result['votes']}** hlasů ({percentage:.1f}%)",
+                value=f"**{result['votes']}** hlasů ({result['pct']:.1f}%)",
                 inline=True
             )
         
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         
         # Vytvoř koláčový graf
         if total_votes > 0:
@@ -1105,64 +1589,26 @@ async def vysledky(ctx):
                 names = [result['name'] for result in results]
                 votes = [result['votes'] for result in results]
                 colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD', '#98D8C8', '#F7DC6F']
-                
-                plt.figure(figsize=(10, 8))
-                plt.pie(votes, labels=names, colors=colors[:len(names)], autopct='%1.1f%%', startangle=90)
-                plt.title(f'Výsledky {"prezidentských voleb" if current_type == "presidential" else "parlamentních voleb"}', 
-                         fontsize=16, fontweight='bold')
-                
-                # Uložení do BytesIO
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-                buffer.seek(0)
-                plt.close()
-                
+
+                # Pillow render je <10 ms, stačí vlákno (PIL pouští GIL v C)
+                png_bytes = await asyncio.to_thread(
+                    _render_pie, names, votes, colors,
+                    f'Výsledky {"prezidentských voleb" if current_type == "presidential" else "parlamentních voleb"}'
+                )
+                buffer = BytesIO(png_bytes)
+
                 # Odeslání s grafem
                 file = discord.File(buffer, filename="vysledky.png")
                 embed.set_image(url="attachment://vysledky.png")
-                # Přidej button pro detailní přehled
-                class DetailedResultsView(discord.ui.View):
-                    def __init__(self):
-                        super().__init__(timeout=300)
-                    
-                    @discord.ui.button(label="📋 Detailní přehled hlasů", style=discord.ButtonStyle.primary)
-                    async def show_detailed_votes(self, interaction: discord.Interaction, button: discord.ui.Button):
-                        if interaction.user.guild_permissions.administrator:
-                            await show_detailed_voting_breakdown(interaction, current_type)
-                        else:
-                            await interaction.response.send_message("❌ Pouze administrátoři mohou zobrazit detailní přehled.", ephemeral=True)
-                
-                await ctx.send(embed=embed, file=file, view=DetailedResultsView())
-                
+                await ctx.send(embed=embed, file=file, view=DetailedResultsView(current_type))
+
             except Exception as e:
-                print(f"Chyba při vytváření grafu: {e}")
+                log.error(f"Chyba při vytváření grafu: {e}")
                 # Bez grafu, ale s buttonem
-                class DetailedResultsView(discord.ui.View):
-                    def __init__(self):
-                        super().__init__(timeout=300)
-                    
-                    @discord.ui.button(label="📋 Detailní přehled hlasů", style=discord.ButtonStyle.primary)
-                    async def show_detailed_votes(self, interaction: discord.Interaction, button: discord.ui.Button):
-                        if interaction.user.guild_permissions.administrator:
-                            await show_detailed_voting_breakdown(interaction, current_type)
-                        else:
-                            await interaction.response.send_message("❌ Pouze administrátoři mohou zobrazit detailní přehled.", ephemeral=True)
-                
-                await ctx.send(embed=embed, view=DetailedResultsView())
+                await ctx.send(embed=embed, view=DetailedResultsView(current_type))
         else:
             # Bez grafu, ale s buttonem
-            class DetailedResultsView(discord.ui.View):
-                def __init__(self):
-                    super().__init__(timeout=300)
-                
-                @discord.ui.button(label="📋 Detailní přehled hlasů", style=discord.ButtonStyle.primary)
-                async def show_detailed_votes(self, interaction: discord.Interaction, button: discord.ui.Button):
-                    if interaction.user.guild_permissions.administrator:
-                        await show_detailed_voting_breakdown(interaction, current_type)
-                    else:
-                        await interaction.response.send_message("❌ Pouze administrátoři mohou zobrazit detailní přehled.", ephemeral=True)
-            
-            await ctx.send(embed=embed, view=DetailedResultsView())
+            await ctx.send(embed=embed, view=DetailedResultsView(current_type))
         
     except Exception as e:
         await ctx.send(f"❌ Chyba při získávání výsledků: {e}")
@@ -1174,7 +1620,8 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
         
         async def _get_detailed_breakdown():
             async with db_manager.pool.acquire() as conn:
-                # Jednodušší dotaz - získej kandidáty seřazené podle hlasů
+                # Dva dotazy celkem místo 1+N: agregát kandidátů a všechny
+                # hlasy najednou, seskupení per kandidát proběhne v Pythonu
                 candidates = await conn.fetch('''
                     SELECT
                         c.id as candidate_id,
@@ -1187,24 +1634,27 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
                     ORDER BY COUNT(v.id) DESC, c.name
                 ''', interaction.guild.id, election_type)
 
-                # Pro každého kandidáta získej jeho konkrétní hlasy
-                result = []
-                for candidate in candidates:
-                    votes = await conn.fetch('''
-                        SELECT v.id as vote_id, v.user_id, v.voted_at
-                        FROM rp_votes v
-                        WHERE v.candidate_id = $1
-                        ORDER BY v.voted_at DESC
-                    ''', candidate['candidate_id'])
+                votes = await conn.fetch('''
+                    SELECT v.candidate_id, v.id as vote_id, v.user_id, v.voted_at
+                    FROM rp_votes v
+                    JOIN rp_candidates c ON c.id = v.candidate_id
+                    WHERE c.guild_id = $1 AND c.election_type = $2
+                    ORDER BY v.candidate_id, v.voted_at DESC
+                ''', interaction.guild.id, election_type)
 
-                    result.append({
-                        'candidate_id': candidate['candidate_id'],
-                        'candidate_name': candidate['candidate_name'],
-                        'vote_count': candidate['vote_count'],
-                        'votes': [dict(vote) for vote in votes]
-                    })
+            votes_by_candidate = defaultdict(list)
+            for vote in votes:
+                votes_by_candidate[vote['candidate_id']].append(vote)
 
-                return result
+            return [
+                {
+                    'candidate_id': candidate['candidate_id'],
+                    'candidate_name': candidate['candidate_name'],
+                    'vote_count': candidate['vote_count'],
+                    'votes': votes_by_candidate.get(candidate['candidate_id'], [])
+                }
+                for candidate in candidates
+            ]
         
         breakdown = await safe_db_operation("detailed_breakdown", _get_detailed_breakdown, [])
         
@@ -1215,7 +1665,7 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
         # Vytvoř embed podobný obrázku
         embed = discord.Embed(
             title="📋 Detailní přehled hlasů",
-            color=discord.Color.blue()
+            color=_BLUE
         )
         
         total_votes = sum(row['vote_count'] for row in breakdown)
@@ -1266,7 +1716,7 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
             # Pošli základní info
             summary_embed = discord.Embed(
                 title="📋 Detailní přehled hlasů - Souhrn",
-                color=discord.Color.blue()
+                color=_BLUE
             )
             summary_embed.add_field(name="Celkem hlasů", value=str(total_votes), inline=False)
             await interaction.followup.send(embed=summary_embed, ephemeral=True)
@@ -1279,7 +1729,7 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
                 
                 candidate_embed = discord.Embed(
                     title=f"{name}",
-                    color=discord.Color.green() if vote_count > 0 else discord.Color.red()
+                    color=_GREEN if vote_count > 0 else _RED
                 )
                 
                 if vote_count == 0:
@@ -1303,7 +1753,7 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
                         
                         page_embed = discord.Embed(
                             title=f"{name}" + (f" (strana {page + 1}/{total_pages})" if total_pages > 1 else ""),
-                            color=discord.Color.green()
+                            color=_GREEN
                         )
                         page_embed.add_field(
                             name=f"Hlasy ({vote_count} celkem)",
@@ -1320,7 +1770,7 @@ async def show_detailed_voting_breakdown(interaction: discord.Interaction, elect
             await interaction.followup.send(embed=embed, ephemeral=True)
             
     except Exception as e:
-        print(f"Chyba při zobrazování detailního přehledu: {e}")
+        log.error(f"Chyba při zobrazování detailního přehledu: {e}")
         try:
             await interaction.followup.send(f"❌ Chyba při načítání detailního přehledu: {e}", ephemeral=True)
         except:
@@ -1340,7 +1790,7 @@ async def seznam_kandidatu(ctx):
                     WHERE guild_id = $1 AND election_type = $2
                     ORDER BY created_at
                 ''', ctx.guild.id, current_type)
-                return [dict(row) for row in rows]
+                return rows
         
         candidates = await safe_db_operation("get_all_candidates", _get_candidates, [])
         
@@ -1349,7 +1799,7 @@ async def seznam_kandidatu(ctx):
             return
         
         title = f"📋 {'Kandidáti' if current_type == 'presidential' else 'Strany'} ({current_type.capitalize()})"
-        embed = discord.Embed(title=title, color=discord.Color.blue())
+        embed = discord.Embed(title=title, color=_BLUE)
         
         for candidate in candidates:
             created = candidate['created_at'].strftime('%d.%m.%Y')
@@ -1389,8 +1839,9 @@ async def smazat_kandidata(ctx, candidate_id: int):
                 return candidate['name']
         
         result = await safe_db_operation("delete_candidate", _delete_candidate)
-        
+
         if result:
+            invalidate_candidates_cache(ctx.guild.id)
             await ctx.send(f"✅ Kandidát **{result}** byl smazán spolu se všemi hlasy!")
         else:
             await ctx.send("❌ Kandidát s tímto ID nebyl nalezen!")
@@ -1406,20 +1857,7 @@ async def nastavit_ui(ctx, ui_type: str):
         await ctx.send("❌ Neplatný typ UI! Použij: `buttons` nebo `dropdown`")
         return
     
-    async def _set_ui():
-        async with db_manager.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO rp_election_settings (guild_id, voting_ui, updated_at)
-                VALUES ($1, $2, CURRENT_TIMESTAMP)
-                ON CONFLICT (guild_id) DO UPDATE SET
-                voting_ui = EXCLUDED.voting_ui, updated_at = CURRENT_TIMESTAMP
-            ''', ctx.guild.id, ui_type.lower())
-            
-            # Invalidate cache
-            cache_key = f"voting_ui_{ctx.guild.id}"
-            election_cache.cache.pop(cache_key, None)
-    
-    await safe_db_operation("set_voting_ui", _set_ui)
+    await set_election_settings_bulk([(ctx.guild.id, None, ui_type.lower())])
     await ctx.send(f"✅ UI pro hlasování nastaveno na: **{ui_type.capitalize()}**")
 
 @bot.command()
@@ -1431,7 +1869,7 @@ async def vynulovat_volby(ctx):
         embed = discord.Embed(
             title="⚠️ Potvrzení",
             description="Opravdu chceš vymazat **všechny hlasy**?\nKandidáti zůstanou zachováni.",
-            color=discord.Color.orange()
+            color=_ORANGE
         )
         
         class ConfirmView(discord.ui.View):
@@ -1446,8 +1884,14 @@ async def vynulovat_volby(ctx):
                 
                 async def _reset_votes():
                     async with db_manager.pool.acquire() as conn:
-                        result = await conn.execute('DELETE FROM rp_votes WHERE guild_id = $1', ctx.guild.id)
-                        return result
+                        # Reset je idempotentní admin akce - synchronous_commit
+                        # off přeskočí WAL fsync, u velkých voleb řádově
+                        # rychlejší; SET LOCAL platí jen pro tuhle transakci
+                        async with conn.transaction():
+                            await conn.execute("SET LOCAL synchronous_commit = off")
+                            return await conn.execute(
+                                'DELETE FROM rp_votes WHERE guild_id = $1', ctx.guild.id
+                            )
                 
                 await safe_db_operation("reset_votes", _reset_votes)
                 await interaction.response.edit_message(
@@ -1480,20 +1924,13 @@ async def odstranit_hlas(ctx, vote_id: int):
     try:
         async def _remove_vote():
             async with db_manager.pool.acquire() as conn:
-                # Najdi hlas s tímto ID na tomto serveru
-                vote = await conn.fetchrow('''
-                    SELECT v.id, v.user_id, v.voted_at, c.name as candidate_name 
-                    FROM rp_votes v
-                    JOIN rp_candidates c ON v.candidate_id = c.id
-                    WHERE v.id = $1 AND v.guild_id = $2
+                # DELETE ... USING ... RETURNING - nalezení i smazání hlasu
+                # atomicky v jednom round-tripu místo SELECT + DELETE
+                return await conn.fetchrow('''
+                    DELETE FROM rp_votes
+                    WHERE id = $1 AND guild_id = $2
+                    RETURNING id, user_id, voted_at, candidate_name
                 ''', vote_id, ctx.guild.id)
-                
-                if not vote:
-                    return None
-                
-                # Smaž hlas
-                await conn.execute('DELETE FROM rp_votes WHERE id = $1', vote_id)
-                return vote
         
         result = await safe_db_operation("remove_vote", _remove_vote)
         
@@ -1501,7 +1938,7 @@ async def odstranit_hlas(ctx, vote_id: int):
             user_mention = f"<@{result['user_id']}>"
             embed = discord.Embed(
                 title="✅ Hlas odstraněn",
-                color=discord.Color.green()
+                color=_GREEN
             )
             embed.add_field(name="ID hlasu", value=str(vote_id), inline=True)
             embed.add_field(name="Uživatel", value=user_mention, inline=True)
@@ -1521,70 +1958,81 @@ async def seznam_hlasu(ctx, candidate_id: int = None):
     try:
         current_type = await get_current_election_type(ctx.guild.id)
         
-        async def _get_votes():
+        # Stránky po 20 hlasech (Discord limit 25 fieldů per embed)
+        per_page = 20
+
+        if candidate_id:
+            where = 'v.guild_id = $1 AND v.candidate_id = $2 AND v.election_type = $3'
+            order = 'v.voted_at DESC'
+            params = (ctx.guild.id, candidate_id, current_type)
+        else:
+            where = 'v.guild_id = $1 AND v.election_type = $2'
+            order = 'v.candidate_name, v.voted_at DESC'
+            params = (ctx.guild.id, current_type)
+
+        async def _build_pages():
+            """Streamuje hlasy kurzorem a skládá embed po stránkách -
+            nedrží se celý seznam ani dict() per řádek, fieldy se čtou
+            přímo z Recordů"""
             async with db_manager.pool.acquire() as conn:
-                if candidate_id:
-                    # Hlasy pro konkrétního kandidáta
-                    votes = await conn.fetch('''
-                        SELECT v.id, v.user_id, v.voted_at, c.name as candidate_name
-                        FROM rp_votes v
-                        JOIN rp_candidates c ON v.candidate_id = c.id
-                        WHERE v.guild_id = $1 AND c.id = $2 AND c.election_type = $3
-                        ORDER BY v.voted_at DESC
-                    ''', ctx.guild.id, candidate_id, current_type)
-                else:
-                    # Všechny hlasy
-                    votes = await conn.fetch('''
-                        SELECT v.id, v.user_id, v.voted_at, c.name as candidate_name
+                total = await conn.fetchval(
+                    f'SELECT COUNT(*) FROM rp_votes v WHERE {where}', *params)
+                if not total:
+                    return []
+
+                total_pages = (total + per_page - 1) // per_page
+                embeds = []
+                page_votes = []
+
+                def _flush_page():
+                    title = f"📋 Seznam hlasů"
+                    if candidate_id:
+                        title += f" pro kandidáta #{candidate_id}"
+                    if total_pages > 1:
+                        title += f" (strana {len(embeds) + 1}/{total_pages})"
+
+                    embed = discord.Embed(title=title, color=_BLUE)
+                    for vote in page_votes:
+                        user_mention = f"<@{vote['user_id']}>"
+                        value = f"👤 {user_mention}\n🗳️ {vote['candidate_name']}\n⏰ {format_timestamp(vote['voted_at'])}"
+                        embed.add_field(
+                            name=f"ID: {vote['id']}",
+                            value=value,
+                            inline=True
+                        )
+                    embed.set_footer(text=f"Celkem hlasů: {total} • Použij !odstranit_hlas <ID> pro smazání")
+                    embeds.append(embed)
+                    page_votes.clear()
+
+                async with conn.transaction():
+                    async for vote in conn.cursor(f'''
+                        SELECT v.id, v.user_id, v.voted_at, v.candidate_name
                         FROM rp_votes v
-                        JOIN rp_candidates c ON v.candidate_id = c.id
-                        WHERE v.guild_id = $1 AND c.election_type = $2
-                        ORDER BY c.name, v.voted_at DESC
-                    ''', ctx.guild.id, current_type)
-                
-                return [dict(vote) for vote in votes]
-        
-        votes = await safe_db_operation("get_votes_list", _get_votes, [])
-        
-        if not votes:
+                        WHERE {where}
+                        ORDER BY {order}
+                    ''', *params):
+                        page_votes.append(vote)
+                        if len(page_votes) == per_page:
+                            _flush_page()
+                if page_votes:
+                    _flush_page()
+                return embeds
+
+        embeds = await safe_db_operation("get_votes_list", _build_pages, [])
+
+        if not embeds:
             await ctx.send("❌ Žádné hlasy nebyly nalezeny.")
             return
-        
-        # Rozdělí hlasy na stránky (Discord limit 25 fieldů per embed)
-        per_page = 20
-        total_pages = (len(votes) + per_page - 1) // per_page
-        
-        for page in range(total_pages):
-            start_idx = page * per_page
-            end_idx = min(start_idx + per_page, len(votes))
-            page_votes = votes[start_idx:end_idx]
-            
-            title = f"📋 Seznam hlasů"
-            if candidate_id:
-                title += f" pro kandidáta #{candidate_id}"
-            if total_pages > 1:
-                title += f" (strana {page + 1}/{total_pages})"
-            
-            embed = discord.Embed(title=title, color=discord.Color.blue())
-            
-            for vote in page_votes:
-                user_mention = f"<@{vote['user_id']}>"
-                value = f"👤 {user_mention}\n🗳️ {vote['candidate_name']}\n⏰ {format_timestamp(vote['voted_at'])}"
-                embed.add_field(
-                    name=f"ID: {vote['id']}", 
-                    value=value, 
-                    inline=True
-                )
-            
-            embed.set_footer(text=f"Celkem hlasů: {len(votes)} • Použij !odstranit_hlas <ID> pro smazání")
-            await ctx.send(embed=embed)
-            
+
+        # Stránky letí souběžně - per-channel rate limit si discord.py
+        # serializuje sám, latence je ~1 RTT místo N
+        await asyncio.gather(*(ctx.send(embed=embed) for embed in embeds))
+
     except Exception as e:
         await ctx.send(f"❌ Chyba při načítání hlasů: {e}")
 
-@bot.command()
-async def help_panel(ctx):
-    embed = discord.Embed(title="📋 Dostupné příkazy", color=discord.Color.blue())
+def _build_help_embed():
+    embed = discord.Embed(title="📋 Dostupné příkazy", color=_BLUE)
     
     embed.add_field(name="⚙️ Základní nastavení", value="""
 `!set_logs #kanál` - Nastaví kanál pro logy
@@ -1636,13 +2084,22 @@ Všechny logy obsahují detailní audit trail
 Bot automaticky sleduje invite tracking a změny
     """, inline=False)
     
-    await ctx.send(embed=embed)
+    return embed
+
+# Nápověda je statická - embed se postaví jednou při importu
+# a help_panel ho jen posílá
+_HELP_EMBED = _build_help_embed()
+
+@bot.command()
+async def help_panel(ctx):
+    await ctx.send(embed=_HELP_EMBED)
 
 # Event handlers - základní pro invite tracking
 @bot.event
 async def on_member_join(member):
     guild = member.guild
-    data = await get_guild_settings(guild.id)
+    _user_guilds[member.id].add(guild.id)
+    data = get_guild_settings_cached(guild.id) or await get_guild_settings(guild.id)
     
     # Welcome zpráva
     welcome_channel_id = data.get("welcome_channel")
@@ -1658,38 +2115,58 @@ async def on_member_join(member):
     
     try:
         current_invites = await guild.invites()
-        current_uses = {invite.code: invite.uses for invite in current_invites}
-        cached_uses = invite_cache.get(guild.id, {})
-        
-        for code, uses in current_uses.items():
-            if code in cached_uses and uses > cached_uses[code]:
-                # Toto je použitá pozvánka
-                for invite in current_invites:
-                    if invite.code == code:
-                        embed = discord.Embed(
-                            title="👋 Nový člen se připojil", 
-                            color=discord.Color.green()
-                        )
-                        embed.add_field(name="Člen", value=f"{member} (ID: {member.id})", inline=False)
-                        embed.add_field(name="Pozval", value=f"{invite.inviter}", inline=True)
-                        embed.add_field(name="Pozvánka", value=f"`{invite.code}`", inline=True)
-                        embed.timestamp = datetime.now(timezone.utc)
-                        await send_log(guild, embed)
-                        break
-                break
-        
-        # Aktualizuj cache
-        invite_cache[guild.id] = current_uses
-        
+        cached_uses = invite_cache.get(guild.id)
+        if cached_uses is None:
+            cached_uses = invite_cache[guild.id] = {}
+
+        # Inkrementální diff v jednom průchodu - cache se aktualizuje
+        # in-place místo alokace nového dictu při každém joinu
+        used_invite = None
+        for invite in current_invites:
+            prev = cached_uses.get(invite.code)
+            if used_invite is None and prev is not None and invite.uses > prev:
+                used_invite = invite
+            if prev != invite.uses:
+                cached_uses[invite.code] = invite.uses
+
+        if used_invite:
+            embed = discord.Embed(
+                title="👋 Nový člen se připojil",
+                color=_GREEN
+            )
+            embed.add_field(name="Člen", value=f"{member} (ID: {member.id})", inline=False)
+            embed.add_field(name="Pozval", value=f"{used_invite.inviter}", inline=True)
+            embed.add_field(name="Pozvánka", value=f"`{used_invite.code}`", inline=True)
+            embed.timestamp = now_utc()
+            await send_log(guild, embed)
+
     except discord.Forbidden:
         pass
     except Exception as e:
-        print(f"⚠️ Chyba při invite trackingu: {e}")
+        log.warning(f"⚠️ Chyba při invite trackingu: {e}")
+
+@bot.event
+async def on_invite_create(invite):
+    # Drž cache aktuální bez re-fetche celého seznamu pozvánek
+    if invite.guild:
+        invite_cache.setdefault(invite.guild.id, {})[invite.code] = invite.uses or 0
+
+@bot.event
+async def on_invite_delete(invite):
+    if invite.guild:
+        guild_uses = invite_cache.get(invite.guild.id)
+        if guild_uses:
+            guild_uses.pop(invite.code, None)
 
 @bot.event
 async def on_member_remove(member):
     guild = member.guild
-    data = await get_guild_settings(guild.id)
+    _user_guilds[member.id].discard(guild.id)
+    # Čekající debounced voice log odcházejícího člena už nemá co říct
+    pending = voice_debounce_tasks.get((guild.id, member.id))
+    if pending is not None and not pending.done():
+        pending.cancel()
+    data = get_guild_settings_cached(guild.id) or await get_guild_settings(guild.id)
     
     # Goodbye zpráva
     goodbye_channel_id = data.get("goodbye_channel")
@@ -1700,87 +2177,86 @@ async def on_member_remove(member):
             await channel.send(message.replace("{user}", member.name))
     
     # Log odchodu
-    embed = discord.Embed(title="📤 Člen odešel", color=discord.Color.red())
+    embed = discord.Embed(title="📤 Člen odešel", color=_RED)
     embed.add_field(name="Uživatel", value=f"{member} (ID: {member.id})", inline=False)
     embed.add_field(name="Připojen", value=format_timestamp(member.joined_at), inline=True)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(guild, embed)
 
 # Základní message delete/edit tracking
 @bot.event
 async def on_message_delete(message):
     if message.guild and not message.author.bot:
-        embed = discord.Embed(title="🗑️ Zpráva smazána", color=discord.Color.red())
+        embed = discord.Embed(title="🗑️ Zpráva smazána", color=_RED)
         embed.add_field(name="Autor", value=f"{message.author.mention} ({message.author})", inline=False)
         embed.add_field(name="Kanál", value=message.channel.mention, inline=True)
         
-        content = message.content or "Bez textového obsahu"
-        if len(content) > 1024:
-            content = content[:1021] + "..."
+        content = _fit(message.content or "Bez textového obsahu")
         embed.add_field(name="Obsah", value=content, inline=False)
         
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await send_log(message.guild, embed)
 
 @bot.event
 async def on_message_edit(before, after):
     if before.guild and before.content != after.content and not before.author.bot:
-        embed = discord.Embed(title="✏️ Zpráva upravena", color=discord.Color.orange())
+        embed = discord.Embed(title="✏️ Zpráva upravena", color=_ORANGE)
         embed.add_field(name="Autor", value=f"{before.author.mention} ({before.author})", inline=False)
         embed.add_field(name="Kanál", value=before.channel.mention, inline=True)
         
-        old_content = before.content or "Prázdné"
-        new_content = after.content or "Prázdné"
-        
-        if len(old_content) > 512:
-            old_content = old_content[:509] + "..."
-        if len(new_content) > 512:
-            new_content = new_content[:509] + "..."
+        old_content = _fit(before.content or "Prázdné", 512)
+        new_content = _fit(after.content or "Prázdné", 512)
         
         embed.add_field(name="Před", value=old_content, inline=False)
         embed.add_field(name="Po", value=new_content, inline=False)
         embed.add_field(name="Odkaz", value=f"[Přejít na zprávu]({after.jump_url})", inline=True)
         
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await send_log(before.guild, embed)
 
 # Základní ban/unban/kick tracking
 @bot.event
 async def on_member_ban(guild, user):
     executor, reason = await get_audit_executor(guild, discord.AuditLogAction.ban, user.id, 'user')
-    embed = discord.Embed(title="🔨 Uživatel zabanován", color=discord.Color.dark_red())
+    embed = discord.Embed(title="🔨 Uživatel zabanován", color=_DARK_RED)
     embed.add_field(name="Uživatel", value=f"{user} (ID: {user.id})", inline=False)
     embed.set_thumbnail(url=user.display_avatar.url)
     if executor:
         embed.set_footer(text=f"Zabanoval: {executor}")
     if reason:
         embed.add_field(name="Důvod", value=reason, inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(guild, embed)
 
 @bot.event
 async def on_member_unban(guild, user):
     executor, reason = await get_audit_executor(guild, discord.AuditLogAction.unban, user.id, 'user')
-    embed = discord.Embed(title="🎯 Ban odebrán", color=discord.Color.green())
+    embed = discord.Embed(title="🎯 Ban odebrán", color=_GREEN)
     embed.add_field(name="Uživatel", value=f"{user} (ID: {user.id})", inline=False)
     embed.set_thumbnail(url=user.display_avatar.url)
     if executor:
         embed.set_footer(text=f"Unbanoval: {executor}")
     if reason:
         embed.add_field(name="Důvod", value=reason, inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(guild, embed)
 
 # Role change tracking
 @bot.event
 async def on_member_update(before, after):
-    if before.roles != after.roles:
-        added_roles = set(after.roles) - set(before.roles)
-        removed_roles = set(before.roles) - set(after.roles)
-        
+    # Fires i pro presence/nickname změny - srovnání interních snowflake
+    # polí je levný fast-path, set(Role objektů) se nealokuje vůbec
+    if before._roles != after._roles:
+        guild = after.guild
+        before_ids = set(before._roles)
+        after_ids = set(after._roles)
+        # get_role = jeden dict lookup; None kryje mezitím smazanou roli
+        added_roles = [r for r in map(guild.get_role, after_ids - before_ids) if r]
+        removed_roles = [r for r in map(guild.get_role, before_ids - after_ids) if r]
+
         if added_roles or removed_roles:
             executor, reason = await get_audit_executor(after.guild, discord.AuditLogAction.member_role_update, after.id, 'user')
-            embed = discord.Embed(title="👤 Role změněny", color=discord.Color.orange())
+            embed = discord.Embed(title="👤 Role změněny", color=_ORANGE)
             embed.add_field(name="Uživatel", value=after.mention, inline=False)
             
             if added_roles:
@@ -1792,14 +2268,14 @@ async def on_member_update(before, after):
                 embed.set_footer(text=f"Změnil: {executor}")
             if reason:
                 embed.add_field(name="Důvod", value=reason, inline=False)
-            embed.timestamp = datetime.now(timezone.utc)
+            embed.timestamp = now_utc()
             await send_log(after.guild, embed)
 
 # Channel events
 @bot.event
 async def on_guild_channel_create(channel):
     executor, reason = await get_audit_executor(channel.guild, discord.AuditLogAction.channel_create, channel.id)
-    embed = discord.Embed(title="📥 Kanál vytvořen", color=discord.Color.green())
+    embed = discord.Embed(title="📥 Kanál vytvořen", color=_GREEN)
     embed.add_field(name="Kanál", value=f"{channel.mention} ({channel.name})", inline=False)
     embed.add_field(name="Typ", value=str(channel.type), inline=True)
     embed.add_field(name="ID", value=str(channel.id), inline=True)
@@ -1815,22 +2291,20 @@ async def on_guild_channel_create(channel):
             perm_info.append(f"• {target_name}: Má custom permissions")
         
         if perm_info:
-            perm_text = "\n".join(perm_info)
-            if len(perm_text) > 1024:
-                perm_text = perm_text[:1021] + "..."
+            perm_text = _fit("\n".join(perm_info))
             embed.add_field(name="Custom Permissions", value=perm_text, inline=False)
     
     if executor:
         embed.set_footer(text=f"Vytvořil: {executor}")
     if reason:
         embed.add_field(name="Důvod", value=reason, inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(channel.guild, embed)
 
 @bot.event
 async def on_guild_channel_delete(channel):
     executor, reason = await get_audit_executor(channel.guild, discord.AuditLogAction.channel_delete, channel.id)
-    embed = discord.Embed(title="📤 Kanál smazán", color=discord.Color.red())
+    embed = discord.Embed(title="📤 Kanál smazán", color=_RED)
     embed.add_field(name="Název", value=channel.name, inline=False)
     embed.add_field(name="Typ", value=str(channel.type), inline=True)
     embed.add_field(name="ID", value=str(channel.id), inline=True)
@@ -1846,40 +2320,76 @@ async def on_guild_channel_delete(channel):
             perm_info.append(f"• {target_name}: Měl custom permissions")
         
         if perm_info:
-            perm_text = "\n".join(perm_info)
-            if len(perm_text) > 1024:
-                perm_text = perm_text[:1021] + "..."
+            perm_text = _fit("\n".join(perm_info))
             embed.add_field(name="Měli Custom Permissions", value=perm_text, inline=False)
     
     if executor:
         embed.set_footer(text=f"Smazal: {executor}")
     if reason:
         embed.add_field(name="Důvod", value=reason, inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(channel.guild, embed)
 
+# Lidské popisky sledovaných kanálových oprávnění; mapa bit -> popisek
+# se staví jednou při importu z flag definic discord.py, takže diff
+# overwrites může pracovat přímo nad bitmaskami
+_CHANNEL_PERM_LABELS = {
+    'view_channel': 'View Channel',
+    'send_messages': 'Send Messages',
+    'send_tts_messages': 'Send TTS Messages',
+    'manage_messages': 'Manage Messages',
+    'embed_links': 'Embed Links',
+    'attach_files': 'Attach Files',
+    'read_message_history': 'Read Message History',
+    'mention_everyone': 'Mention Everyone',
+    'external_emojis': 'Use External Emojis',
+    'add_reactions': 'Add Reactions',
+    'connect': 'Connect',
+    'speak': 'Speak',
+    'stream': 'Video',
+    'use_voice_activation': 'Use Voice Activity',
+    'mute_members': 'Mute Members',
+    'deafen_members': 'Deafen Members',
+    'move_members': 'Move Members',
+    'manage_channels': 'Manage Channel',
+    'manage_roles': 'Manage Permissions',
+    'manage_webhooks': 'Manage Webhooks',
+    'use_slash_commands': 'Use Slash Commands',
+    'manage_threads': 'Manage Threads',
+    'create_public_threads': 'Create Public Threads',
+    'create_private_threads': 'Create Private Threads',
+    'send_messages_in_threads': 'Send Messages in Threads',
+    'use_embedded_activities': 'Use Activities',
+}
+
+PERM_BIT_TO_NAME = {
+    value.bit_length() - 1: _CHANNEL_PERM_LABELS[name]
+    for name, value in discord.Permissions.VALID_FLAGS.items()
+    if name in _CHANNEL_PERM_LABELS
+}
+
 # Channel update events
 @bot.event
 async def on_guild_channel_update(before, after):
-    settings = await get_guild_settings(after.guild.id)
-    if not settings.get("log_channels", True):
-        return
-        
-    if not channel_rate_limiter.can_call(after.guild.id):
+    if not await should_log(after.guild.id, "channels", channel_rate_limiter):
         return
         
     if before.name != after.name or before.topic != after.topic or before.overwrites != after.overwrites:
-        embed = discord.Embed(title="📝 Kanál upraven", color=discord.Color.orange())
-        embed.add_field(name="Kanál", value=after.mention, inline=True)
-        embed.add_field(name="ID", value=str(after.id), inline=True)
-        
+        # Fieldy se skládají jako surové dicty a embed vznikne jedním
+        # Embed.from_dict - žádný per-field setter overhead discord.py,
+        # což se počítá hlavně u mnoha permission změn najednou
+        fields = [
+            {"name": "Kanál", "value": after.mention, "inline": True},
+            {"name": "ID", "value": str(after.id), "inline": True},
+        ]
+
         if before.name != after.name:
-            embed.add_field(name="Název změněn", value=f"{before.name} → {after.name}", inline=False)
-        
+            fields.append({"name": "Název změněn", "value": f"{before.name} → {after.name}", "inline": False})
+
         if hasattr(before, 'topic') and hasattr(after, 'topic') and before.topic != after.topic:
             old_topic = before.topic or "Žádný"
             new_topic = after.topic or "Žádný" 
-            embed.add_field(name="Topic změněn", value=f"{old_topic} → {new_topic}"[:1024], inline=False)
+            fields.append({"name": "Topic změněn", "value": f"{old_topic} → {new_topic}"[:1024], "inline": False})
         
         if before.overwrites != after.overwrites:
             # Detailní analýza permission overwrites
@@ -1903,71 +2413,48 @@ async def on_guild_channel_update(before, after):
                     perm_changes.append(f"➖ **{target_name}**: Odebrán permission overwrite")
                 
                 # Změněný permission overwrite
-                elif before_perms != after_perms:
+                else:
+                    before_allow, before_deny = before_perms.pair()
+                    after_allow, after_deny = after_perms.pair()
+
+                    # Jeden OR/compare nad maskami místo porovnání overwrite
+                    # objektů - targety beze změny hodnot (jen nová instance
+                    # z discord.py) odpadnou bez jakékoliv per-bit práce
+                    allow_diff = before_allow.value ^ after_allow.value
+                    deny_diff = before_deny.value ^ after_deny.value
+                    if not (allow_diff | deny_diff):
+                        continue
+
                     target_name = target.mention if hasattr(target, 'mention') else str(target)
-                    
-                    # Analyzuj konkrétní změny
+
+                    # Projdou se jen skutečně změněné bity (bit & -bit
+                    # izoluje nejnižší nastavený bit)
                     allowed_changes = []
                     denied_changes = []
-                    
-                    # Porovnej allow permissions
-                    before_allow = before_perms.pair()[0] if before_perms else discord.Permissions.none()
-                    after_allow = after_perms.pair()[0] if after_perms else discord.Permissions.none()
-                    
-                    before_deny = before_perms.pair()[1] if before_perms else discord.Permissions.none()
-                    after_deny = after_perms.pair()[1] if after_perms else discord.Permissions.none()
-                    
-                    # Seznam permissions pro kanály
-                    channel_perms = [
-                        ('view_channel', 'View Channel'),
-                        ('send_messages', 'Send Messages'),
-                        ('send_tts_messages', 'Send TTS Messages'),
-                        ('manage_messages', 'Manage Messages'),
-                        ('embed_links', 'Embed Links'),
-                        ('attach_files', 'Attach Files'),
-                        ('read_message_history', 'Read Message History'),
-                        ('mention_everyone', 'Mention Everyone'),
-                        ('external_emojis', 'Use External Emojis'),
-                        ('add_reactions', 'Add Reactions'),
-                        ('connect', 'Connect'),
-                        ('speak', 'Speak'),
-                        ('stream', 'Video'),
-                        ('use_voice_activation', 'Use Voice Activity'),
-                        ('mute_members', 'Mute Members'),
-                        ('deafen_members', 'Deafen Members'),
-                        ('move_members', 'Move Members'),
-                        ('manage_channels', 'Manage Channel'),
-                        ('manage_roles', 'Manage Permissions'),
-                        ('manage_webhooks', 'Manage Webhooks'),
-                        ('use_slash_commands', 'Use Slash Commands'),
-                        ('manage_threads', 'Manage Threads'),
-                        ('create_public_threads', 'Create Public Threads'),
-                        ('create_private_threads', 'Create Private Threads'),
-                        ('send_messages_in_threads', 'Send Messages in Threads'),
-                        ('use_embedded_activities', 'Use Activities')
-                    ]
-                    
-                    for perm_attr, perm_name in channel_perms:
-                        if hasattr(before_allow, perm_attr):
-                            before_allow_val = getattr(before_allow, perm_attr)
-                            after_allow_val = getattr(after_allow, perm_attr)
-                            before_deny_val = getattr(before_deny, perm_attr)
-                            after_deny_val = getattr(after_deny, perm_attr)
-                            
-                            # Allow changes
-                            if before_allow_val != after_allow_val:
-                                if after_allow_val:
-                                    allowed_changes.append(f"✅ {perm_name}")
-                                elif before_allow_val:
-                                    allowed_changes.append(f"🚫 {perm_name} (odebráno z Allow)")
-                            
-                            # Deny changes  
-                            if before_deny_val != after_deny_val:
-                                if after_deny_val:
-                                    denied_changes.append(f"❌ {perm_name}")
-                                elif before_deny_val:
-                                    denied_changes.append(f"🚫 {perm_name} (odebráno z Deny)")
-                    
+                    after_allow_bits = after_allow.value
+                    while allow_diff:
+                        bit = allow_diff & -allow_diff
+                        allow_diff ^= bit
+                        perm_name = PERM_BIT_TO_NAME.get(bit.bit_length() - 1)
+                        if perm_name is None:
+                            continue
+                        if after_allow_bits & bit:
+                            allowed_changes.append(f"✅ {perm_name}")
+                        else:
+                            allowed_changes.append(f"🚫 {perm_name} (odebráno z Allow)")
+
+                    after_deny_bits = after_deny.value
+                    while deny_diff:
+                        bit = deny_diff & -deny_diff
+                        deny_diff ^= bit
+                        perm_name = PERM_BIT_TO_NAME.get(bit.bit_length() - 1)
+                        if perm_name is None:
+                            continue
+                        if after_deny_bits & bit:
+                            denied_changes.append(f"❌ {perm_name}")
+                        else:
+                            denied_changes.append(f"🚫 {perm_name} (odebráno z Deny)")
+
                     change_details = []
                     if allowed_changes:
                         change_details.append(f"Allow: {', '.join(allowed_changes)}")
@@ -1981,31 +2468,30 @@ async def on_guild_channel_update(before, after):
                 # Pokud je změn moc, rozdělíme je na více fieldů
                 perm_text = "\n".join(perm_changes)
                 if len(perm_text) > 1024:
-                    # Rozdělíme permission změny na více fieldů
-                    for i, change in enumerate(perm_changes):
-                        if len(change) > 1024:
-                            # Pokud je i jednotlivá změna moc dlouhá, zkrátíme ji
-                            change = change[:1021] + "..."
-                        embed.add_field(name=f"Permission změna {i+1}", value=change, inline=False)
+                    fields.extend(
+                        {"name": f"Permission změna {i+1}", "value": _fit(change), "inline": False}
+                        for i, change in enumerate(perm_changes)
+                    )
                 else:
-                    embed.add_field(name="Permission změny", value=perm_text, inline=False)
+                    fields.append({"name": "Permission změny", "value": perm_text, "inline": False})
             else:
-                embed.add_field(name="Oprávnění změněna", value="Permission overwrites byly upraveny", inline=False)
-        
-        embed.timestamp = datetime.now(timezone.utc)
+                fields.append({"name": "Oprávnění změněna", "value": "Permission overwrites byly upraveny", "inline": False})
+
+        embed = discord.Embed.from_dict({
+            "title": "📝 Kanál upraven",
+            "color": _ORANGE.value,
+            "fields": fields[:25],
+            "timestamp": now_utc().isoformat(),
+        })
         await send_log(after.guild, embed)
 
 # Role events
 @bot.event
 async def on_guild_role_create(role):
-    settings = await get_guild_settings(role.guild.id)
-    if not settings.get("log_roles", True):
-        return
-        
-    if not role_rate_limiter.can_call(role.guild.id):
+    if not await should_log(role.guild.id, "roles", role_rate_limiter):
         return
     executor, reason = await get_audit_executor(role.guild, discord.AuditLogAction.role_create, role.id)
-    embed = discord.Embed(title="🎭 Role vytvořena", color=discord.Color.green())
+    embed = discord.Embed(title="🎭 Role vytvořena", color=_GREEN)
     embed.add_field(name="Role", value=role.mention, inline=True)
     embed.add_field(name="Název", value=role.name, inline=True)
     embed.add_field(name="ID", value=str(role.id), inline=True)
@@ -2016,19 +2502,15 @@ async def on_guild_role_create(role):
         embed.set_footer(text=f"Vytvořil: {executor}")
     if reason:
         embed.add_field(name="Důvod", value=reason, inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(role.guild, embed)
 
 @bot.event
 async def on_guild_role_delete(role):
-    settings = await get_guild_settings(role.guild.id)
-    if not settings.get("log_roles", True):
-        return
-        
-    if not role_rate_limiter.can_call(role.guild.id):
+    if not await should_log(role.guild.id, "roles", role_rate_limiter):
         return
     executor, reason = await get_audit_executor(role.guild, discord.AuditLogAction.role_delete, role.id)
-    embed = discord.Embed(title="🗑️ Role smazána", color=discord.Color.red())
+    embed = discord.Embed(title="🗑️ Role smazána", color=_RED)
     embed.add_field(name="Název", value=role.name, inline=True)
     embed.add_field(name="ID", value=str(role.id), inline=True)
     embed.add_field(name="Barva", value=str(role.color), inline=True)
@@ -2036,11 +2518,70 @@ async def on_guild_role_delete(role):
         embed.set_footer(text=f"Smazal: {executor}")
     if reason:
         embed.add_field(name="Důvod", value=reason, inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(role.guild, embed)
 
+# Popisky oprávnění pro role update log; mapa bit -> popisek se staví
+# jednou z flag definic discord.py, diff pak běží čistě nad bitmaskami
+_ROLE_PERM_LABELS = {
+    'create_instant_invite': 'Create Invite',
+    'kick_members': 'Kick Members',
+    'ban_members': 'Ban Members',
+    'administrator': 'Administrator',
+    'manage_channels': 'Manage Channels',
+    'manage_guild': 'Manage Server',
+    'add_reactions': 'Add Reactions',
+    'view_audit_log': 'View Audit Log',
+    'priority_speaker': 'Priority Speaker',
+    'stream': 'Video',
+    'read_messages': 'View Channels',
+    'send_messages': 'Send Messages',
+    'send_tts_messages': 'Send TTS Messages',
+    'manage_messages': 'Manage Messages',
+    'embed_links': 'Embed Links',
+    'attach_files': 'Attach Files',
+    'read_message_history': 'Read Message History',
+    'mention_everyone': 'Mention Everyone',
+    'external_emojis': 'Use External Emojis',
+    'view_guild_insights': 'View Server Insights',
+    'connect': 'Connect',
+    'speak': 'Speak',
+    'mute_members': 'Mute Members',
+    'deafen_members': 'Deafen Members',
+    'move_members': 'Move Members',
+    'use_voice_activation': 'Use Voice Activity',
+    'change_nickname': 'Change Nickname',
+    'manage_nicknames': 'Manage Nicknames',
+    'manage_roles': 'Manage Roles',
+    'manage_webhooks': 'Manage Webhooks',
+    'manage_emojis': 'Manage Emojis',
+    'use_slash_commands': 'Use Slash Commands',
+    'request_to_speak': 'Request to Speak',
+    'manage_events': 'Manage Events',
+    'manage_threads': 'Manage Threads',
+    'create_public_threads': 'Create Public Threads',
+    'create_private_threads': 'Create Private Threads',
+    'external_stickers': 'Use External Stickers',
+    'send_messages_in_threads': 'Send Messages in Threads',
+    'use_embedded_activities': 'Use Activities',
+    'moderate_members': 'Timeout Members',
+}
+
+_ROLE_PERM_BIT_TO_NAME = {
+    value.bit_length() - 1: _ROLE_PERM_LABELS[name]
+    for name, value in discord.Permissions.VALID_FLAGS.items()
+    if name in _ROLE_PERM_LABELS
+}
+
 @bot.event
 async def on_guild_role_update(before, after):
+    # Nejdřív levný compound check - přesuny pozic rolí (hromadné při
+    # drag&drop) nic z logovaného nemění a nemají ani spálit token
+    if (before.permissions.value == after.permissions.value
+            and before.name == after.name
+            and before.color == after.color
+            and before.mentionable == after.mentionable):
+        return
     if not role_rate_limiter.can_call(after.guild.id):
         return
     changes = []
@@ -2051,110 +2592,80 @@ async def on_guild_role_update(before, after):
     if before.mentionable != after.mentionable:
         changes.append(f"Zmíněno: {'Ano' if before.mentionable else 'Ne'} → {'Ano' if after.mentionable else 'Ne'}")
     
-    # Detailní tracking permissions
-    if before.permissions != after.permissions:
+    # Detailní tracking permissions - XOR bitmasek a průchod jen přes
+    # skutečně změněné bity (typicky 1-3 místo 41 porovnání)
+    av = after.permissions.value
+    changed = before.permissions.value ^ av
+    if changed:
         added_perms = []
         removed_perms = []
-        
-        # Všechna možná oprávnění
-        all_perms = [
-            ('create_instant_invite', 'Create Invite'),
-            ('kick_members', 'Kick Members'),
-            ('ban_members', 'Ban Members'),
-            ('administrator', 'Administrator'),
-            ('manage_channels', 'Manage Channels'),
-            ('manage_guild', 'Manage Server'),
-            ('add_reactions', 'Add Reactions'),
-            ('view_audit_log', 'View Audit Log'),
-            ('priority_speaker', 'Priority Speaker'),
-            ('stream', 'Video'),
-            ('read_messages', 'View Channels'),
-            ('send_messages', 'Send Messages'),
-            ('send_tts_messages', 'Send TTS Messages'),
-            ('manage_messages', 'Manage Messages'),
-            ('embed_links', 'Embed Links'),
-            ('attach_files', 'Attach Files'),
-            ('read_message_history', 'Read Message History'),
-            ('mention_everyone', 'Mention Everyone'),
-            ('external_emojis', 'Use External Emojis'),
-            ('view_guild_insights', 'View Server Insights'),
-            ('connect', 'Connect'),
-            ('speak', 'Speak'),
-            ('mute_members', 'Mute Members'),
-            ('deafen_members', 'Deafen Members'),
-            ('move_members', 'Move Members'),
-            ('use_voice_activation', 'Use Voice Activity'),
-            ('change_nickname', 'Change Nickname'),
-            ('manage_nicknames', 'Manage Nicknames'),
-            ('manage_roles', 'Manage Roles'),
-            ('manage_webhooks', 'Manage Webhooks'),
-            ('manage_emojis', 'Manage Emojis'),
-            ('use_slash_commands', 'Use Slash Commands'),
-            ('request_to_speak', 'Request to Speak'),
-            ('manage_events', 'Manage Events'),
-            ('manage_threads', 'Manage Threads'),
-            ('create_public_threads', 'Create Public Threads'),
-            ('create_private_threads', 'Create Private Threads'),
-            ('external_stickers', 'Use External Stickers'),
-            ('send_messages_in_threads', 'Send Messages in Threads'),
-            ('use_embedded_activities', 'Use Activities'),
-            ('moderate_members', 'Timeout Members')
-        ]
-        
-        for perm_attr, perm_name in all_perms:
-            if hasattr(before.permissions, perm_attr) and hasattr(after.permissions, perm_attr):
-                before_val = getattr(before.permissions, perm_attr)
-                after_val = getattr(after.permissions, perm_attr)
-                
-                if before_val != after_val:
-                    if after_val:
-                        added_perms.append(perm_name)
-                    else:
-                        removed_perms.append(perm_name)
-        
+
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            perm_name = _ROLE_PERM_BIT_TO_NAME.get(bit.bit_length() - 1)
+            if perm_name is not None:
+                (added_perms if av & bit else removed_perms).append(perm_name)
+
         if added_perms:
             changes.append(f"➕ Přidána oprávnění: {', '.join(added_perms)}")
         if removed_perms:
             changes.append(f"➖ Odebrána oprávnění: {', '.join(removed_perms)}")
     
     if changes:
-        embed = discord.Embed(title="🎭 Role upravena", color=discord.Color.orange())
+        embed = discord.Embed(title="🎭 Role upravena", color=_ORANGE)
         embed.add_field(name="Role", value=after.mention, inline=True)
         embed.add_field(name="ID", value=str(after.id), inline=True)
         
-        # Rozdělíme změny na více fieldů pokud je jich hodně
+        # Greedy packing změn do 1024-znakových fieldů - místo field na
+        # každou položku (a tichého [:1024] ořezu) se položky lepí přes
+        # \n dokud se vejdou; méně fieldů pod Discord stropem 25
         changes_text = "\n".join(changes)
         if len(changes_text) > 1024:
-            # Rozdělíme na více fieldů
-            for i, change in enumerate(changes):
-                embed.add_field(name=f"Změna {i+1}", value=change[:1024], inline=False)
+            buf = []
+            cur = 0
+            part = 1
+            for change in changes:
+                if buf and cur + len(change) + 1 > 1024:
+                    embed.add_field(name=f"Změny {part}", value=_fit("\n".join(buf)), inline=False)
+                    part += 1
+                    buf = [change]
+                    cur = len(change)
+                else:
+                    buf.append(change)
+                    cur += len(change) + 1
+            if buf:
+                embed.add_field(name=f"Změny {part}", value=_fit("\n".join(buf)), inline=False)
         else:
             embed.add_field(name="Změny", value=changes_text, inline=False)
             
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await send_log(after.guild, embed)
 
 # Emoji events
 @bot.event
 async def on_guild_emojis_update(guild, before, after):
-    added_emojis = set(after) - set(before)
-    removed_emojis = set(before) - set(after)
+    # Sety postavit jen jednou, oba rozdíly jdou ze stejných materializací
+    before_set = set(before)
+    after_set = set(after)
+    added_emojis = after_set - before_set
+    removed_emojis = before_set - after_set
     
     for emoji in added_emojis:
-        embed = discord.Embed(title="😀 Emoji přidáno", color=discord.Color.green())
+        embed = discord.Embed(title="😀 Emoji přidáno", color=_GREEN)
         embed.add_field(name="Emoji", value=str(emoji), inline=True)
         embed.add_field(name="Název", value=emoji.name, inline=True)
         embed.add_field(name="ID", value=str(emoji.id), inline=True)
         embed.add_field(name="Animované", value="Ano" if emoji.animated else "Ne", inline=True)
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await send_log(guild, embed)
     
     for emoji in removed_emojis:
-        embed = discord.Embed(title="🗑️ Emoji odstraněno", color=discord.Color.red())
+        embed = discord.Embed(title="🗑️ Emoji odstraněno", color=_RED)
         embed.add_field(name="Název", value=emoji.name, inline=True)
         embed.add_field(name="ID", value=str(emoji.id), inline=True)
         embed.add_field(name="Animované", value="Ano" if emoji.animated else "Ne", inline=True)
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await send_log(guild, embed)
 
 # Reaction events
@@ -2163,76 +2674,100 @@ async def on_reaction_add(reaction, user):
     if user.bot or not reaction.message.guild:
         return
         
-    settings = await get_guild_settings(reaction.message.guild.id)
-    if not settings.get("log_reactions", False):
-        return
-    
-    if not reaction_rate_limiter.can_call(reaction.message.guild.id):
+    if not await should_log(reaction.message.guild.id, "reactions", reaction_rate_limiter, default=False):
         return
     
-    embed = discord.Embed(title="👍 Reakce přidána", color=discord.Color.green())
-    embed.add_field(name="Uživatel", value=user.mention, inline=True)
-    embed.add_field(name="Reakce", value=str(reaction.emoji), inline=True)
-    embed.add_field(name="Kanál", value=reaction.message.channel.mention, inline=True)
-    embed.add_field(name="Zpráva", value=f"[Přejít na zprávu]({reaction.message.jump_url})", inline=False)
-    
+    fields = [
+        {"name": "Uživatel", "value": user.mention, "inline": True},
+        {"name": "Reakce", "value": str(reaction.emoji), "inline": True},
+        {"name": "Kanál", "value": reaction.message.channel.mention, "inline": True},
+        {"name": "Zpráva", "value": f"[Přejít na zprávu]({reaction.message.jump_url})", "inline": False},
+    ]
     content = reaction.message.content[:100] + "..." if len(reaction.message.content) > 100 else reaction.message.content
     if content:
-        embed.add_field(name="Obsah zprávy", value=content, inline=False)
-    
-    embed.timestamp = datetime.now(timezone.utc)
-    await send_log(reaction.message.guild, embed)
+        fields.append({"name": "Obsah zprávy", "value": content, "inline": False})
+
+    await send_log(reaction.message.guild, _build_embed("👍 Reakce přidána", _GREEN, fields))
 
 @bot.event
 async def on_reaction_remove(reaction, user):
     if user.bot or not reaction.message.guild:
         return
-    
-    if not reaction_rate_limiter.can_call(reaction.message.guild.id):
+
+    # Stejný guard jako on_reaction_add - handler dřív běžel (a spaloval
+    # rate-limit tokeny) i na serverech s vypnutým logováním reakcí
+    if not await should_log(reaction.message.guild.id, "reactions", reaction_rate_limiter, default=False):
         return
     
-    embed = discord.Embed(title="👎 Reakce odstraněna", color=discord.Color.red())
-    embed.add_field(name="Uživatel", value=user.mention, inline=True)
-    embed.add_field(name="Reakce", value=str(reaction.emoji), inline=True)
-    embed.add_field(name="Kanál", value=reaction.message.channel.mention, inline=True)
-    embed.add_field(name="Zpráva", value=f"[Přejít na zprávu]({reaction.message.jump_url})", inline=False)
-    embed.timestamp = datetime.now(timezone.utc)
-    await send_log(reaction.message.guild, embed)
+    await send_log(reaction.message.guild, _build_embed("👎 Reakce odstraněna", _RED, [
+        {"name": "Uživatel", "value": user.mention, "inline": True},
+        {"name": "Reakce", "value": str(reaction.emoji), "inline": True},
+        {"name": "Kanál", "value": reaction.message.channel.mention, "inline": True},
+        {"name": "Zpráva", "value": f"[Přejít na zprávu]({reaction.message.jump_url})", "inline": False},
+    ]))
 
 # Voice events
 @bot.event
 async def on_voice_state_update(member, before, after):
     if member.bot:
         return
-        
-    if not voice_rate_limiter.can_call(member.guild.id):
-        return
-        
+
     guild = member.guild
     embed = None
-    
-    # Připojení
+
+    # Pořadí guardů od nejlevnějšího: klasifikace eventu jen z atributů
+    # (žádné stringy), pak cached settings flag, pak teprve rate limiter
+    # - token se spaluje jen za event, který by se opravdu logoval,
+    # a embed se staví až za všemi guardy
     if before.channel is None and after.channel is not None:
-        embed = discord.Embed(title="🔊 Připojen k voice", color=discord.Color.green())
-        embed.add_field(name="Uživatel", value=member.mention, inline=True)
-        embed.add_field(name="Kanál", value=after.channel.name, inline=True)
-    
-    # Odpojení 
+        kind = "join"
+        flag = "log_voice_join"
     elif before.channel is not None and after.channel is None:
-        embed = discord.Embed(title="🔇 Odpojen z voice", color=discord.Color.red())
-        embed.add_field(name="Uživatel", value=member.mention, inline=True)
-        embed.add_field(name="Kanál", value=before.channel.name, inline=True)
-    
-    # Přepnutí kanálu
+        kind = "leave"
+        flag = "log_voice_join"  # Odpojení sdílí toggle s připojením
     elif before.channel != after.channel:
-        embed = discord.Embed(title="🔄 Přepnut voice kanál", color=discord.Color.orange())
-        embed.add_field(name="Uživatel", value=member.mention, inline=True)
-        embed.add_field(name="Z kanálu", value=before.channel.name, inline=True)
-        embed.add_field(name="Do kanálu", value=after.channel.name, inline=True)
-    
-    # Mute/Unmute/Deafen změny
-    elif (before.mute != after.mute or before.deaf != after.deaf or 
+        kind = "move"
+        flag = "log_voice_move"
+    elif (before.mute != after.mute or before.deaf != after.deaf or
           before.self_mute != after.self_mute or before.self_deaf != after.self_deaf):
+        kind = "mute"
+        flag = "log_voice_mute"
+    else:
+        return
+
+    # Na cache miss se nastavení awaitne (stejně jako should_log) -
+    # rozhoduje skutečná hodnota flagu, ne default sloupce
+    settings = get_guild_settings_cached(guild.id) or await get_guild_settings(guild.id)
+    if not settings.get(flag, _DEFAULT_SETTINGS[flag]):
+        return
+
+    if not voice_rate_limiter.can_call(guild.id):
+        return
+
+    # Připojení
+    if kind == "join":
+        embed = _build_embed("🔊 Připojen k voice", _GREEN, [
+            {"name": "Uživatel", "value": member.mention, "inline": True},
+            {"name": "Kanál", "value": after.channel.name, "inline": True},
+        ])
+
+    # Odpojení
+    elif kind == "leave":
+        embed = _build_embed("🔇 Odpojen z voice", _RED, [
+            {"name": "Uživatel", "value": member.mention, "inline": True},
+            {"name": "Kanál", "value": before.channel.name, "inline": True},
+        ])
+
+    # Přepnutí kanálu
+    elif kind == "move":
+        embed = _build_embed("🔄 Přepnut voice kanál", _ORANGE, [
+            {"name": "Uživatel", "value": member.mention, "inline": True},
+            {"name": "Z kanálu", "value": before.channel.name, "inline": True},
+            {"name": "Do kanálu", "value": after.channel.name, "inline": True},
+        ])
+
+    # Mute/Unmute/Deafen změny
+    else:
         changes = []
         if before.mute != after.mute:
             changes.append(f"Server mute: {'Ano' if after.mute else 'Ne'}")
@@ -2242,42 +2777,51 @@ async def on_voice_state_update(member, before, after):
             changes.append(f"Self mute: {'Ano' if after.self_mute else 'Ne'}")
         if before.self_deaf != after.self_deaf:
             changes.append(f"Self deaf: {'Ano' if after.self_deaf else 'Ne'}")
-        
+
         if changes:
-            embed = discord.Embed(title="🎤 Voice stav změněn", color=discord.Color.orange())
-            embed.add_field(name="Uživatel", value=member.mention, inline=True)
-            embed.add_field(name="Kanál", value=after.channel.name if after.channel else "Žádný", inline=True)
-            embed.add_field(name="Změny", value="\n".join(changes), inline=False)
-    
+            embed = _build_embed("🎤 Voice stav změněn", _ORANGE, [
+                {"name": "Uživatel", "value": member.mention, "inline": True},
+                {"name": "Kanál", "value": after.channel.name if after.channel else "Žádný", "inline": True},
+                {"name": "Změny", "value": "\n".join(changes), "inline": False},
+            ])
+
     if embed:
-        embed.timestamp = datetime.now(timezone.utc)
-        await send_log(guild, embed)
+        # Debounce per člen: nový event v okně zruší čekající log, takže
+        # z reconnect smyčky nebo rychlého přeskakování kanálů odejde
+        # jediný embed s posledním stavem
+        async def _send_debounced(e=embed):
+            await asyncio.sleep(_VOICE_DEBOUNCE_WINDOW)
+            await send_log(guild, e)
+
+        schedule_voice_debounce(guild.id, (guild.id, member.id), _send_debounced())
 
 # Thread events
 @bot.event
 async def on_thread_create(thread):
     if not thread_rate_limiter.can_call(thread.guild.id):
         return
-    embed = discord.Embed(title="🧵 Thread vytvořen", color=discord.Color.green())
+    embed = discord.Embed(title="🧵 Thread vytvořen", color=_GREEN)
     embed.add_field(name="Thread", value=thread.mention, inline=True)
     embed.add_field(name="Název", value=thread.name, inline=True)
     embed.add_field(name="ID", value=str(thread.id), inline=True)
     embed.add_field(name="Rodičovský kanál", value=thread.parent.mention if thread.parent else "Neznámý", inline=True)
     embed.add_field(name="Typ", value=str(thread.type), inline=True)
-    if hasattr(thread, 'owner') and thread.owner:
-        embed.add_field(name="Vytvořil", value=thread.owner.mention, inline=True)
-    embed.timestamp = datetime.now(timezone.utc)
+    # getattr s defaultem místo hasattr - bez try/except AttributeError cesty
+    owner = getattr(thread, 'owner', None)
+    if owner is not None:
+        embed.add_field(name="Vytvořil", value=owner.mention, inline=True)
+    embed.timestamp = now_utc()
     await send_log(thread.guild, embed)
 
 @bot.event
 async def on_thread_delete(thread):
     if not thread_rate_limiter.can_call(thread.guild.id):
         return
-    embed = discord.Embed(title="🗑️ Thread smazán", color=discord.Color.red())
+    embed = discord.Embed(title="🗑️ Thread smazán", color=_RED)
     embed.add_field(name="Název", value=thread.name, inline=True)
     embed.add_field(name="ID", value=str(thread.id), inline=True)
     embed.add_field(name="Rodičovský kanál", value=thread.parent.mention if thread.parent else "Neznámý", inline=True)
-    embed.timestamp = datetime.now(timezone.utc)
+    embed.timestamp = now_utc()
     await send_log(thread.guild, embed)
 
 @bot.event
@@ -2293,11 +2837,11 @@ async def on_thread_update(before, after):
         changes.append(f"Zamčen: {'Ano' if after.locked else 'Ne'}")
     
     if changes:
-        embed = discord.Embed(title="🧵 Thread upraven", color=discord.Color.orange())
+        embed = discord.Embed(title="🧵 Thread upraven", color=_ORANGE)
         embed.add_field(name="Thread", value=after.mention, inline=True)
         embed.add_field(name="ID", value=str(after.id), inline=True)
         embed.add_field(name="Změny", value="\n".join(changes), inline=False)
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         await send_log(after.guild, embed)
 
 # Member nickname changes
@@ -2309,18 +2853,20 @@ async def on_user_update(before, after):
         changes.append(f"Username: {before.name} → {after.name}")
     if before.discriminator != after.discriminator:
         changes.append(f"Discriminator: {before.discriminator} → {after.discriminator}")
-    if str(before.avatar) != str(after.avatar):
+    # Porovnání přes hash assetu - str() by skládal celou CDN URL
+    if (before.avatar.key if before.avatar else None) != (after.avatar.key if after.avatar else None):
         changes.append("Avatar změněn")
     
     if changes:
-        # Pošli log do všech serverů kde je uživatel
-        for guild in bot.guilds:
-            if guild.get_member(after.id):
-                embed = discord.Embed(title="👤 Profil změněn", color=discord.Color.blue())
+        # Pošli log jen do serverů, kde uživatel opravdu je (reverzní index)
+        for guild_id in _user_guilds.get(after.id, ()):
+            guild = bot.get_guild(guild_id)
+            if guild:
+                embed = discord.Embed(title="👤 Profil změněn", color=_BLUE)
                 embed.add_field(name="Uživatel", value=f"{after.mention}", inline=True)
                 embed.add_field(name="ID", value=str(after.id), inline=True)
                 embed.add_field(name="Změny", value="\n".join(changes), inline=False)
-                embed.timestamp = datetime.now(timezone.utc)
+                embed.timestamp = now_utc()
                 if after.avatar:
                     embed.set_thumbnail(url=after.avatar.url)
                 await send_log(guild, embed)
@@ -2335,20 +2881,29 @@ async def on_guild_update(before, after):
         old_desc = before.description or "Žádný"
         new_desc = after.description or "Žádný"
         changes.append(f"Popis: {old_desc} → {new_desc}")
-    if str(before.icon) != str(after.icon):
+    # Porovnání přes hash assetu - str() by skládal celou CDN URL
+    if (before.icon.key if before.icon else None) != (after.icon.key if after.icon else None):
         changes.append("Ikona změněna")
     if before.owner != after.owner:
         changes.append(f"Vlastník: {before.owner} → {after.owner}")
     
     if changes:
-        embed = discord.Embed(title="🏰 Server upraven", color=discord.Color.blue())
+        embed = discord.Embed(title="🏰 Server upraven", color=_BLUE)
         embed.add_field(name="Server", value=after.name, inline=True)
         embed.add_field(name="ID", value=str(after.id), inline=True)
         embed.add_field(name="Změny", value="\n".join(changes)[:1024], inline=False)
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = now_utc()
         if after.icon:
             embed.set_thumbnail(url=after.icon.url)
         await send_log(after, embed)
 
-keep_alive()
+# uvloop (libuv) místo default selector loopu - 2-4x propustnost na
+# socket-heavy workloadu; volitelné, na Windows/bez balíčku se tiše
+# zůstává u výchozího loopu
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 bot.run(os.environ['TOKEN'])
\ No newline at end of file